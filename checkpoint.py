@@ -0,0 +1,190 @@
+# checkpoint.py
+"""
+Checkpoints im Hintergrund schreiben, damit das Training nicht wartet.
+
+- state_dicts werden im Trainings-Thread nur auf die CPU kopiert (schnell)
+- torch.save läuft in einem eigenen Thread
+- Schreiben erst in eine .tmp-Datei, dann atomar umbenennen
+  (ein Abbruch mitten im Speichern hinterlässt nie eine kaputte Datei)
+- Es bleiben die letzten N Checkpoints + der beste nach Validierung erhalten
+"""
+import json
+import os
+import queue
+import random
+import shutil
+import threading
+import time
+import torch
+
+try:
+    import numpy as np
+except ImportError:  # NumPy ist optional
+    np = None
+
+BEST_NAME = "best.pt"
+BEST_INFO_NAME = "best.json"
+
+
+def snapshot_state(obj):
+    """Kopiert alle Tensoren (auch verschachtelt) auf die CPU."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: snapshot_state(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot_state(v) for v in obj)
+    return obj
+
+
+def capture_rng_state():
+    """Zustand aller Zufallsgeneratoren (Python, NumPy, Torch, CUDA)."""
+    np_state = None
+    if np is not None:
+        # nur einfache Typen, damit torch.load(weights_only=True) klappt
+        name, keys, pos, has_gauss, cached = np.random.get_state()
+        np_state = (name, keys.tolist(), pos, has_gauss, cached)
+    return {
+        "python": random.getstate(),
+        "torch": torch.get_rng_state(),
+        "numpy": np_state,
+        "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+    }
+
+
+def restore_rng_state(state):
+    """Gegenstück zu capture_rng_state()."""
+    random.setstate(state["python"])
+    torch.set_rng_state(state["torch"].cpu())
+    if np is not None and state.get("numpy") is not None:
+        name, keys, pos, has_gauss, cached = state["numpy"]
+        np.random.set_state((name, np.array(keys, dtype=np.uint32), pos, has_gauss, cached))
+    if torch.cuda.is_available() and state.get("cuda") is not None:
+        torch.cuda.set_rng_state_all([s.cpu() for s in state["cuda"]])
+
+
+def atomic_save(obj, path):
+    """torch.save in eine temporäre Datei + atomares Umbenennen."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        torch.save(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def atomic_copy(src, dst):
+    """Datei atomar an neuen Ort bringen (Hardlink wenn möglich, sonst Kopie)."""
+    tmp = dst + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+class CheckpointWriter:
+    """
+    Schreibt Checkpoints asynchron.
+
+    save() kopiert nur die Daten und kehrt sofort zurück; die Dauer dieser
+    Kopie (plus ggf. Warten auf einen noch laufenden Schreibvorgang) wird
+    als Stall-Zeit zurückgegeben und in `stall_seconds` aufsummiert.
+    """
+
+    def __init__(self, directory="checkpoints", keep_last=3,
+                 latest_file=None, model_file=None):
+        self.directory = directory
+        self.keep_last = max(1, keep_last)
+        self.latest_file = latest_file
+        self.model_file = model_file
+        self.stall_seconds = 0.0
+        self.best_metric = None
+        self._error = None
+
+        os.makedirs(directory, exist_ok=True)
+        info_path = os.path.join(directory, BEST_INFO_NAME)
+        if os.path.exists(info_path):
+            with open(info_path, "r", encoding="utf8") as f:
+                self.best_metric = json.load(f).get("metric")
+
+        # maxsize=1: höchstens ein Snapshot wartet -> begrenzter RAM-Bedarf
+        self._queue = queue.Queue(maxsize=1)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # ---------------------------------------------------------
+    # Öffentliche API
+    # ---------------------------------------------------------
+    def save(self, step, payload, metric=None):
+        """
+        payload: Dict für den vollen Checkpoint (muss "model" enthalten).
+        metric: Validierungs-Loss (kleiner = besser) oder None.
+        """
+        self._raise_if_failed()
+        t0 = time.time()
+
+        snap = snapshot_state(payload)
+        is_best = metric is not None and (
+            self.best_metric is None or metric < self.best_metric
+        )
+        if is_best:
+            self.best_metric = metric
+        self._queue.put((step, snap, metric, is_best))
+
+        stall = time.time() - t0
+        self.stall_seconds += stall
+        return stall
+
+    def close(self):
+        """Wartet, bis alle Checkpoints geschrieben sind."""
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_if_failed()
+
+    # ---------------------------------------------------------
+    # Hintergrund-Thread
+    # ---------------------------------------------------------
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self._write(*item)
+            except Exception as e:  # wird beim nächsten save() gemeldet
+                self._error = e
+
+    def _write(self, step, snap, metric, is_best):
+        path = os.path.join(self.directory, f"step_{step:08d}.pt")
+        atomic_save(snap, path)
+
+        if self.latest_file:
+            atomic_copy(path, self.latest_file)
+        if self.model_file:
+            atomic_save(snap["model"], self.model_file)
+
+        if is_best:
+            atomic_copy(path, os.path.join(self.directory, BEST_NAME))
+            info_tmp = os.path.join(self.directory, BEST_INFO_NAME + ".tmp")
+            with open(info_tmp, "w", encoding="utf8") as f:
+                json.dump({"step": step, "metric": metric}, f)
+            os.replace(info_tmp, os.path.join(self.directory, BEST_INFO_NAME))
+
+        self._rotate()
+
+    def _rotate(self):
+        """Nur die letzten keep_last step_*.pt behalten."""
+        files = sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith("step_") and name.endswith(".pt")
+        )
+        for name in files[: -self.keep_last]:
+            os.remove(os.path.join(self.directory, name))
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            err, self._error = self._error, None
+            raise RuntimeError(f"Checkpoint konnte nicht geschrieben werden: {err}") from err
@@ -1,4 +1,176 @@
 # context_manager.py
+import json
+import os
+import re
+import sys
+import time
+from array import array
+from collections import deque
+
+# Bausteine des Kontextpräfixes
+CONTEXT_HEAD = "Vorheriger Kontext:\nBenutzer: "
+CONTEXT_MID = "\nKI: "
+CONTEXT_TAIL = "\n\nNeue Frage:\n"
+
+# einfache Trigger-Wörter für Folgefragen (erweiterbar über FOLLOW_UP_CONFIG)
+FOLLOW_WORDS = [
+    "und was", "und wie", "und warum", "warum", "wieso",
+    "wie genau", "was bedeutet das", "und das", "und dann",
+    "nochmal", "erkläre das", "erklär das", "was heißt das",
+]
+FOLLOW_UP_CONFIG = "follow_up.json"
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def trie_regex(words):
+    """
+    Eine Regex für alle Wörter, als Trie aufgebaut: "warum|wieso|wie genau"
+    -> "w(?:arum|ie(?: genau|so))". Die Suche verzweigt Zeichen für Zeichen,
+    statt jedes Wort einzeln zu probieren – die Kosten hängen kaum noch von
+    der Anzahl der Wörter ab.
+    """
+    trie = {}
+    for word in words:
+        if not word:
+            continue
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True  # Wortende
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        return group + "?" if "" in node else group
+
+    return re.compile(build(trie)) if trie else None
+
+
+def content_words(text):
+    """Kleingeschriebene Wörter mit mind. 3 Buchstaben (für den Überlappungs-Score)."""
+    return frozenset(w for w in _WORD_RE.findall(text.lower()) if len(w) >= 3)
+
+
+class FollowUpDetector:
+    """
+    Entscheidet, ob ein Prompt eine Folgefrage ist:
+    - Trigger-Wort gefunden (eine vorkompilierte Trie-Regex)  -> 1.0
+    - sehr kurzer Prompt (<= short_prompt_words Wörter)       -> 1.0
+    - sonst: Anteil der Wörter, die schon im letzten Turn vorkamen
+    Ab `threshold` gilt der Prompt als Folgefrage. Mit threshold=None
+    (Standard) zählen nur Trigger-Wörter und kurze Prompts; die
+    Überlappung wird erst mit einem Schwellwert (z.B. in follow_up.json)
+    eingeschaltet.
+    """
+
+    def __init__(self, triggers=FOLLOW_WORDS, short_prompt_words=4, threshold=None):
+        self.triggers = sorted(set(t.lower() for t in triggers))
+        self.short_prompt_words = short_prompt_words
+        self.threshold = threshold
+        self._regex = trie_regex(self.triggers)
+
+    @classmethod
+    def from_config(cls, path=FOLLOW_UP_CONFIG):
+        """
+        JSON-Datei, z.B.:
+          {"triggers": ["und außerdem", "what about"], "replace_defaults": false,
+           "short_prompt_words": 4, "threshold": 0.5}
+        Fehlt die Datei, gelten die Standardwerte (ohne Überlappungs-Score).
+        """
+        if not path or not os.path.exists(path):
+            return cls()
+        with open(path, "r", encoding="utf8") as f:
+            cfg = json.load(f)
+        triggers = list(cfg.get("triggers", []))
+        if not cfg.get("replace_defaults", False):
+            triggers += FOLLOW_WORDS
+        return cls(
+            triggers=triggers,
+            short_prompt_words=cfg.get("short_prompt_words", 4),
+            threshold=cfg.get("threshold"),
+        )
+
+    def has_trigger(self, prompt):
+        return self._regex is not None and self._regex.search(prompt.lower()) is not None
+
+    def score(self, prompt, last_turn=None):
+        """Wahrscheinlichkeit (0..1), dass `prompt` an `last_turn` anschließt."""
+        if self.has_trigger(prompt):
+            return 1.0
+        if len(prompt.split()) <= self.short_prompt_words:
+            return 1.0
+        if last_turn is None:
+            return 0.0
+        words = content_words(prompt)
+        if not words:
+            return 0.0
+        return len(words & last_turn.words()) / len(words)
+
+    def is_follow_up(self, prompt, last_turn=None):
+        if self.threshold is None:
+            return self.score(prompt) >= 1.0  # nur Trigger / kurzer Prompt
+        return self.score(prompt, last_turn) >= self.threshold
+
+
+_default_detector = None
+
+
+def default_detector():
+    """Einmal aus FOLLOW_UP_CONFIG geladen, danach geteilt."""
+    global _default_detector
+    if _default_detector is None:
+        _default_detector = FollowUpDetector.from_config()
+    return _default_detector
+
+
+class Turn:
+    """
+    Ein Prompt/Antwort-Paar. __slots__ statt dict: bei tausenden Sitzungen
+    spart das pro Eintrag gut die Hälfte an Verwaltungsspeicher.
+    Token-Ids werden beim ersten Bedarf einmal berechnet und gemerkt.
+    """
+
+    __slots__ = ("prompt", "answer", "created", "_prompt_ids", "_answer_ids", "_words")
+
+    def __init__(self, prompt: str, answer: str, created: float = None):
+        self.prompt = prompt
+        self.answer = answer
+        self.created = time.time() if created is None else created
+        self._prompt_ids = None
+        self._answer_ids = None
+        self._words = None
+
+    def prompt_ids(self, tok):
+        if self._prompt_ids is None:
+            self._prompt_ids = array("I", tok.encode(self.prompt))
+        return self._prompt_ids
+
+    def answer_ids(self, tok):
+        if self._answer_ids is None:
+            self._answer_ids = array("I", tok.encode(self.answer))
+        return self._answer_ids
+
+    def words(self):
+        """Inhaltswörter von Prompt + Antwort (für den Folgefragen-Score)."""
+        if self._words is None:
+            self._words = content_words(self.prompt + " " + self.answer)
+        return self._words
+
+    def nbytes(self) -> int:
+        """Ungefährer Speicherbedarf inkl. Texte und gemerkter Token-Ids."""
+        total = sys.getsizeof(self) + sys.getsizeof(self.prompt) + sys.getsizeof(self.answer)
+        for ids in (self._prompt_ids, self._answer_ids):
+            if ids is not None:
+                total += sys.getsizeof(ids)
+        if self._words is not None:
+            total += sys.getsizeof(self._words) + sum(map(sys.getsizeof, self._words))
+        return total
+
 
 class ContextManager:
     """
@@ -6,11 +178,16 @@ class ContextManager:
     - Speichert letzte (Prompt, Antwort)-Paare.
     - Kann Folgefragen mit dem letzten Kontext anreichern.
     - Schreibt NICHTS auf die Festplatte und ändert kein Training.
+    Für viele Sitzungen gleichzeitig siehe session_store.py.
     """
 
-    def __init__(self, max_history: int = 10):
-        self.history = []  # Liste von {"prompt": ..., "answer": ...}
+    __slots__ = ("history", "max_history", "detector")
+
+    def __init__(self, max_history: int = 10, detector: FollowUpDetector = None):
+        # Ringpuffer: der älteste Eintrag fällt automatisch heraus
+        self.history = deque(maxlen=max_history)
         self.max_history = max_history
+        self.detector = detector or default_detector()
 
     def reset(self):
         """Kompletten Verlauf verwerfen (neuer Dialog)."""
@@ -20,9 +197,7 @@ class ContextManager:
         """Neues Prompt/Antwort-Paar speichern, falls aktiviert."""
         if not enabled:
             return
-        self.history.append({"prompt": prompt, "answer": answer})
-        if len(self.history) > self.max_history:
-            self.history = self.history[-self.max_history :]
+        self.history.append(Turn(prompt.strip(), answer.strip()))
 
     def apply(self, prompt: str, enabled: bool = True) -> str:
         """
@@ -33,41 +208,82 @@ class ContextManager:
         bekommen den vorherigen Dialog mit dazu.
         Neue, unabhängige Fragen sollen möglichst unverändert bleiben.
         """
+        return self.context_prefix(prompt, enabled=enabled) + prompt
+
+    def context_prefix(self, prompt: str, enabled: bool = True) -> str:
+        """Der Kontext, den apply() vor den Prompt setzen würde ("" = keiner)."""
         if not enabled or not self.history:
-            return prompt
+            return ""
 
+        # Heuristik: Trigger-Wörter, kurze Prompts oder (mit threshold)
+        # viele gemeinsame Wörter mit dem letzten Turn → Kontext davor
         last = self.history[-1]
-        last_prompt = last["prompt"].strip()
-        last_answer = last["answer"].strip()
-
-        # Heuristik: kurze/anschließende Fragen → Kontext davor
-        low = prompt.lower()
-        is_follow_up = False
-
-        # einfache Trigger-Wörter für Folgefragen
-        follow_words = [
-            "und was", "und wie", "und warum", "warum", "wieso",
-            "wie genau", "was bedeutet das", "und das", "und dann",
-            "nochmal", "erkläre das", "erklär das", "was heißt das",
-        ]
-        for w in follow_words:
-            if w in low:
-                is_follow_up = True
-                break
-
-        # sehr kurze Prompts ohne Thema → wahrscheinlich Anschlussfrage
-        if len(prompt.split()) <= 4:
-            is_follow_up = True
-
-        if not is_follow_up:
+        if not self.detector.is_follow_up(prompt, last):
             # unabhängiger Prompt → unverändert zurück
-            return prompt
+            return ""
 
         # Kontextpräfix bauen
-        context_prefix = (
-            "Vorheriger Kontext:\n"
-            f"Benutzer: {last_prompt}\n"
-            f"KI: {last_answer}\n\n"
-            "Neue Frage:\n"
-        )
-        return context_prefix + prompt
+        return CONTEXT_HEAD + last.prompt + CONTEXT_MID + last.answer + CONTEXT_TAIL
+
+    def encode(self, prompt: str, tok, enabled: bool = True):
+        """
+        Token-Ids von apply(prompt). Prompt und Antwort des letzten Turns
+        kommen aus dessen Cache statt jedes Mal neu encodiert zu werden
+        (stückweise encodiert – beim Zeichen-Tokenizer identisch).
+        """
+        if not self.context_prefix(prompt, enabled=enabled):
+            return tok.encode(prompt)
+        last = self.history[-1]
+        ids = tok.encode(CONTEXT_HEAD)
+        ids.extend(last.prompt_ids(tok))
+        ids.extend(tok.encode(CONTEXT_MID))
+        ids.extend(last.answer_ids(tok))
+        ids.extend(tok.encode(CONTEXT_TAIL))
+        ids.extend(tok.encode(prompt))
+        return ids
+
+
+def _benchmark():
+    """Trie-Regex vs. Einzelsuche bei wachsender Trigger-Liste."""
+    import random
+    import timeit
+
+    random.seed(0)
+    syllables = ["ab", "be", "da", "er", "ge", "ich", "ka", "lo", "mu", "ne", "or", "sch", "te", "ver", "zu"]
+
+    def fake_trigger():
+        n = random.randint(2, 4)
+        return "".join(random.choice(syllables) for _ in range(n)) + " " + random.choice(syllables)
+
+    prompts = [
+        "Erkläre mir bitte ausführlich, wie die Photosynthese in Pflanzen funktioniert.",
+        "Welche Planeten im Sonnensystem haben Monde und Ringe?",
+        "Schreibe einen kurzen Text über die Geschichte der Eisenbahn in Europa.",
+    ]
+    lows = [p.lower() for p in prompts]
+
+    print(f"{'Trigger':>8} | {'Trie-Regex (µs)':>16} | {'Einzelsuche (µs)':>16}")
+    print("-" * 47)
+    for n in (13, 100, 300, 1000, 3000):
+        triggers = FOLLOW_WORDS + [fake_trigger() for _ in range(n - len(FOLLOW_WORDS))]
+        detector = FollowUpDetector(triggers)
+
+        def regex_check():
+            for p in prompts:
+                detector.has_trigger(p)
+
+        def naive_check():
+            for low in lows:
+                for w in triggers:
+                    if w in low:
+                        break
+
+        runs = 200
+        t_regex = min(timeit.repeat(regex_check, number=runs, repeat=3)) / (runs * len(prompts))
+        t_naive = min(timeit.repeat(naive_check, number=runs, repeat=3)) / (runs * len(prompts))
+        print(f"{n:>8} | {t_regex * 1e6:>16.2f} | {t_naive * 1e6:>16.2f}")
+
+
+if __name__ == "__main__":
+    # python context_manager.py  -> Micro-Benchmark der Folgefragen-Erkennung
+    _benchmark()
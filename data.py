@@ -1,5 +1,12 @@
+import json
+import os
 import torch
 
+try:
+    import numpy as np
+except ImportError:  # nur für Token-Shards aus ingest.py nötig
+    np = None
+
 class TextDataset(torch.utils.data.Dataset):
     def __init__(self, encoded, block_size=128):
         self.data = encoded
@@ -11,4 +18,155 @@ class TextDataset(torch.utils.data.Dataset):
     def __getitem__(self, idx):
         x = self.data[idx:idx+self.block_size]
         y = self.data[idx+1:idx+self.block_size+1]
-        return torch.tensor(x), torch.tensor(y)
+        return torch.tensor(x, dtype=torch.long), torch.tensor(y, dtype=torch.long)
+
+
+def document_starts(encoded, sep_ids, chunk=1 << 22):
+    """
+    Anfangspositionen der Dokumente (Absätze) im Token-Strom: 0 und jede
+    Stelle direkt hinter einem Vorkommen von sep_ids (z.B. tok.encode("\\n\\n")).
+    """
+    sep = torch.as_tensor(sep_ids, dtype=torch.long)
+    n, k = len(encoded), len(sep)
+    if k == 0:
+        # ein leerer Trenner "passt" überall -> jedes Token wäre ein Dokument
+        raise ValueError("document_starts: sep_ids ist leer (Trenner-Tokens angeben).")
+    starts = [torch.zeros(1, dtype=torch.long)]
+    # Stücke überlappen um k-1 Tokens, damit kein Trenner verloren geht
+    for lo in range(0, max(0, n - k + 1), chunk):
+        part = torch.as_tensor(encoded[lo:min(n, lo + chunk + k - 1)], dtype=torch.long)
+        if len(part) < k:
+            break
+        hit = (part.unfold(0, k, 1) == sep).all(-1)
+        starts.append(torch.nonzero(hit).flatten() + lo + k)
+    starts = torch.unique(torch.cat(starts))
+    return starts[starts < n]
+
+
+class PackedDataset(torch.utils.data.Dataset):
+    """
+    Gepackte, dokument-ausgerichtete Blöcke: jeder Block beginnt am Anfang
+    eines Dokuments (oder bei langen Dokumenten alle block_size Tokens) und
+    wird mit den folgenden Dokumenten aufgefüllt – kein Padding.
+    Zu jedem Block gibt es Segment-Ids (0, 1, 2, … je Dokument), daraus baut
+    das Modell eine Block-Diagonal-Maske: kein Token sieht ein fremdes Dokument.
+    """
+
+    def __init__(self, encoded, starts, block_size=128):
+        self.data = encoded
+        self.block_size = block_size
+        self.starts = torch.as_tensor(starts, dtype=torch.long)
+
+        last = len(encoded) - block_size - 1
+        ends = torch.cat([self.starts[1:], torch.tensor([len(encoded)])])
+        offsets = [
+            torch.arange(s, e, block_size) for s, e in zip(self.starts.tolist(), ends.tolist())
+        ]
+        offsets = torch.cat(offsets) if offsets else torch.zeros(0, dtype=torch.long)
+        self.offsets = offsets[offsets <= last]
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, idx):
+        lo = int(self.offsets[idx])
+        x = torch.as_tensor(self.data[lo:lo + self.block_size], dtype=torch.long)
+        y = torch.as_tensor(self.data[lo + 1:lo + self.block_size + 1], dtype=torch.long)
+        doc = torch.searchsorted(self.starts, torch.arange(lo, lo + self.block_size), right=True)
+        return x, y, doc - doc[0]
+
+
+class ResumableSampler(torch.utils.data.Sampler):
+    """
+    Shuffle-Sampler, der an jeder Stelle fortgesetzt werden kann.
+
+    Die Reihenfolge einer Epoche hängt nur von (seed, epoch) ab;
+    start_index überspringt die schon trainierten Beispiele.
+    """
+
+    def __init__(self, data_len, seed=0):
+        self.data_len = data_len
+        self.seed = seed
+        self.epoch = 0
+        self.start_index = 0
+
+    def set_epoch(self, epoch, start_index=0):
+        self.epoch = epoch
+        self.start_index = start_index
+
+    def __iter__(self):
+        g = torch.Generator()
+        g.manual_seed(self.seed + self.epoch)
+        perm = torch.randperm(self.data_len, generator=g)
+        return iter(perm[self.start_index:].tolist())
+
+    def __len__(self):
+        return max(0, self.data_len - self.start_index)
+
+    def state_dict(self):
+        return {"seed": self.seed, "epoch": self.epoch, "start_index": self.start_index}
+
+    def load_state_dict(self, state):
+        self.seed = state["seed"]
+        self.set_epoch(state["epoch"], state["start_index"])
+
+
+class ShardedTokens:
+    """
+    Token-Shards aus ingest.py als ein langes, nur lesbares Array.
+
+    Die Shards werden per memmap geöffnet, es liegt also nie der ganze
+    Korpus im RAM. Unterstützt len() und Slices (auch über Shard-Grenzen),
+    damit TextDataset direkt darauf arbeiten kann.
+    """
+
+    def __init__(self, manifest_path, start=0, stop=None):
+        if np is None:
+            raise ImportError("Für Token-Shards bitte 'pip install numpy' ausführen.")
+        with open(manifest_path, "r", encoding="utf8") as f:
+            self.manifest = json.load(f)
+        self.manifest_path = manifest_path
+
+        base = os.path.dirname(os.path.abspath(manifest_path))
+        dtype = np.dtype(self.manifest["dtype"])
+        self._shards = [
+            np.memmap(os.path.join(base, s["file"]), dtype=dtype, mode="r")
+            for s in self.manifest["shards"] if s["tokens"] > 0
+        ]
+        self._ends = np.cumsum([len(s) for s in self._shards]).tolist()
+        total = self._ends[-1] if self._ends else 0
+
+        self.start = start
+        self.stop = total if stop is None else min(stop, total)
+
+    def subrange(self, start, stop):
+        """Teilbereich (relativ zu diesem Objekt) ohne Kopie."""
+        view = ShardedTokens.__new__(ShardedTokens)
+        view.__dict__.update(self.__dict__)
+        view.start = self.start + start
+        view.stop = min(self.start + stop, self.stop)
+        return view
+
+    def __len__(self):
+        return max(0, self.stop - self.start)
+
+    def __getitem__(self, idx):
+        if not isinstance(idx, slice):
+            raise TypeError("ShardedTokens unterstützt nur Slices.")
+        lo, hi, step = idx.indices(len(self))
+        if step != 1:
+            raise ValueError("ShardedTokens unterstützt keine Schrittweite.")
+        lo += self.start
+        hi += self.start
+
+        parts = []
+        shard_start = 0
+        for shard, end in zip(self._shards, self._ends):
+            if lo < end and hi > shard_start:
+                parts.append(shard[max(lo, shard_start) - shard_start: min(hi, end) - shard_start])
+            shard_start = end
+            if shard_start >= hi:
+                break
+        if len(parts) == 1:
+            return np.asarray(parts[0])
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
@@ -0,0 +1,286 @@
+# distill.py
+"""
+Knowledge Distillation: ein kleineres, schnelleres MiniGPT (Student)
+lernt von einem fertig trainierten Modell (Teacher).
+
+- Teacher = minigpt_grundwissen.pt (wird nur EINMAL über den Korpus gerechnet)
+- Teacher-Logits werden als Top-k (sparse) auf der Platte gecacht
+- Student: standardmäßig halb so viele Layer wie der Teacher
+- Verlust: KL(Teacher || Student) auf den Top-k + normale Cross-Entropy
+- Am Ende: Perplexity Teacher vs. Student auf einem Held-out-Teil
+"""
+import hashlib
+import os
+import time
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader
+
+from tokenizer import BPETokenizer
+from model import MiniGPT, config_from_state_dict
+from evaluate import evaluate_perplexity
+
+# ---------------------------
+# EINSTELLUNGEN
+# ---------------------------
+TEXT_FILE = "grundwissen.txt"
+TOKENIZER_FILE = "tokenizer.json"
+CHECKPOINT_FILE = "checkpoint.pt"
+TEACHER_FILE = "minigpt_grundwissen.pt"
+STUDENT_FILE = "minigpt_student.pt"
+TEACHER_CACHE_FILE = "teacher_topk.pt"
+
+STUDENT_LAYERS = None      # None -> Hälfte der Teacher-Layer
+TOP_K = 16                 # so viele Teacher-Logits pro Position werden gecacht
+DISTILL_TEMPERATURE = 2.0  # weicht die Teacher-Verteilung auf
+ALPHA = 0.7                # Anteil KL-Verlust, Rest = Cross-Entropy auf echten Daten
+
+EPOCHS = 10
+BATCH_SIZE = 32
+MAX_BATCHES_PER_EPOCH = 250
+LR = 3e-4
+
+VAL_FRACTION = 0.05        # letzter Teil des Textes = Held-out
+MAX_PPL_INCREASE = 0.10    # Student darf max. 10 % schlechtere Perplexity haben
+
+
+# ---------------------------
+# HILFSFUNKTIONEN
+# ---------------------------
+def file_hash(path):
+    """SHA-256 einer Datei (für die Gültigkeit des Teacher-Caches)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def aligned_windows(encoded, block_size):
+    """
+    Teilt die Tokens in feste, nicht überlappende Fenster.
+    Gibt (x, y) als LongTensor der Form (n_windows, block_size) zurück.
+    """
+    data = torch.tensor(encoded, dtype=torch.long)
+    n_windows = (len(data) - 1) // block_size
+    used = n_windows * block_size
+    x = data[:used].view(n_windows, block_size)
+    y = data[1:used + 1].view(n_windows, block_size)
+    return x, y
+
+
+@torch.no_grad()
+def build_teacher_cache(teacher, x_windows, top_k, device, batch_size=64):
+    """
+    Lässt den Teacher einmal über alle Fenster laufen und behält pro Position
+    nur die Top-k Logits (Werte als float16, Indizes als int16/int32).
+    """
+    teacher.eval()
+    vocab_size = teacher.embed.num_embeddings  # fc ist beim Adaptive-Kopf None
+    k = min(top_k, vocab_size)
+    id_dtype = torch.int16 if vocab_size <= 32767 else torch.int32
+
+    n_windows, block_size = x_windows.shape
+    top_ids = torch.empty((n_windows, block_size, k), dtype=id_dtype)
+    top_vals = torch.empty((n_windows, block_size, k), dtype=torch.float16)
+
+    for start in range(0, n_windows, batch_size):
+        xb = x_windows[start:start + batch_size].to(device)
+        logits = teacher(xb)
+        vals, ids = torch.topk(logits, k=k, dim=-1)
+        top_ids[start:start + len(xb)] = ids.to("cpu", id_dtype)
+        top_vals[start:start + len(xb)] = vals.to("cpu", torch.float16)
+
+    return top_ids, top_vals
+
+
+def load_or_build_cache(teacher, teacher_hash, x_windows, top_k, device):
+    """Teacher-Cache laden, falls er zu Teacher + Daten passt, sonst neu bauen."""
+    n_windows, block_size = x_windows.shape
+    meta = {
+        "teacher_hash": teacher_hash,
+        "n_windows": n_windows,
+        "block_size": block_size,
+        "top_k": top_k,
+    }
+
+    if os.path.exists(TEACHER_CACHE_FILE):
+        cache = torch.load(TEACHER_CACHE_FILE, map_location="cpu")
+        if cache.get("meta") == meta:
+            print("Teacher-Cache geladen.", flush=True)
+            return cache["ids"], cache["vals"]
+        print("Teacher-Cache veraltet – wird neu gebaut.", flush=True)
+
+    t0 = time.time()
+    ids, vals = build_teacher_cache(teacher, x_windows, top_k, device)
+    torch.save({"meta": meta, "ids": ids, "vals": vals}, TEACHER_CACHE_FILE)
+    print(f"Teacher-Cache gebaut ({time.time() - t0:.1f}s).", flush=True)
+    return ids, vals
+
+
+class DistillDataset(torch.utils.data.Dataset):
+    """Liefert (x, y, teacher_ids, teacher_vals) pro festem Fenster."""
+
+    def __init__(self, x_windows, y_windows, top_ids, top_vals):
+        self.x = x_windows
+        self.y = y_windows
+        self.ids = top_ids
+        self.vals = top_vals
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, idx):
+        return self.x[idx], self.y[idx], self.ids[idx].long(), self.vals[idx].float()
+
+
+def distill_loss(student_logits, y, top_ids, top_vals, temperature=2.0, alpha=0.7):
+    """
+    Sparse KL-Divergenz zum Teacher + Cross-Entropy zu den echten Tokens.
+    Die Teacher-Verteilung wird auf den Top-k renormalisiert.
+    """
+    t = temperature
+    vocab = student_logits.size(-1)
+
+    teacher_logp = F.log_softmax(top_vals / t, dim=-1)             # (B, T, k)
+    student_logp = F.log_softmax(student_logits / t, dim=-1)       # (B, T, V)
+    student_logp_k = student_logp.gather(-1, top_ids)              # (B, T, k)
+
+    kl = (teacher_logp.exp() * (teacher_logp - student_logp_k)).sum(-1).mean()
+    ce = F.cross_entropy(student_logits.view(-1, vocab), y.view(-1))
+
+    # t² gleicht die kleineren Gradienten bei hoher Temperatur aus
+    return alpha * kl * (t * t) + (1.0 - alpha) * ce, ce
+
+
+def init_student_from_teacher(student, teacher):
+    """
+    Startpunkt für den Student: Embeddings, Ausgabeschicht (fc oder
+    Adaptive-Kopf samt Token-Reihenfolge) und jeden zweiten Teacher-Layer
+    übernehmen (konvergiert deutlich schneller).
+    """
+    student.embed.load_state_dict(teacher.embed.state_dict())
+    student.pos.load_state_dict(teacher.pos.state_dict())
+    if teacher.adaptive is None:
+        student.fc.load_state_dict(teacher.fc.state_dict())
+    else:
+        student.adaptive.load_state_dict(teacher.adaptive.state_dict())
+        student.vocab_rank.copy_(teacher.vocab_rank)
+
+    n_t = len(teacher.transformer.layers)
+    n_s = len(student.transformer.layers)
+    step = n_t / n_s
+    for i, layer in enumerate(student.transformer.layers):
+        src = teacher.transformer.layers[min(n_t - 1, int(i * step))]
+        layer.load_state_dict(src.state_dict())
+
+
+# ---------------------------
+# HAUPTPROGRAMM
+# ---------------------------
+def main():
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print("Verwendetes Device:", device, flush=True)
+
+    with open(TEXT_FILE, "r", encoding="utf8") as f:
+        text = f.read()
+    tok = BPETokenizer.load(TOKENIZER_FILE)
+    encoded = tok.encode(text)
+
+    # Teacher laden (Architektur direkt aus den Gewichten)
+    teacher_state = torch.load(TEACHER_FILE, map_location=device)
+    teacher_cfg = config_from_state_dict(teacher_state)
+    if teacher_cfg["vocab_size"] != len(tok.vocab):
+        raise ValueError(
+            f"Tokenizer ({len(tok.vocab)}) passt nicht zum Teacher "
+            f"({teacher_cfg['vocab_size']})."
+        )
+    teacher = MiniGPT(**teacher_cfg).to(device)
+    teacher.load_state_dict(teacher_state)
+    teacher.eval()
+
+    block_size = teacher_cfg["max_len"]
+    try:
+        ckpt = torch.load(CHECKPOINT_FILE, map_location="cpu")
+        block_size = min(block_size, int(ckpt.get("block_size", block_size)))
+    except Exception as e:
+        print("Warnung: Konnte block_size nicht aus checkpoint lesen:", e)
+
+    # Train / Held-out trennen
+    n_val = max(block_size + 1, int(len(encoded) * VAL_FRACTION))
+    train_x, train_y = aligned_windows(encoded[:-n_val], block_size)
+    val_encoded = encoded[-n_val:]
+    print(f"Fenster: train={len(train_x)} | val-Tokens={len(val_encoded)}", flush=True)
+
+    top_ids, top_vals = load_or_build_cache(
+        teacher, file_hash(TEACHER_FILE), train_x, TOP_K, device
+    )
+
+    # Student bauen
+    student_cfg = dict(teacher_cfg)
+    student_cfg["layers"] = STUDENT_LAYERS or max(1, teacher_cfg["layers"] // 2)
+    student = MiniGPT(**student_cfg).to(device)
+    init_student_from_teacher(student, teacher)
+    print(
+        f"Teacher-Layer: {teacher_cfg['layers']} -> Student-Layer: {student_cfg['layers']}",
+        flush=True,
+    )
+
+    loader = DataLoader(
+        DistillDataset(train_x, train_y, top_ids, top_vals),
+        batch_size=BATCH_SIZE,
+        shuffle=True,
+        num_workers=0,  # Windows-safe
+    )
+    opt = torch.optim.AdamW(student.parameters(), lr=LR)
+
+    for epoch in range(EPOCHS):
+        student.train()
+        epoch_start = time.time()
+        total_loss = 0.0
+        total_ce = 0.0
+        n = 0
+        for i, (x, y, ids, vals) in enumerate(loader):
+            if i >= MAX_BATCHES_PER_EPOCH:
+                break
+            x, y = x.to(device), y.to(device)
+            ids, vals = ids.to(device), vals.to(device)
+
+            loss, ce = distill_loss(
+                student(x), y, ids, vals,
+                temperature=DISTILL_TEMPERATURE, alpha=ALPHA,
+            )
+            opt.zero_grad()
+            loss.backward()
+            opt.step()
+
+            total_loss += loss.item()
+            total_ce += ce.item()
+            n += 1
+
+        print(
+            f"✅ Epoch {epoch} | loss={total_loss / max(1, n):.4f} | "
+            f"ce={total_ce / max(1, n):.4f} | Zeit: {time.time() - epoch_start:.1f}s",
+            flush=True,
+        )
+
+    # Qualität vergleichen
+    ppl_teacher = evaluate_perplexity(teacher, val_encoded, block_size, device=device)["ppl"]
+    ppl_student = evaluate_perplexity(student, val_encoded, block_size, device=device)["ppl"]
+    limit = ppl_teacher * (1.0 + MAX_PPL_INCREASE)
+    print(
+        f"Perplexity Teacher={ppl_teacher:.3f} | Student={ppl_student:.3f} | "
+        f"Grenze={limit:.3f}",
+        flush=True,
+    )
+    if ppl_student <= limit:
+        print("🎯 Student liegt innerhalb der erlaubten Marge.", flush=True)
+    else:
+        print("⚠️ Student liegt außerhalb der Marge – mehr Epochen nötig.", flush=True)
+
+    torch.save(student.state_dict(), STUDENT_FILE)
+    print("Student gespeichert als", STUDENT_FILE, flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# evaluate.py
+"""
+Evaluation: Perplexity + Tokens/Sekunde auf einem Held-out-Text.
+
+- Gleitende Fenster (block_size) mit Schrittweite (stride)
+- Jedes Token wird genau EINMAL bewertet, mit möglichst viel Kontext davor
+- Es liegt immer nur ein Batch im Speicher
+- Funktioniert mit normalen, distillierten und quantisierten Modellen
+"""
+import argparse
+import math
+import time
+import warnings
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from model import MiniGPT, config_from_state_dict
+
+
+def _windows(n_tokens, block_size, stride):
+    """
+    Erzeugt (start, länge, n_bewertet) für alle Fenster.
+    Bewertet werden jeweils nur die letzten n_bewertet Ziele eines Fensters,
+    die vorher noch von keinem Fenster abgedeckt waren.
+    """
+    n_targets = n_tokens - 1
+    prev_end = 0
+    start = 0
+    while prev_end < n_targets:
+        end = min(start + block_size, n_targets)
+        yield start, end - start, end - prev_end
+        prev_end = end
+        start += stride
+
+
+@torch.inference_mode()
+def evaluate_perplexity(model, encoded, block_size, stride=None, batch_size=16,
+                        device="cpu", max_tokens=None):
+    """
+    Streamt `encoded` in Batches gleitender Fenster durch das Modell.
+
+    stride=None -> Fenster überlappen nicht (schnellste Variante).
+    Kleinerer stride -> mehr Kontext pro Token, dafür langsamer.
+
+    Gibt ein Dict mit loss, ppl, tokens, seconds und tokens_per_sec zurück.
+
+    Nur bei causal=True aussagekräftig: ohne kausale Maske sieht jede
+    Position ihr eigenes Ziel, die Perplexity liegt dann bei ~1.
+    """
+    if not getattr(model, "causal", True):
+        warnings.warn(
+            "Modell ist nicht causal – jede Position sieht ihr Ziel, die Perplexity "
+            "ist bedeutungslos (~1). Neu trainieren mit causal = 1.",
+            stacklevel=2,
+        )
+    stride = stride or block_size
+    if not 0 < stride <= block_size:
+        raise ValueError("stride muss zwischen 1 und block_size liegen.")
+
+    data = torch.as_tensor(encoded, dtype=torch.long)
+    if max_tokens is not None:
+        data = data[: max_tokens + 1]
+
+    was_training = model.training
+    model.eval()
+
+    total_nll = 0.0
+    total_tokens = 0
+    t0 = time.time()
+
+    def run(batch):
+        nonlocal total_nll, total_tokens
+        length = batch[0][1]
+        x = torch.stack([data[s:s + length] for s, _, _ in batch]).to(device)
+        y = torch.stack([data[s + 1:s + length + 1] for s, _, _ in batch]).clone()
+        # schon bewertete Positionen ausblenden
+        for row, (_, _, n_scored) in enumerate(batch):
+            y[row, : length - n_scored] = -100
+        y = y.to(device)
+
+        logits = model(x)
+        total_nll += F.cross_entropy(
+            logits.reshape(-1, logits.size(-1)).float(),
+            y.reshape(-1),
+            ignore_index=-100,
+            reduction="sum",
+        ).item()
+        total_tokens += int((y != -100).sum())
+
+    batch = []
+    for win in _windows(len(data), block_size, stride):
+        # nur gleich lange Fenster landen zusammen in einem Batch
+        if batch and (len(batch) >= batch_size or batch[0][1] != win[1]):
+            run(batch)
+            batch = []
+        batch.append(win)
+    if batch:
+        run(batch)
+
+    if was_training:
+        model.train()
+
+    seconds = time.time() - t0
+    loss = total_nll / max(1, total_tokens)
+    return {
+        "loss": loss,
+        "ppl": math.exp(loss),
+        "tokens": total_tokens,
+        "seconds": seconds,
+        "tokens_per_sec": total_tokens / max(seconds, 1e-9),
+    }
+
+
+def load_model_for_eval(path, device="cpu", heads=4):
+    """
+    Lädt ein Modell für die Evaluation.
+
+    Unterstützt:
+    - reine state_dicts (minigpt_grundwissen.pt, Student aus distill.py)
+    - Trainings-Checkpoints mit "model"-Eintrag
+    - komplett gespeicherte Module (z.B. quantisierte Modelle)
+    """
+    obj = torch.load(path, map_location=device, weights_only=False)
+
+    if isinstance(obj, nn.Module):
+        model = obj
+    else:
+        state_dict = obj["model"] if "model" in obj else obj
+        model = MiniGPT(**config_from_state_dict(state_dict, heads=heads))
+        model.load_state_dict(state_dict)
+
+    model.to(device)
+    model.eval()
+    return model
+
+
+def main():
+    from tokenizer import BPETokenizer
+
+    parser = argparse.ArgumentParser(description="Perplexity auf Held-out-Text messen")
+    parser.add_argument("--model", default="minigpt_grundwissen.pt")
+    parser.add_argument("--tokenizer", default="tokenizer.json")
+    parser.add_argument("--text", default="grundwissen.txt")
+    parser.add_argument("--val-fraction", type=float, default=0.05,
+                        help="Anteil am Textende, der bewertet wird (1.0 = alles)")
+    parser.add_argument("--block-size", type=int, default=None,
+                        help="Standard: max_len des Modells")
+    parser.add_argument("--stride", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--max-tokens", type=int, default=None)
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = load_model_for_eval(args.model, device=device)
+    tok = BPETokenizer.load(args.tokenizer)
+
+    with open(args.text, "r", encoding="utf8") as f:
+        text = f.read()
+    encoded = tok.encode(text)
+    n_val = max(2, int(len(encoded) * args.val_fraction))
+    val_encoded = encoded[-n_val:]
+
+    block_size = args.block_size
+    if block_size is None:
+        block_size = model.pos.num_embeddings if hasattr(model, "pos") else 64
+
+    result = evaluate_perplexity(
+        model, val_encoded, block_size,
+        stride=args.stride, batch_size=args.batch_size,
+        device=device, max_tokens=args.max_tokens,
+    )
+    print(
+        f"Modell: {args.model} | Tokens: {result['tokens']} | "
+        f"loss={result['loss']:.4f} | ppl={result['ppl']:.3f} | "
+        f"{result['tokens_per_sec']:.0f} Tokens/s",
+        flush=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+# generation.py
+"""
+Gemeinsames Sampling für beide GUIs.
+
+Alle Kandidaten werden in EINEM Batch erzeugt (eine Zeile = ein Kandidat).
+Wiederholungs-Strafen, n-Gramm-Sperre, Top-k und Top-p laufen als
+Tensor-Operationen über den ganzen Batch – Endlosschleifen wie
+"aaaaaa" oder "und und und" werden schon beim Erzeugen verhindert,
+statt erst hinterher beim Scoring aussortiert zu werden.
+
+Zusätzlich: Best-of-N und Beam-Suche, beide mit den kumulierten
+Log-Wahrscheinlichkeiten des Modells pro Kandidat (fürs Reranking).
+"""
+import argparse
+
+import torch
+import torch.nn.functional as F
+
+from tokenizer import IncrementalDetokenizer
+
+# Neutrale Voreinstellungen: ohne weitere Angaben ist generate() reines
+# Top-k-Sampling. Strafen, n-Gramm-Sperre und Top-p schalten die Aufrufer
+# selbst ein (die GUIs über ihre Konstante SAMPLING).
+DEFAULT_SAMPLING = {
+    "top_k": 30,
+    "top_p": None,
+    "repetition_penalty": 1.0,
+    "frequency_penalty": 0.0,
+    "presence_penalty": 0.0,
+    "no_repeat_ngram": 0,
+}
+
+
+# ---------------------------
+# Logit-Regeln (alle batchweise)
+# ---------------------------
+def apply_penalties(logits, counts, repetition_penalty=1.0,
+                    frequency_penalty=0.0, presence_penalty=0.0):
+    """
+    counts: (B, V) wie oft jedes Token pro Zeile schon vorkam (Prompt-Fenster
+    und bisher erzeugte Tokens).
+    - repetition_penalty: schon gesehene Tokens unwahrscheinlicher (Faktor)
+    - frequency_penalty:  Abzug proportional zur Häufigkeit
+    - presence_penalty:   fester Abzug, sobald ein Token vorkam
+    """
+    if counts is None:
+        return logits
+    seen = counts > 0
+    if repetition_penalty != 1.0:
+        penalized = torch.where(
+            logits > 0, logits / repetition_penalty, logits * repetition_penalty
+        )
+        logits = torch.where(seen, penalized, logits)
+    if frequency_penalty or presence_penalty:
+        logits = logits - frequency_penalty * counts - presence_penalty * seen.to(logits.dtype)
+    return logits
+
+
+def no_repeat_ngram_mask(seq, n, vocab_size):
+    """
+    (B, V)-Maske der Tokens, die ein schon vorhandenes n-Gramm wiederholen
+    würden: Endet eine Zeile auf die ersten n-1 Tokens eines früheren
+    n-Gramms, wird dessen letztes Token gesperrt.
+    """
+    B, L = seq.shape
+    if n <= 0 or L < n:
+        return torch.zeros(B, vocab_size, dtype=torch.bool, device=seq.device)
+
+    grams = seq.unfold(1, n, 1)                # (B, L-n+1, n)
+    current = seq[:, L - n + 1:]               # (B, n-1)
+    hit = (grams[:, :, :-1] == current.unsqueeze(1)).all(-1)
+
+    hits = torch.zeros(B, vocab_size, device=seq.device)
+    hits.scatter_add_(1, grams[:, :, -1], hit.to(hits.dtype))
+    return hits > 0
+
+
+def top_p_filter(logits, top_p):
+    """Nucleus-Sampling: nur die kleinste Tokenmenge mit Wahrscheinlichkeit >= top_p."""
+    sorted_logits, sorted_idx = torch.sort(logits, descending=True, dim=-1)
+    probs = F.softmax(sorted_logits, dim=-1)
+    # Token entfernen, wenn die Masse davor schon top_p erreicht (das beste bleibt immer)
+    remove = (probs.cumsum(dim=-1) - probs) > top_p
+    sorted_logits = sorted_logits.masked_fill(remove, float("-inf"))
+    return logits.scatter(-1, sorted_idx, sorted_logits)
+
+
+def adjust_logits(logits, counts=None, repetition_penalty=1.0, frequency_penalty=0.0,
+                  presence_penalty=0.0, banned=None):
+    """Strafen + Sperren (banned: optionale (B, V)-Maske gesperrter Tokens)."""
+    logits = apply_penalties(
+        logits, counts, repetition_penalty, frequency_penalty, presence_penalty
+    )
+    if banned is not None:
+        # nie eine ganze Zeile sperren (sonst gäbe es nichts mehr zu ziehen)
+        banned = banned & ~banned.all(dim=-1, keepdim=True)
+        logits = logits.masked_fill(banned, float("-inf"))
+    return logits
+
+
+def sample_from_logits(logits, temperature=0.4, top_k=30, top_p=None):
+    """Temperatur, Top-k, Top-p und Ziehen: (B, V) -> (B, 1)."""
+    logits = logits / max(temperature, 1e-6)
+
+    if top_k is not None and 0 < top_k < logits.size(-1):
+        kth = torch.topk(logits, k=top_k, dim=-1).values[:, -1:]
+        logits = logits.masked_fill(logits < kth, float("-inf"))
+
+    if top_p is not None and 0.0 < top_p < 1.0:
+        logits = top_p_filter(logits, top_p)
+
+    probs = F.softmax(logits, dim=-1)
+    return torch.multinomial(probs, num_samples=1)
+
+
+def sample_next_id(logits, temperature=0.4, top_k=30, top_p=None, counts=None,
+                   repetition_penalty=1.0, frequency_penalty=0.0,
+                   presence_penalty=0.0, banned=None):
+    """
+    logits: (B, V) -> nächste Token-Ids (B, 1).
+    banned: optionale (B, V)-Maske gesperrter Tokens.
+    """
+    logits = adjust_logits(
+        logits, counts, repetition_penalty, frequency_penalty, presence_penalty, banned
+    )
+    return sample_from_logits(logits, temperature, top_k, top_p)
+
+
+def prompt_tokens(tok, prompt, block_size):
+    """Die letzten block_size Token-Ids eines Textes oder einer Id-Folge."""
+    ids = tok.encode(prompt) if isinstance(prompt, str) else list(prompt)
+    return ids[-block_size:]
+
+
+def length_normalize(logprob, length, length_penalty=1.0):
+    """Längen-Strafe nach GNMT: logprob / ((5 + länge) / 6) ** alpha."""
+    return logprob / (((5.0 + length) / 6.0) ** length_penalty)
+
+
+# ---------------------------
+# Generierung
+# ---------------------------
+@torch.no_grad()
+def generate(model, tok, prompt, n=1, steps=80, temperature=0.4,
+             block_size=64, device="cpu", return_logprobs=False, shortlist=None,
+             **sampling):
+    """
+    Erzeugt n Kandidaten gleichzeitig und gibt sie als Liste von Texten
+    zurück (jeweils Prompt-Fenster + Fortsetzung).
+    prompt: Text oder schon encodierte Token-Ids (z.B. ContextManager.encode).
+    Weitere Schlüsselwörter überschreiben DEFAULT_SAMPLING.
+
+    return_logprobs=True: stattdessen Dicts mit "text", "logprob"
+    (Summe der Modell-Log-Wahrscheinlichkeiten der erzeugten Tokens,
+    vor Strafen/Temperatur) und "tokens".
+
+    shortlist: optionale output_head.LogitShortlist – Logits erst nur für
+    häufige Tokens, volles Vokabular nur, wenn die Top-k es verlangen.
+    Experimentell und nicht mit return_logprobs (also nicht mit best_of_n):
+    Log-Wahrscheinlichkeiten über die Shortlist wären anders normiert als
+    die der Schritte mit vollem Vokabular. Strafen, die Logits anheben
+    können (repetition_penalty < 1, negative frequency/presence_penalty),
+    schalten die Shortlist ab.
+
+    model darf auch ein ort_backend.OrtLM sein (ONNX Runtime statt PyTorch).
+    """
+    opts = {**DEFAULT_SAMPLING, **sampling}
+    if shortlist is not None and return_logprobs:
+        raise ValueError("Mit Logit-Shortlist gibt es keine vergleichbaren "
+                         "Log-Wahrscheinlichkeiten.")
+    if getattr(model, "is_onnx", False):
+        import ort_backend
+
+        if shortlist is not None:
+            raise ValueError("Die Logit-Shortlist gibt es nur mit dem PyTorch-Backend.")
+        return ort_backend.generate(
+            model, tok, prompt, n=n, steps=steps, temperature=temperature,
+            block_size=block_size, return_logprobs=return_logprobs, **opts
+        )
+    ngram = opts.pop("no_repeat_ngram", 0) or 0
+    top_k, top_p = opts.pop("top_k", None), opts.pop("top_p", None)
+    if shortlist is not None and not shortlist.penalties_keep_bound(**opts):
+        shortlist = None  # Strafen heben Logits an -> Schranke gilt nicht, volles Vokabular
+
+    tokens = prompt_tokens(tok, prompt, block_size)
+    idx = torch.tensor([tokens] * n, dtype=torch.long, device=device)
+
+    # Prompt einmal decodieren, danach nur noch die neuen Tokens
+    detoks = [IncrementalDetokenizer(tok) for _ in range(n)]
+    for d in detoks:
+        d.push_many(tokens)
+
+    counts = None
+    logprobs = torch.zeros(n, device=device)
+    for _ in range(steps):
+        if idx.size(1) > block_size:
+            idx = idx[:, -block_size:]
+        # Ausgabekopf nur für die letzte Position
+        h = model.hidden(idx)[:, -1, :]
+        if shortlist is not None:
+            logits, bound = shortlist.logits(h)
+        else:
+            logits = model.head(h).float()
+        if counts is None:
+            # Strafen zählen wie die n-Gramm-Sperre auch das Prompt-Fenster mit
+            counts = torch.zeros_like(logits).scatter_add_(
+                1, idx, torch.ones_like(idx, dtype=logits.dtype))
+
+        banned = no_repeat_ngram_mask(idx, ngram, logits.size(-1)) if ngram else None
+        adjusted = adjust_logits(logits, counts=counts, banned=banned, **opts)
+        if shortlist is not None and not shortlist.covers(adjusted, bound, top_k):
+            logits = shortlist.full_logits(h)
+            adjusted = adjust_logits(logits, counts=counts, banned=banned, **opts)
+        next_id = sample_from_logits(adjusted, temperature, top_k, top_p)
+        counts.scatter_add_(1, next_id, torch.ones_like(next_id, dtype=counts.dtype))
+        if return_logprobs:
+            logprobs += F.log_softmax(logits, dim=-1).gather(1, next_id).squeeze(1)
+        idx = torch.cat([idx, next_id], dim=1)
+
+        for d, i in zip(detoks, next_id[:, 0].tolist()):
+            d.push(i)
+
+    for d in detoks:
+        d.flush()
+    if not return_logprobs:
+        return [d.text for d in detoks]
+    return [
+        {"text": d.text, "logprob": lp, "tokens": steps}
+        for d, lp in zip(detoks, logprobs.tolist())
+    ]
+
+
+def best_of_n(model, tok, prompt, n=5, steps=80, temperature=0.4, block_size=64,
+              device="cpu", length_penalty=1.0, **sampling):
+    """
+    n Kandidaten per Sampling (ein Batch), sortiert nach längen-normierter
+    Log-Wahrscheinlichkeit ("score"), bester zuerst.
+    """
+    results = generate(
+        model, tok, prompt, n=n, steps=steps, temperature=temperature,
+        block_size=block_size, device=device, return_logprobs=True, **sampling
+    )
+    for r in results:
+        r["score"] = length_normalize(r["logprob"], r["tokens"], length_penalty)
+    results.sort(key=lambda r: r["score"], reverse=True)
+    return results
+
+
+@torch.no_grad()
+def beam_search(model, tok, prompt, beams=4, steps=80, block_size=64, device="cpu",
+                length_penalty=1.0, no_repeat_ngram=DEFAULT_SAMPLING["no_repeat_ngram"],
+                stop_text=(".", "!", "?")):
+    """
+    Beam-Suche: alle Beams laufen als Batch durch EINEN Forward pro Schritt.
+    Ein Beam ist fertig, sobald er ein Token aus stop_text erzeugt
+    (z.B. Satzende). Ergebnis wie bei best_of_n(), bester zuerst.
+    """
+    if getattr(model, "is_onnx", False):
+        raise ValueError("Beam-Suche gibt es nur mit dem PyTorch-Backend.")
+    prompt_ids = prompt_tokens(tok, prompt, block_size)
+    prompt_t = torch.tensor(prompt_ids, dtype=torch.long, device=device)
+    stop_ids = torch.tensor(
+        [tok.stoi[t] for t in stop_text if t in tok.stoi], dtype=torch.long, device=device
+    )
+
+    gen = torch.empty(1, 0, dtype=torch.long, device=device)  # erzeugte Tokens je Beam
+    scores = torch.zeros(1, device=device)                    # kumulierte Log-Wahrsch.
+    finished = []  # (score, logprob, ids)
+
+    for step in range(steps):
+        idx = torch.cat([prompt_t.expand(gen.size(0), -1), gen], dim=1)[:, -block_size:]
+        logp = F.log_softmax(model.head(model.hidden(idx)[:, -1, :]).float(), dim=-1)
+        if no_repeat_ngram:
+            banned = no_repeat_ngram_mask(idx, no_repeat_ngram, logp.size(-1))
+            logp = logp.masked_fill(banned, float("-inf"))
+
+        # doppelt so viele Kandidaten wie Beams: fertige dürfen keinen Platz kosten
+        vocab = logp.size(-1)
+        total = (scores.unsqueeze(1) + logp).view(-1)
+        top, flat = torch.topk(total, k=min(2 * beams, total.numel()))
+        src, next_ids = flat // vocab, flat % vocab
+        new_gen = torch.cat([gen[src], next_ids.unsqueeze(1)], dim=1)
+        is_stop = torch.isin(next_ids, stop_ids).tolist()
+
+        keep = []
+        for j, value in enumerate(top.tolist()):
+            if value == float("-inf"):
+                break
+            if is_stop[j]:
+                # nur Endungen unter den besten `beams` zählen – sonst gewänne mit
+                # beams=1 ein schlechterer Kandidat, bloß weil er früher endet
+                if j < beams:
+                    finished.append((length_normalize(value, step + 1, length_penalty),
+                                     value, new_gen[j]))
+            elif len(keep) < beams:
+                keep.append(j)
+        if not keep:
+            gen = gen[:0]
+            break
+        keep = torch.tensor(keep, device=device)
+        gen, scores = new_gen[keep], top[keep]
+        if len(finished) >= beams:
+            break
+
+    # offene Beams nur auffüllen, wenn zu wenige fertig wurden
+    for ids, value in zip(gen[:max(0, beams - len(finished))], scores.tolist()):
+        finished.append((length_normalize(value, ids.numel(), length_penalty), value, ids))
+    finished.sort(key=lambda f: f[0], reverse=True)
+
+    results = []
+    for score, logprob, ids in finished[:beams]:
+        detok = IncrementalDetokenizer(tok)
+        detok.push_many(prompt_ids + ids.tolist())
+        detok.flush()
+        results.append(
+            {"text": detok.text, "logprob": logprob, "tokens": ids.numel(), "score": score}
+        )
+    return results
+
+
+def main():
+    from evaluate import load_model_for_eval
+    from tokenizer import BPETokenizer
+
+    parser = argparse.ArgumentParser(description="Beam-Suche und Best-of-N vergleichen")
+    parser.add_argument("prompt")
+    parser.add_argument("--model", default="minigpt_grundwissen.pt")
+    parser.add_argument("--tokenizer", default="tokenizer.json")
+    parser.add_argument("--beams", type=int, default=4)
+    parser.add_argument("--n", type=int, default=5, help="Kandidaten für Best-of-N")
+    parser.add_argument("--steps", type=int, default=80)
+    parser.add_argument("--temperature", type=float, default=0.4)
+    parser.add_argument("--length-penalty", type=float, default=1.0)
+    parser.add_argument("--backend", choices=("torch", "onnx"), default="torch",
+                        help="onnx: --model zeigt auf eine .onnx-Datei aus onnx_export.py")
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    tok = BPETokenizer.load(args.tokenizer)
+    if args.backend == "onnx":
+        from ort_backend import OrtLM
+
+        model = OrtLM(args.model)
+        block_size = model.max_len
+        print(f"ONNX Runtime ({'mit' if model.kv is not None else 'ohne'} KV-Cache), "
+              f"nur Best-of-N")
+    else:
+        model = load_model_for_eval(args.model, device=device)
+        block_size = model.pos.num_embeddings if hasattr(model, "pos") else 64
+
+    common = dict(steps=args.steps, block_size=block_size, device=device,
+                  length_penalty=args.length_penalty)
+    runs = [(f"Best-of-{args.n}",
+             best_of_n(model, tok, args.prompt, n=args.n, temperature=args.temperature,
+                       **common))]
+    if args.backend == "torch":
+        runs.insert(0, (f"Beam-Suche ({args.beams} Beams)",
+                        beam_search(model, tok, args.prompt, beams=args.beams, **common)))
+    for title, results in runs:
+        print(f"\n=== {title} ===")
+        for r in results:
+            print(f"[score {r['score']:.3f} | logprob {r['logprob']:.2f} | "
+                  f"{r['tokens']} Tokens] {r['text']!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,424 @@
+# ingest.py
+"""
+Trainingsdaten aus vielen Textdateien vorbereiten (auch größer als der RAM).
+
+- Eingabe: Ordner und/oder Glob-Muster (z.B. "daten/**/*.txt")
+- Dateien werden in Stücken gelesen und in einem Prozess-Pool encodiert
+- Exakt doppelte Absätze (gleicher Hash) fließen nur einmal ein
+- Ausgabe: binäre Token-Shards (shard_00000.bin, ...) + manifest.json
+- Erneuter Lauf: nur Dateien mit geändertem Inhalt werden neu encodiert
+
+Benutzung:
+    python ingest.py daten/ --out data_shards
+    python train.py --text-file data_shards/manifest.json
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from tokenizer import BPETokenizer
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+PARAGRAPH_SEP = "\n\n"
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+
+
+# ---------------------------
+# HILFSFUNKTIONEN
+# ---------------------------
+def file_sha(path):
+    """Inhalts-Hash einer Datei (blake2b, gestreamt)."""
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def token_dtype(vocab_size):
+    return np.uint16 if vocab_size <= np.iinfo(np.uint16).max else np.uint32
+
+
+def find_input_files(inputs):
+    """Ordner (rekursiv *.txt) und Glob-Muster zu einer sortierten Dateiliste."""
+    files = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, "**", "*.txt")
+            files.update(glob.glob(pattern, recursive=True))
+        else:
+            files.update(p for p in glob.glob(item, recursive=True) if os.path.isfile(p))
+    return sorted(os.path.abspath(p) for p in files)
+
+
+def iter_paragraph_chunks(path, chunk_chars):
+    """
+    Liest eine Datei stückweise; jedes Stück endet an einer Absatzgrenze,
+    damit kein Absatz auf zwei Worker verteilt wird.
+    """
+    rest = ""
+    with open(path, "r", encoding="utf8", errors="replace") as f:
+        while True:
+            block = f.read(chunk_chars)
+            if not block:
+                break
+            buf = rest + block
+            cut = buf.rfind(PARAGRAPH_SEP)
+            if cut < 0:
+                rest = buf
+                # extrem langer Absatz ohne Leerzeile -> trotzdem abgeben
+                if len(rest) >= 8 * chunk_chars:
+                    yield rest
+                    rest = ""
+                continue
+            yield buf[:cut]
+            rest = buf[cut + len(PARAGRAPH_SEP):]
+    if rest.strip():
+        yield rest
+
+
+def paragraph_hash(paragraph):
+    digest = hashlib.blake2b(paragraph.encode("utf8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+# ---------------------------
+# WORKER (Prozess-Pool)
+# ---------------------------
+_worker_tok = None
+_worker_dtype = None
+
+
+def _init_worker(tokenizer_file):
+    global _worker_tok, _worker_dtype
+    _worker_tok = BPETokenizer.load(tokenizer_file)
+    _worker_dtype = token_dtype(len(_worker_tok.vocab))
+
+
+def _encode_chunk(text):
+    """Zerlegt ein Stück in Absätze, hasht und encodiert sie."""
+    ids = []
+    hashes = []
+    lengths = []
+    for para in _PARAGRAPH_SPLIT.split(text):
+        para = para.strip()
+        if not para:
+            continue
+        encoded = _worker_tok.encode(para + PARAGRAPH_SEP)
+        ids.extend(encoded)
+        hashes.append(paragraph_hash(para))
+        lengths.append(len(encoded))
+    return (
+        np.asarray(ids, dtype=_worker_dtype),
+        np.asarray(hashes, dtype=np.uint64),
+        np.asarray(lengths, dtype=np.int64),
+    )
+
+
+def _collect_chars(path, chunk_chars):
+    """Zeichenmenge einer Datei (für einen neuen Zeichen-Tokenizer)."""
+    chars = set()
+    for chunk in iter_paragraph_chunks(path, chunk_chars):
+        chars.update(chunk)
+    return chars
+
+
+# ---------------------------
+# ENCODIEREN MIT CACHE
+# ---------------------------
+class CacheFile:
+    """
+    Cache einer Datei: <cache_base>.bin (Tokens) und
+    <cache_base>.idx.npy (Hash, Länge je Absatz).
+    """
+
+    def __init__(self, path, cache_base, dtype):
+        self.path = path
+        self.cache_base = cache_base
+        self.dtype = dtype
+        self.hashes = []
+        self.lengths = []
+        self._out = open(cache_base + ".bin.tmp", "wb")
+
+    def add(self, result):
+        ids, h, ln = result
+        ids.astype(self.dtype, copy=False).tofile(self._out)
+        self.hashes.append(h)
+        self.lengths.append(ln)
+
+    def close(self):
+        if not self._out.closed:
+            self._out.close()
+
+    def finish(self):
+        self.close()
+        index = np.stack([
+            np.concatenate(self.hashes) if self.hashes else np.zeros(0, dtype=np.uint64),
+            (np.concatenate(self.lengths) if self.lengths
+             else np.zeros(0, dtype=np.int64)).astype(np.uint64),
+        ], axis=1)
+        np.save(self.cache_base + ".idx.npy", index)
+        os.replace(self.cache_base + ".bin.tmp", self.cache_base + ".bin")
+        return int(index[:, 1].sum()), len(index)
+
+
+def encode_files(pool, jobs, dtype, chunk_chars, max_in_flight):
+    """
+    Encodiert mehrere Dateien über den Pool (jobs = [(pfad, cache_base), ...]).
+
+    Eine gemeinsame Warteschlange über Dateigrenzen hinweg hält höchstens
+    max_in_flight Stücke unterwegs – so sind auch bei vielen kleinen Dateien
+    alle Worker beschäftigt. Ergebnisse werden in Abgabereihenfolge in die
+    Cache-Dateien geschrieben. Gibt {pfad: (tokens, absätze)} zurück.
+    """
+    results = {}
+    queue = deque()  # (CacheFile, Future) – Future None = Datei vollständig
+    pending = 0
+
+    def drain_one():
+        nonlocal pending
+        cache, future = queue.popleft()
+        if future is None:
+            results[cache.path] = cache.finish()
+            print(f"  encodiert: {cache.path} ({results[cache.path][0]} Tokens)", flush=True)
+            return
+        cache.add(future.result())
+        pending -= 1
+
+    try:
+        for path, cache_base in jobs:
+            cache = CacheFile(path, cache_base, dtype)
+            for chunk in iter_paragraph_chunks(path, chunk_chars):
+                queue.append((cache, pool.submit(_encode_chunk, chunk)))
+                pending += 1
+                while pending >= max_in_flight:
+                    drain_one()
+            queue.append((cache, None))
+        while queue:
+            drain_one()
+    finally:
+        for cache, _ in queue:
+            cache.close()
+    return results
+
+
+class ShardWriter:
+    """Schreibt Tokens fortlaufend in Shards fester Maximalgröße."""
+
+    def __init__(self, out_dir, dtype, shard_tokens):
+        self.out_dir = out_dir
+        self.dtype = dtype
+        self.shard_tokens = shard_tokens
+        self.shards = []
+        self._file = None
+        self._count = 0
+
+    def _open_next(self):
+        self.close()
+        name = f"shard_{len(self.shards):05d}.bin"
+        self._file = open(os.path.join(self.out_dir, name + ".tmp"), "wb")
+        self.shards.append({"file": name, "tokens": 0})
+        self._count = 0
+
+    def write(self, tokens):
+        while len(tokens):
+            if self._file is None or self._count >= self.shard_tokens:
+                self._open_next()
+            n = min(len(tokens), self.shard_tokens - self._count)
+            tokens[:n].astype(self.dtype, copy=False).tofile(self._file)
+            self._count += n
+            self.shards[-1]["tokens"] += n
+            tokens = tokens[n:]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            name = self.shards[-1]["file"]
+            os.replace(os.path.join(self.out_dir, name + ".tmp"), os.path.join(self.out_dir, name))
+            self._file = None
+
+
+def write_deduplicated_shards(out_dir, file_entries, dtype, shard_tokens):
+    """
+    Geht die Dateien in fester Reihenfolge durch und übernimmt jeden Absatz
+    nur beim ersten Auftreten. Liest die Tokens per memmap aus dem Cache.
+    """
+    for name in os.listdir(out_dir):
+        if name.startswith("shard_") and name.endswith(".bin"):
+            os.remove(os.path.join(out_dir, name))
+
+    writer = ShardWriter(out_dir, dtype, shard_tokens)
+    seen = set()
+    duplicates = 0
+
+    for path in sorted(file_entries):
+        entry = file_entries[path]
+        cache_base = os.path.join(out_dir, "cache", entry["cache"])
+        index = np.load(cache_base + ".idx.npy")
+        if len(index) == 0:
+            entry["kept_paragraphs"] = 0
+            continue
+        tokens = np.memmap(cache_base + ".bin", dtype=dtype, mode="r")
+        ends = np.cumsum(index[:, 1].astype(np.int64))
+        starts = ends - index[:, 1].astype(np.int64)
+
+        kept = 0
+        span_start = None
+        span_end = None
+        for h, s, e in zip(index[:, 0].tolist(), starts.tolist(), ends.tolist()):
+            if h in seen:
+                duplicates += 1
+                continue
+            seen.add(h)
+            kept += 1
+            # zusammenhängende Absätze am Stück kopieren
+            if span_end == s:
+                span_end = e
+                continue
+            if span_start is not None:
+                writer.write(tokens[span_start:span_end])
+            span_start, span_end = s, e
+        if span_start is not None:
+            writer.write(tokens[span_start:span_end])
+        entry["kept_paragraphs"] = kept
+        del tokens
+
+    writer.close()
+    return writer.shards, duplicates
+
+
+# ---------------------------
+# HAUPTABLAUF
+# ---------------------------
+def ingest(inputs, out_dir, tokenizer_file="tokenizer.json", workers=None,
+           chunk_chars=1 << 20, shard_tokens=1 << 26):
+    t0 = time.time()
+    files = find_input_files(inputs)
+    if not files:
+        raise FileNotFoundError(f"Keine Textdateien gefunden in: {inputs}")
+    os.makedirs(os.path.join(out_dir, "cache"), exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    print(f"{len(files)} Dateien | {workers} Worker", flush=True)
+
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    old = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf8") as f:
+            old = json.load(f)
+    old_files = old.get("files", {}) if old.get("version") == MANIFEST_VERSION else {}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Tokenizer: vorhandenen nehmen, sonst Zeichenmenge aller Dateien sammeln
+        if not os.path.exists(tokenizer_file):
+            chars = set()
+            for part in pool.map(_collect_chars, files, [chunk_chars] * len(files)):
+                chars.update(part)
+            tok = BPETokenizer(vocab_size=4096)
+            tok.train("".join(chars))
+            tok.save(tokenizer_file)
+            print("Tokenizer neu trainiert und gespeichert.", flush=True)
+        tok = BPETokenizer.load(tokenizer_file)
+        tok_hash = file_sha(tokenizer_file)
+        dtype = token_dtype(len(tok.vocab))
+
+    file_entries = {}
+    jobs = []
+    for path in files:
+        st = os.stat(path)
+        prev = old_files.get(path)
+        # Größe + mtime gleich -> Hash muss nicht neu berechnet werden
+        if prev and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns:
+            sha = prev["sha"]
+        else:
+            sha = file_sha(path)
+
+        cache_name = f"{sha}_{tok_hash[:12]}"
+        cache_base = os.path.join(out_dir, "cache", cache_name)
+        if prev and prev["cache"] == cache_name and os.path.exists(cache_base + ".bin"):
+            entry = dict(prev)
+        else:
+            entry = {"cache": cache_name}
+            jobs.append((path, cache_base))
+        entry.update({"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha": sha})
+        file_entries[path] = entry
+
+    n_encoded = len(jobs)
+    if jobs:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(tokenizer_file,)
+        ) as pool:
+            encoded = encode_files(pool, jobs, dtype, chunk_chars, max_in_flight=2 * workers)
+        for path, (n_tokens, n_paras) in encoded.items():
+            file_entries[path].update({"tokens": n_tokens, "paragraphs": n_paras})
+
+    # Nichts geändert und Shards vorhanden -> fertig
+    unchanged = (
+        n_encoded == 0
+        and old.get("tokenizer_hash") == tok_hash
+        and set(old_files) == set(file_entries)
+        and all(os.path.exists(os.path.join(out_dir, s["file"])) for s in old.get("shards", []))
+    )
+    if unchanged:
+        print("Keine Änderungen – Shards sind aktuell.", flush=True)
+        return old
+
+    shards, duplicates = write_deduplicated_shards(out_dir, file_entries, dtype, shard_tokens)
+
+    # nicht mehr benutzte Cache-Dateien entfernen
+    used = {e["cache"] for e in file_entries.values()}
+    for name in os.listdir(os.path.join(out_dir, "cache")):
+        if name.split(".", 1)[0] not in used:
+            os.remove(os.path.join(out_dir, "cache", name))
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "tokenizer": os.path.abspath(tokenizer_file),
+        "tokenizer_hash": tok_hash,
+        "vocab_size": len(tok.vocab),
+        "dtype": np.dtype(dtype).name,
+        "total_tokens": sum(s["tokens"] for s in shards),
+        "duplicate_paragraphs": duplicates,
+        "shards": shards,
+        "files": file_entries,
+    }
+    tmp = manifest_path + ".tmp"
+    with open(tmp, "w", encoding="utf8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, manifest_path)
+
+    print(
+        f"✅ {manifest['total_tokens']} Tokens in {len(shards)} Shards | "
+        f"{n_encoded} Dateien neu encodiert | {duplicates} doppelte Absätze entfernt | "
+        f"{time.time() - t0:.1f}s",
+        flush=True,
+    )
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Textdateien in Token-Shards umwandeln")
+    parser.add_argument("inputs", nargs="+", help="Ordner und/oder Glob-Muster")
+    parser.add_argument("--out", default="data_shards", help="Ausgabeordner")
+    parser.add_argument("--tokenizer", default="tokenizer.json")
+    parser.add_argument("--workers", type=int, default=None, help="Standard: alle Kerne")
+    parser.add_argument("--chunk-chars", type=int, default=1 << 20)
+    parser.add_argument("--shard-tokens", type=int, default=1 << 26)
+    args = parser.parse_args()
+    ingest(
+        args.inputs, args.out,
+        tokenizer_file=args.tokenizer, workers=args.workers,
+        chunk_chars=args.chunk_chars, shard_tokens=args.shard_tokens,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
 # model.py
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint
 
 class MiniGPT(nn.Module):
-    def __init__(self, vocab_size, max_len=128, embed_dim=128, heads=4, layers=4):
+    def __init__(self, vocab_size, max_len=128, embed_dim=128, heads=4, layers=4, ff_dim=512,
+                 checkpoint_layers=0, adaptive_cutoffs=None, adaptive_div=4.0, causal=False):
         super().__init__()
 
         self.embed = nn.Embedding(vocab_size, embed_dim)
@@ -12,18 +15,164 @@ class MiniGPT(nn.Module):
         encoder_layer = nn.TransformerEncoderLayer(
             d_model=embed_dim,
             nhead=heads,
-            dim_feedforward=512,
+            dim_feedforward=ff_dim,
             batch_first=True
         )
         self.transformer = nn.TransformerEncoder(encoder_layer, num_layers=layers)
 
-        self.fc = nn.Linear(embed_dim, vocab_size)
+        if adaptive_cutoffs:
+            # Adaptive Softmax: häufige Tokens im Kopf, seltene in kleineren
+            # Clustern dahinter -> billiger Loss bei großem Vokabular.
+            # Braucht Ids nach Häufigkeit sortiert: vocab_rank[token_id] = Rang
+            # (wird mit set_vocab_order() gesetzt und mit den Gewichten gespeichert)
+            self.fc = None
+            self.adaptive = nn.AdaptiveLogSoftmaxWithLoss(
+                embed_dim, vocab_size, cutoffs=list(adaptive_cutoffs), div_value=adaptive_div
+            )
+            self.register_buffer("vocab_rank", torch.arange(vocab_size))
+            # div_value exakt mitspeichern: aus den (abgerundeten) Tail-Breiten
+            # lässt er sich nicht zuverlässig zurückrechnen
+            self.register_buffer("adaptive_div", torch.tensor(float(adaptive_div), dtype=torch.float64))
+        else:
+            self.fc = nn.Linear(embed_dim, vocab_size)
+            self.adaptive = None
 
-    def forward(self, x):
+        # causal=True: jedes Token sieht nur sich und frühere Tokens (nötig für
+        # KV-Cache beim Decodieren). Ohne Maske sieht jedes Token den ganzen Block.
+        # Steht nicht in den Gewichten -> ein leerer Marker im state_dict
+        self.causal = causal
+        if causal:
+            self.register_buffer("causal_marker", torch.ones(0))
+
+        # Aktivierungs-Checkpointing (nur im Training): für die ersten N Layer
+        # werden die Aktivierungen nicht gespeichert, sondern im Backward neu
+        # berechnet -> viel weniger Speicher bei langen Blöcken, etwas langsamer
+        self.checkpoint_layers = checkpoint_layers
+
+    def hidden(self, x, segment_ids=None):
+        """
+        Ausgabe des Transformers vor dem fc-Kopf: (batch, time, embed_dim).
+
+        segment_ids: optionale (batch, time)-Dokument-Ids gepackter Blöcke.
+        Tokens sehen dann nur ihr eigenes Dokument (Block-Diagonal-Maske),
+        und die Positionen beginnen in jedem Dokument wieder bei 0.
+        """
         # x: (batch, time)
         b, t = x.size()
         # Positions-Tensor auf das gleiche Device wie x legen
         positions = torch.arange(0, t, device=x.device)
+        mask = None
+        if self.causal:
+            mask = torch.triu(torch.ones(t, t, dtype=torch.bool, device=x.device), diagonal=1)
+        if segment_ids is not None:
+            new_doc = torch.ones_like(segment_ids, dtype=torch.bool)
+            new_doc[:, 1:] = segment_ids[:, 1:] != segment_ids[:, :-1]
+            doc_start = torch.where(new_doc, positions, 0).cummax(dim=1).values
+            positions = positions - doc_start
+            # True = verboten; eine Maske pro (Beispiel, Head)
+            seg_mask = segment_ids.unsqueeze(2) != segment_ids.unsqueeze(1)
+            mask = seg_mask if mask is None else seg_mask | mask
+            mask = mask.repeat_interleave(self.transformer.layers[0].self_attn.num_heads, dim=0)
         x = self.embed(x) + self.pos(positions)
-        x = self.transformer(x)
-        return self.fc(x)
+
+        n_ckpt = self.checkpoint_layers if self.training and torch.is_grad_enabled() else 0
+        if n_ckpt <= 0:
+            return self.transformer(x, mask=mask)
+
+        for i, layer in enumerate(self.transformer.layers):
+            if i < n_ckpt:
+                x = checkpoint(layer, x, mask, use_reentrant=False)
+            else:
+                x = layer(x, src_mask=mask)
+        if self.transformer.norm is not None:
+            x = self.transformer.norm(x)
+        return x
+
+    def set_vocab_order(self, counts):
+        """Häufigstes Token bekommt Rang 0 (nur für den Adaptive-Softmax-Kopf)."""
+        order = torch.argsort(torch.as_tensor(counts), descending=True, stable=True)
+        rank = torch.empty_like(order)
+        rank[order] = torch.arange(order.numel())
+        self.vocab_rank.copy_(rank)
+
+    def head(self, h):
+        """Ausgabekopf: (…, embed_dim) -> (…, vocab) Logits in Token-Id-Reihenfolge."""
+        if self.adaptive is None:
+            return self.fc(h)
+        # Log-Wahrscheinlichkeiten sind gültige Logits (softmax ändert sich nicht)
+        logp = self.adaptive.log_prob(h.reshape(-1, h.size(-1)).float())
+        return logp.index_select(-1, self.vocab_rank).view(*h.shape[:-1], -1)
+
+    def forward(self, x, segment_ids=None):
+        return self.head(self.hidden(x, segment_ids))
+
+    def loss(self, x, targets, chunk_tokens=0, ignore_index=-100, segment_ids=None):
+        """
+        Cross-Entropy über die nächsten Tokens.
+
+        chunk_tokens > 0: die Logits werden stückweise (je chunk_tokens
+        Positionen) berechnet und im Backward neu erzeugt – der volle
+        (batch, time, vocab)-Tensor existiert nie auf einmal.
+        """
+        h = self.hidden(x, segment_ids)
+        if self.adaptive is not None:
+            # rechnet ohnehin nur die Cluster der Ziel-Tokens -> kein Chunking nötig
+            h = h.reshape(-1, h.size(-1))
+            targets = targets.reshape(-1)
+            keep = targets != ignore_index
+            return self.adaptive(h[keep].float(), self.vocab_rank[targets[keep]]).loss
+
+        if chunk_tokens <= 0:
+            logits = self.fc(h)
+            return F.cross_entropy(
+                logits.view(-1, logits.size(-1)).float(),
+                targets.reshape(-1),
+                ignore_index=ignore_index,
+            )
+
+        h = h.reshape(-1, h.size(-1))
+        targets = targets.reshape(-1)
+        total = h.new_zeros((), dtype=torch.float32)
+        for start in range(0, h.size(0), chunk_tokens):
+            total = total + checkpoint(
+                self._ce_sum, h[start:start + chunk_tokens], targets[start:start + chunk_tokens],
+                ignore_index, use_reentrant=False,
+            )
+        return total / (targets != ignore_index).sum().clamp(min=1)
+
+    def _ce_sum(self, h, targets, ignore_index):
+        logits = self.fc(h).float()
+        return F.cross_entropy(logits, targets, ignore_index=ignore_index, reduction="sum")
+
+
+def config_from_state_dict(state_dict, heads=4):
+    """
+    Liest die Architektur (Vokabular, max_len, Breite, Layer, FF-Größe)
+    direkt aus einem gespeicherten state_dict ab.
+    Die Anzahl der Heads steht nicht in den Gewichten -> wird übergeben.
+    """
+    vocab_size, embed_dim = state_dict["embed.weight"].shape
+    max_len = state_dict["pos.weight"].shape[0]
+    layer_ids = {
+        k.split(".")[2] for k in state_dict if k.startswith("transformer.layers.")
+    }
+    ff_dim = state_dict["transformer.layers.0.linear1.weight"].shape[0]
+    config = {
+        "vocab_size": int(vocab_size),
+        "max_len": int(max_len),
+        "embed_dim": int(embed_dim),
+        "heads": heads,
+        "layers": len(layer_ids),
+        "ff_dim": int(ff_dim),
+    }
+    if "adaptive.head.weight" in state_dict:
+        # Kopf = Shortlist + ein Eintrag pro Cluster; Cluster-Größen aus den Tails
+        n_clusters = len({k.split(".")[2] for k in state_dict if k.startswith("adaptive.tail.")})
+        cutoffs = [state_dict["adaptive.head.weight"].shape[0] - n_clusters]
+        for i in range(n_clusters - 1):
+            cutoffs.append(cutoffs[-1] + state_dict[f"adaptive.tail.{i}.1.weight"].shape[0])
+        config["adaptive_cutoffs"] = cutoffs
+        config["adaptive_div"] = float(state_dict["adaptive_div"])
+    if "causal_marker" in state_dict:
+        config["causal"] = True
+    return config
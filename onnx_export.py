@@ -0,0 +1,284 @@
+# onnx_export.py
+"""
+MiniGPT nach ONNX exportieren und gegen PyTorch prüfen.
+
+Zwei Graphen:
+- <name>.onnx     ganzes Fenster:  ids (B, T) -> logits (B, T, V)
+- <name>.kv.onnx  inkrementell mit KV-Cache (nur für causal=True):
+                  ids (B, T_neu), past_k/past_v (L, B, H, T_alt, D)
+                  -> logits (B, T_neu, V), present_k/present_v (L, B, H, T_alt+T_neu, D)
+  Vorfüllen = derselbe Graph mit T_alt = 0.
+
+Ohne causal sieht jedes Token auch spätere Tokens im Fenster; die
+Schlüssel/Werte alter Tokens ändern sich dann mit jedem neuen Token und
+ein KV-Cache wäre falsch. Solche Modelle bekommen nur den Fenster-Graphen
+(train.py: causal = 1 für neue Modelle).
+
+Die Layer werden hier funktional mit denselben Gewichten nachgebaut
+(statt nn.TransformerEncoder), damit beide Graphen denselben Code benutzen
+und sich sauber exportieren lassen.
+
+    python onnx_export.py minigpt_grundwissen.pt --check
+"""
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from shared_weights import load_model_shared
+
+OPSET = 17
+
+
+class ExportGraph(nn.Module):
+    """Funktionaler Nachbau von MiniGPT für den Export (nur Inferenz)."""
+
+    def __init__(self, model, kv_cache=False):
+        super().__init__()
+        if kv_cache and not model.causal:
+            raise ValueError("KV-Cache braucht ein Modell mit causal=True.")
+        self.model = model
+        self.kv_cache = kv_cache
+        attn = model.transformer.layers[0].self_attn
+        self.heads = attn.num_heads
+        self.head_dim = attn.embed_dim // attn.num_heads
+
+    def _layer(self, layer, x, past_k, past_v, mask):
+        def self_attention(h):
+            b, t, e = h.shape
+            qkv = F.linear(h, layer.self_attn.in_proj_weight, layer.self_attn.in_proj_bias)
+            q, k, v = (
+                z.reshape(b, t, self.heads, self.head_dim).transpose(1, 2)
+                for z in qkv.chunk(3, dim=-1)
+            )
+            if past_k is not None:
+                k = torch.cat([past_k, k], dim=2)
+                v = torch.cat([past_v, v], dim=2)
+            scores = q @ k.transpose(-1, -2) / math.sqrt(self.head_dim)
+            if mask is not None:
+                scores = scores.masked_fill(mask, float("-inf"))
+            out = (scores.softmax(dim=-1) @ v).transpose(1, 2).reshape(b, t, e)
+            return layer.self_attn.out_proj(out), k, v
+
+        def feed_forward(h):
+            return layer.linear2(layer.activation(layer.linear1(h)))
+
+        if layer.norm_first:
+            a, k, v = self_attention(layer.norm1(x))
+            x = x + a
+            x = x + feed_forward(layer.norm2(x))
+        else:
+            a, k, v = self_attention(x)
+            x = layer.norm1(x + a)
+            x = layer.norm2(x + feed_forward(x))
+        return x, k, v
+
+    def forward(self, ids, past_k=None, past_v=None):
+        t_new = ids.size(1)
+        t_past = past_k.size(3) if past_k is not None else 0
+        positions = torch.arange(t_new, device=ids.device) + t_past
+        x = self.model.embed(ids) + self.model.pos(positions)
+
+        mask = None
+        if self.model.causal:
+            # neue Position i sieht alle Schlüssel bis t_past + i
+            keys = torch.arange(t_past + t_new, device=ids.device)
+            mask = keys.unsqueeze(0) > positions.unsqueeze(1)
+
+        present_k, present_v = [], []
+        for i, layer in enumerate(self.model.transformer.layers):
+            pk = past_k[i] if past_k is not None else None
+            pv = past_v[i] if past_v is not None else None
+            x, k, v = self._layer(layer, x, pk, pv, mask)
+            present_k.append(k)
+            present_v.append(v)
+        if self.model.transformer.norm is not None:
+            x = self.model.transformer.norm(x)
+
+        logits = self.model.head(x)
+        if not self.kv_cache:
+            return logits
+        return logits, torch.stack(present_k), torch.stack(present_v)
+
+
+def _metadata(model):
+    """Architektur für ort_backend.py (liest sie ohne torch)."""
+    attn = model.transformer.layers[0].self_attn
+    return {
+        "vocab_size": model.embed.num_embeddings,
+        "max_len": model.pos.num_embeddings,
+        "layers": len(model.transformer.layers),
+        "heads": attn.num_heads,
+        "head_dim": attn.embed_dim // attn.num_heads,
+        "causal": bool(model.causal),
+    }
+
+
+def _add_metadata(path, meta):
+    import onnx
+
+    proto = onnx.load(path)
+    for key, value in meta.items():
+        entry = proto.metadata_props.add()
+        entry.key, entry.value = key, json.dumps(value)
+    onnx.save(proto, path)
+
+
+@torch.no_grad()
+def export_onnx(model, path, kv_cache=False):
+    """Exportiert den Fenster- bzw. KV-Cache-Graphen nach `path`."""
+    graph = ExportGraph(model, kv_cache=kv_cache).eval()
+    meta = _metadata(model)
+    ids = torch.zeros(2, 5, dtype=torch.long)
+
+    if not kv_cache:
+        args = (ids,)
+        names_in, names_out = ["ids"], ["logits"]
+        axes = {"ids": {0: "batch", 1: "time"}, "logits": {0: "batch", 1: "time"}}
+    else:
+        past = torch.zeros(meta["layers"], 2, meta["heads"], 3, meta["head_dim"])
+        args = (ids, past, past.clone())
+        names_in = ["ids", "past_k", "past_v"]
+        names_out = ["logits", "present_k", "present_v"]
+        cache_axes = {1: "batch", 3: "past"}
+        axes = {
+            "ids": {0: "batch", 1: "time"},
+            "logits": {0: "batch", 1: "time"},
+            "past_k": cache_axes, "past_v": cache_axes,
+            "present_k": {1: "batch", 3: "total"}, "present_v": {1: "batch", 3: "total"},
+        }
+
+    tmp = path + ".tmp"
+    # TorchScript-Exporter: kennt dynamic_axes und braucht kein onnxscript
+    torch.onnx.export(
+        graph, args, tmp,
+        input_names=names_in, output_names=names_out,
+        dynamic_axes=axes, opset_version=OPSET, dynamo=False,
+    )
+    _add_metadata(tmp, meta)
+    os.replace(tmp, path)
+    return path
+
+
+def export_all(model, base):
+    """<base>.onnx und – wenn das Modell causal ist – <base>.kv.onnx."""
+    paths = [export_onnx(model, base + ".onnx")]
+    if model.causal:
+        paths.append(export_onnx(model, base + ".kv.onnx", kv_cache=True))
+    return paths
+
+
+# ---------------------------
+# Prüfen: Logits + Latenz
+# ---------------------------
+@torch.no_grad()
+def check_parity(model, onnx_path, vocab_size, batch=3, length=None, seed=0):
+    """Größte Abweichung der Logits (ONNX Runtime gegen PyTorch)."""
+    from ort_backend import OrtLM
+
+    lm = OrtLM(onnx_path)
+    g = torch.Generator().manual_seed(seed)
+    length = length or model.pos.num_embeddings
+    ids = torch.randint(0, vocab_size, (batch, length), generator=g)
+    ref = model(ids).numpy()
+
+    report = {"window": float(abs(lm.window_logits(ids.numpy()) - ref[:, -1]).max())}
+    if lm.kv is not None:
+        # Vorfüllen mit der ersten Hälfte, dann Token für Token
+        half = length // 2
+        worst = abs(lm.start(ids[:, :half].numpy()) - ref[:, half - 1]).max()
+        for t in range(half, length):
+            worst = max(worst, abs(lm.step(ids[:, t].numpy()) - ref[:, t]).max())
+        report["kv_cache"] = float(worst)
+    return report
+
+
+def _time_per_token(fn, steps):
+    fn(1)  # Aufwärmen
+    t0 = time.perf_counter()
+    fn(steps)
+    return (time.perf_counter() - t0) / steps * 1000
+
+
+def compare_latency(model, onnx_path, tok, prompt="Die Sonne ist", n=1, steps=64):
+    """
+    ms pro erzeugtem Token: PyTorch gegen ONNX Runtime (Fenster / KV-Cache).
+    Läuft die Generierung über das Fenster hinaus, kommt zum Vergleich der
+    KV-Cache mit Neu-Vorfüllen bei jedem Token dazu (exakt wie PyTorch).
+    """
+    from generation import generate
+    from ort_backend import OrtLM, generate as ort_generate
+
+    block_size = model.pos.num_embeddings
+    opts = dict(n=n, block_size=block_size, no_repeat_ngram=0)
+    rows = {"torch": _time_per_token(
+        lambda s: generate(model, tok, prompt, steps=s, **opts), steps)}
+
+    lm = OrtLM(onnx_path)
+    rows["onnx (Fenster)"] = _time_per_token(
+        lambda s: ort_generate(lm, tok, prompt, steps=s, use_kv_cache=False, **opts), steps)
+    if lm.kv is not None:
+        rows["onnx (KV-Cache)"] = _time_per_token(
+            lambda s: ort_generate(lm, tok, prompt, steps=s, **opts), steps)
+        if len(tok.encode(prompt)) + steps > block_size:
+            rows["onnx (KV, exakt)"] = _time_per_token(
+                lambda s: ort_generate(lm, tok, prompt, steps=s, refill_keep=block_size, **opts),
+                steps)
+    return rows
+
+
+def import_seconds(module):
+    """Wie lange `import module` in einem frischen Prozess dauert."""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    from tokenizer import BPETokenizer
+
+    parser = argparse.ArgumentParser(description="MiniGPT nach ONNX exportieren")
+    parser.add_argument("model", nargs="?", default="minigpt_grundwissen.pt")
+    parser.add_argument("--out", default=None, help="Basisname (Standard: wie das Modell)")
+    parser.add_argument("--tokenizer", default="tokenizer.json")
+    parser.add_argument("--check", action="store_true",
+                        help="Logits vergleichen und Latenz messen")
+    parser.add_argument("--steps", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    os.environ.setdefault("SLM_THREADS", str(args.threads))
+    model = load_model_shared(args.model)
+    base = args.out or os.path.splitext(args.model)[0]
+    for path in export_all(model, base):
+        print(f"✅ {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+    if not model.causal:
+        print("Modell ist nicht causal -> kein KV-Cache-Graph (nur ganzes Fenster).")
+
+    if not args.check:
+        return
+    tok = BPETokenizer.load(args.tokenizer)
+    parity = check_parity(model, base + ".onnx", len(tok.vocab))
+    for name, diff in parity.items():
+        status = "ok" if diff < 1e-3 else "ABWEICHUNG"
+        print(f"Parität {name:<9}: max |Δlogit| = {diff:.2e} ({status})")
+
+    # einmal wie angegeben, einmal weit über das Fenster hinaus (Neu-Vorfüllen)
+    for steps in (args.steps, 4 * model.pos.num_embeddings):
+        print(f"\nLatenz ({steps} Tokens, {args.threads} Thread(s)):")
+        for name, ms in compare_latency(model, base + ".onnx", tok, steps=steps).items():
+            print(f"  {name:<16} {ms:6.2f} ms/Token")
+    print(f"\nImport-Zeit: torch {import_seconds('torch'):.2f} s | "
+          f"onnxruntime {import_seconds('onnxruntime'):.2f} s")
+
+
+if __name__ == "__main__":
+    main()
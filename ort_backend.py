@@ -0,0 +1,228 @@
+# ort_backend.py
+"""
+Generierung über ONNX Runtime (CPU) – ohne PyTorch.
+
+Braucht nur numpy + onnxruntime und die Dateien aus onnx_export.py:
+
+    lm = OrtLM("minigpt_grundwissen.onnx")     # lädt .kv.onnx automatisch mit
+    texts = generate(lm, tok, "Die Sonne ist", n=5, steps=80)
+
+generation.generate() leitet an dieses Modul weiter, wenn man ihm ein
+OrtLM statt eines MiniGPT gibt (Best-of-N funktioniert damit auch).
+Das Sampling (Strafen, n-Gramm-Sperre, Top-k, Top-p) entspricht
+generation.py, nur mit numpy statt torch.
+"""
+import json
+import os
+
+import numpy as np
+
+try:
+    import onnxruntime as ort
+except ImportError:  # nur für dieses Backend nötig
+    ort = None
+
+from tokenizer import IncrementalDetokenizer
+
+# wie generation.DEFAULT_SAMPLING (hier nicht importiert, sonst käme torch mit)
+DEFAULT_SAMPLING = {
+    "top_k": 30,
+    "top_p": None,
+    "repetition_penalty": 1.0,
+    "frequency_penalty": 0.0,
+    "presence_penalty": 0.0,
+    "no_repeat_ngram": 0,
+}
+
+
+class OrtLM:
+    """ONNX-Graphen eines MiniGPT; KV-Cache wird benutzt, wenn vorhanden."""
+
+    is_onnx = True
+
+    def __init__(self, path, kv_path=None, threads=None):
+        if ort is None:
+            raise ImportError("Für das ONNX-Backend bitte 'pip install onnxruntime' ausführen.")
+        options = ort.SessionOptions()
+        if threads is None:
+            threads = int(os.environ.get("SLM_THREADS", "0") or 0)
+        if threads > 0:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+
+        def session(p):
+            return ort.InferenceSession(p, options, providers=["CPUExecutionProvider"])
+
+        self.window = session(path)
+        meta = self.window.get_modelmeta().custom_metadata_map
+        self.meta = {key: json.loads(value) for key, value in meta.items()}
+        self.max_len = self.meta["max_len"]
+        self.vocab_size = self.meta["vocab_size"]
+
+        if kv_path is None and path.endswith(".onnx"):
+            kv_path = path[:-len(".onnx")] + ".kv.onnx"
+        self.kv = session(kv_path) if kv_path and os.path.exists(kv_path) else None
+        self._past = None
+
+    def window_logits(self, ids):
+        """Letzte Logits (B, V) für ein ganzes Fenster (ohne Cache)."""
+        ids = np.ascontiguousarray(ids[:, -self.max_len:], dtype=np.int64)
+        return self.window.run(["logits"], {"ids": ids})[0][:, -1]
+
+    def start(self, ids):
+        """Cache mit dem Prompt füllen, gibt die letzten Logits (B, V) zurück."""
+        m = self.meta
+        empty = np.zeros((m["layers"], len(ids), m["heads"], 0, m["head_dim"]), dtype=np.float32)
+        self._past = (empty, empty)
+        return self._run_kv(ids[:, -self.max_len:])
+
+    def step(self, next_ids):
+        """Ein neues Token je Zeile (B,) anhängen, gibt die Logits (B, V) zurück."""
+        return self._run_kv(np.asarray(next_ids).reshape(-1, 1))
+
+    @property
+    def cache_len(self):
+        return 0 if self._past is None else self._past[0].shape[3]
+
+    def _run_kv(self, ids):
+        logits, k, v = self.kv.run(None, {
+            "ids": np.ascontiguousarray(ids, dtype=np.int64),
+            "past_k": self._past[0],
+            "past_v": self._past[1],
+        })
+        self._past = (k, v)
+        return logits[:, -1]
+
+
+# ---------------------------
+# Sampling mit numpy (wie generation.py)
+# ---------------------------
+def log_softmax(logits):
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    return shifted - np.log(np.exp(shifted).sum(axis=-1, keepdims=True))
+
+
+def apply_penalties(logits, counts, repetition_penalty=1.0,
+                    frequency_penalty=0.0, presence_penalty=0.0):
+    seen = counts > 0
+    if repetition_penalty != 1.0:
+        penalized = np.where(logits > 0, logits / repetition_penalty,
+                             logits * repetition_penalty)
+        logits = np.where(seen, penalized, logits)
+    if frequency_penalty or presence_penalty:
+        logits = logits - frequency_penalty * counts - presence_penalty * seen
+    return logits
+
+
+def no_repeat_ngram_mask(seq, n, vocab_size):
+    """(B, V)-Maske der Tokens, die ein schon vorhandenes n-Gramm wiederholen würden."""
+    B, L = seq.shape
+    banned = np.zeros((B, vocab_size), dtype=bool)
+    if n <= 0 or L < n:
+        return banned
+    grams = np.lib.stride_tricks.sliding_window_view(seq, n, axis=1)  # (B, L-n+1, n)
+    hit = (grams[:, :, :-1] == seq[:, None, L - n + 1:]).all(-1)
+    rows, cols = np.nonzero(hit)
+    banned[rows, grams[rows, cols, -1]] = True
+    return banned
+
+
+def sample_next_ids(logits, rng, temperature=0.4, top_k=30, top_p=None, counts=None,
+                    repetition_penalty=1.0, frequency_penalty=0.0, presence_penalty=0.0,
+                    banned=None):
+    """logits: (B, V) -> nächste Token-Ids (B,)."""
+    logits = logits.astype(np.float64)
+    if counts is not None:
+        logits = apply_penalties(logits, counts, repetition_penalty,
+                                 frequency_penalty, presence_penalty)
+    if banned is not None:
+        banned = banned & ~banned.all(axis=-1, keepdims=True)
+        logits = np.where(banned, -np.inf, logits)
+
+    logits = logits / max(temperature, 1e-6)
+    if top_k is not None and 0 < top_k < logits.shape[-1]:
+        kth = np.partition(logits, -top_k, axis=-1)[:, -top_k:].min(axis=-1, keepdims=True)
+        logits = np.where(logits < kth, -np.inf, logits)
+
+    probs = np.exp(log_softmax(logits))
+    if top_p is not None and 0.0 < top_p < 1.0:
+        order = np.argsort(-probs, axis=-1, kind="stable")
+        sorted_probs = np.take_along_axis(probs, order, axis=-1)
+        remove = np.zeros_like(sorted_probs, dtype=bool)
+        np.put_along_axis(remove, order, (sorted_probs.cumsum(axis=-1) - sorted_probs) > top_p,
+                          axis=-1)
+        probs = np.where(remove, 0.0, probs)
+        probs /= probs.sum(axis=-1, keepdims=True)
+
+    # inverse CDF, eine Zufallszahl pro Zeile
+    u = rng.random((probs.shape[0], 1))
+    return np.minimum((probs.cumsum(axis=-1) < u).sum(axis=-1), probs.shape[-1] - 1)
+
+
+def generate(lm, tok, prompt, n=1, steps=80, temperature=0.4, block_size=64,
+             return_logprobs=False, use_kv_cache=True, seed=None, refill_keep=None,
+             **sampling):
+    """
+    Wie generation.generate(), aber über ONNX Runtime und numpy.
+
+    KV-Cache am Fensterende: die Positionen sind absolut, der Cache lässt
+    sich also nicht vorne kürzen. Ist er voll (block_size Tokens), wird er
+    mit den letzten refill_keep Tokens (Standard: halbes Fenster) neu
+    vorgefüllt, danach geht es wieder Token für Token weiter – ein
+    Vorfüllen pro block_size - refill_keep erzeugten Tokens. Dafür sieht
+    das Modell direkt nach dem Vorfüllen nur refill_keep Tokens Kontext
+    (PyTorch und der Fenster-Graph immer block_size); Texte über das
+    Fenster hinaus weichen deshalb ab. refill_keep=block_size rechnet
+    exakt wie PyTorch, füllt dann aber bei jedem Token neu vor.
+    """
+    opts = {**DEFAULT_SAMPLING, **sampling}
+    ngram = opts.pop("no_repeat_ngram", 0) or 0
+    rng = np.random.default_rng(seed)
+    block_size = min(block_size, lm.max_len)
+    use_kv_cache = use_kv_cache and lm.kv is not None
+    keep = block_size // 2 if refill_keep is None else refill_keep
+    keep = max(1, min(keep, block_size))
+
+    # Text oder schon encodierte Ids (wie generation.prompt_tokens)
+    tokens = (tok.encode(prompt) if isinstance(prompt, str) else list(prompt))[-block_size:]
+    idx = np.array([tokens] * n, dtype=np.int64)
+    detoks = [IncrementalDetokenizer(tok) for _ in range(n)]
+    for d in detoks:
+        d.push_many(tokens)
+
+    # Strafen zählen das Prompt-Fenster mit (wie generation.generate)
+    counts = np.zeros((n, lm.vocab_size))
+    np.add.at(counts, (slice(None), idx[0]), 1)
+    logprobs = np.zeros(n)
+    logits = lm.start(idx) if use_kv_cache else None
+    for _ in range(steps):
+        if idx.shape[1] > block_size:
+            idx = idx[:, -block_size:]
+        if not use_kv_cache:
+            logits = lm.window_logits(idx)
+
+        banned = no_repeat_ngram_mask(idx, ngram, lm.vocab_size) if ngram else None
+        next_ids = sample_next_ids(logits, rng, temperature=temperature, counts=counts,
+                                   banned=banned, **opts)
+        counts[np.arange(n), next_ids] += 1
+        logprobs += log_softmax(logits.astype(np.float64))[np.arange(n), next_ids]
+        idx = np.concatenate([idx, next_ids[:, None]], axis=1)
+        for d, i in zip(detoks, next_ids.tolist()):
+            d.push(i)
+
+        if use_kv_cache:
+            # Fenster voll: absolute Positionen verschieben sich -> mit den
+            # letzten `keep` Tokens neu vorfüllen
+            if lm.cache_len + 1 > block_size:
+                logits = lm.start(idx[:, -keep:])
+            else:
+                logits = lm.step(next_ids)
+
+    for d in detoks:
+        d.flush()
+    if not return_logprobs:
+        return [d.text for d in detoks]
+    return [
+        {"text": d.text, "logprob": lp, "tokens": steps}
+        for d, lp in zip(detoks, logprobs.tolist())
+    ]
@@ -0,0 +1,249 @@
+# output_head.py
+"""
+Billigere Ausgabeschicht.
+
+Training: MiniGPT(adaptive_cutoffs=[...]) benutzt nn.AdaptiveLogSoftmaxWithLoss
+(train.py: adaptive_cutoffs = "16,40"). Die Token-Ids werden dafür nach
+Häufigkeit umsortiert (token_counts -> model.set_vocab_order).
+
+Inferenz: LogitShortlist rechnet die Logits zuerst nur für die häufigsten
+Tokens. Eine obere Schranke für alle übrigen Tokens entscheidet, ob das
+reicht:
+- normaler fc-Kopf:  w·h + b <= |w|·|h| + b   (Cauchy-Schwarz)
+- Adaptive-Kopf:     log p(Token) <= log p(sein Cluster)
+Liegt das k-te Shortlist-Logit (nach Strafen) über der Schranke, stehen
+alle Top-k-Tokens sicher in der Shortlist und das Sampling ist exakt wie
+mit dem vollen Vokabular. Sonst wird das volle Vokabular gerechnet.
+
+    python output_head.py --text grundwissen.txt --shortlist 16 32
+    python output_head.py --train-batches 200     # zusätzlich fc vs. Adaptive trainieren
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import torch
+import torch.nn.functional as F
+
+
+def token_counts(encoded, vocab_size, chunk=1 << 22):
+    """Häufigkeit jedes Tokens (Liste, Array oder ShardedTokens)."""
+    counts = torch.zeros(vocab_size, dtype=torch.long)
+    for start in range(0, len(encoded), chunk):
+        part = torch.as_tensor(encoded[start:start + chunk], dtype=torch.long)
+        counts += torch.bincount(part, minlength=vocab_size)
+    return counts
+
+
+class LogitShortlist:
+    """
+    shortlist = LogitShortlist(model, token_counts(encoded, vocab), size=32)
+    generate(model, tok, prompt, shortlist=shortlist)
+
+    Experimentell: nur für generate() ohne return_logprobs (nicht Best-of-N),
+    und nur schneller, wenn die Schranke meistens greift (siehe Benchmark).
+
+    Beim Adaptive-Kopf ist die Shortlist dessen Kopf (size wird ignoriert).
+    """
+
+    def __init__(self, model, counts=None, size=None):
+        self.model = model
+        self.calls = 0
+        self.fallbacks = 0
+
+        if model.adaptive is not None:
+            # Rang r < cutoffs[0] -> Token steht im Kopf
+            self.size = model.adaptive.shortlist_size
+            self.short_ids = torch.argsort(model.vocab_rank)[:self.size]
+            self.vocab_size = model.vocab_rank.numel()
+            return
+
+        if counts is None:
+            raise ValueError("Für den fc-Kopf braucht die Shortlist Token-Häufigkeiten.")
+        weight = model.fc.weight.detach()
+        bias = model.fc.bias.detach()
+        self.vocab_size = weight.size(0)
+        self.size = min(size or max(1, self.vocab_size // 4), self.vocab_size)
+
+        order = torch.argsort(torch.as_tensor(counts), descending=True, stable=True)
+        order = order.to(weight.device)
+        self.short_ids = order[:self.size]
+        tail_ids = order[self.size:]
+        self.short_weight = weight[self.short_ids].contiguous()
+        self.short_bias = bias[self.short_ids].contiguous()
+        self.tail_norm = weight[tail_ids].norm(dim=-1)
+        self.tail_bias = bias[tail_ids]
+
+    @torch.no_grad()
+    def logits(self, h):
+        """
+        h: (B, embed_dim) -> (Logits (B, V) mit -inf außerhalb der Shortlist,
+        obere Schranke (B,) für jedes Logit außerhalb der Shortlist).
+        """
+        self.calls += 1
+        h = h.float()
+        if self.model.adaptive is None:
+            short = F.linear(h, self.short_weight, self.short_bias)
+            if self.tail_norm.numel():
+                bound = (h.norm(dim=-1, keepdim=True) * self.tail_norm + self.tail_bias).amax(-1)
+            else:
+                bound = h.new_full((h.size(0),), float("-inf"))
+        else:
+            head_logp = F.log_softmax(self.model.adaptive.head(h), dim=-1)
+            short = head_logp[:, :self.size]
+            bound = head_logp[:, self.size:].amax(-1)  # bestes Cluster
+
+        logits = h.new_full((h.size(0), self.vocab_size), float("-inf"))
+        logits[:, self.short_ids] = short
+        return logits, bound
+
+    @torch.no_grad()
+    def full_logits(self, h):
+        """Rückfall: volles Vokabular."""
+        self.fallbacks += 1
+        return self.model.head(h.float()).float()
+
+    @staticmethod
+    def penalties_keep_bound(repetition_penalty=1.0, frequency_penalty=0.0,
+                             presence_penalty=0.0):
+        """
+        True, wenn die Strafen Logits nur senken (repetition_penalty >= 1,
+        frequency/presence_penalty >= 0). Sonst kann ein Token außerhalb der
+        Shortlist über die Schranke steigen – dann gilt covers() nicht.
+        """
+        return repetition_penalty >= 1.0 and frequency_penalty >= 0 and presence_penalty >= 0
+
+    @staticmethod
+    def covers(logits, bound, top_k):
+        """
+        True, wenn die Top-k aller Zeilen sicher in der Shortlist liegen.
+        Setzt voraus, dass Strafen und Sperren Logits nur senken
+        (siehe penalties_keep_bound()). Ohne Top-k (reines Top-p) lässt sich
+        das nicht garantieren.
+        """
+        if top_k is None or top_k <= 0 or top_k > logits.size(-1):
+            return False
+        kth = torch.topk(logits, k=top_k, dim=-1).values[:, -1]
+        return bool((kth >= bound).all())
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "calls": self.calls,
+            "fallbacks": self.fallbacks,
+            "fallback_rate": self.fallbacks / self.calls if self.calls else 0.0,
+        }
+
+
+# ---------------------------
+# Benchmark
+# ---------------------------
+def _time_generate(model, tok, prompts, steps, n, shortlist, seed, top_k):
+    from generation import generate
+
+    torch.manual_seed(seed)
+    t0 = time.perf_counter()
+    texts = [
+        generate(model, tok, p, n=n, steps=steps, block_size=model.pos.num_embeddings,
+                 shortlist=shortlist, top_k=top_k)
+        for p in prompts
+    ]
+    seconds = time.perf_counter() - t0
+    return texts, len(prompts) * n * steps / seconds
+
+
+def _time_head(fn, h, repeats):
+    fn(h)
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        fn(h)
+    return (time.perf_counter() - t0) / repeats * 1e6
+
+
+def benchmark_inference(model, tok, encoded, sizes, prompts, steps=64, n=5, seed=0, top_k=30):
+    """Kopf allein + ganze Generierung: volles Vokabular gegen Shortlist."""
+    counts = token_counts(encoded, len(tok.vocab))
+    h = torch.randn(n, model.pos.embedding_dim)
+    print(f"Vokabular: {len(tok.vocab)} Tokens | {len(prompts)} Prompts x {n} Kandidaten x "
+          f"{steps} Schritte | top_k={top_k}")
+
+    full_us = _time_head(model.head, h, 2000)
+    base_texts, base_tps = _time_generate(model, tok, prompts, steps, n, None, seed, top_k)
+    print(f"  voll          : Kopf {full_us:7.1f} µs | {base_tps:7.0f} Tokens/s")
+
+    for size in sizes:
+        shortlist = LogitShortlist(model, counts, size=size)
+        head_us = _time_head(shortlist.logits, h, 2000)
+        shortlist.calls = 0
+        texts, tps = _time_generate(model, tok, prompts, steps, n, shortlist, seed, top_k)
+        same = sum(a == b for x, y in zip(base_texts, texts) for a, b in zip(x, y))
+        total = sum(len(x) for x in texts)
+        st = shortlist.stats()
+        print(f"  Shortlist {st['size']:4d}: Kopf {head_us:7.1f} µs | {tps:7.0f} Tokens/s "
+              f"({tps / base_tps:.2f}x) | Rückfall {st['fallback_rate']:.1%} | "
+              f"gleiche Texte {same}/{total}")
+
+
+def benchmark_training(text_file, tokenizer_file, cutoffs, batches, threads=0):
+    """Zwei kleine Trainingsläufe (fc gegen Adaptive Softmax) mit gleichem Seed."""
+    from train import merge_config, train
+
+    rows = []
+    for name, cut in (("fc", ""), ("adaptive " + cutoffs, cutoffs)):
+        with tempfile.TemporaryDirectory() as out_dir:
+            cfg = merge_config({
+                "text_file": text_file,
+                "tokenizer_file": os.path.abspath(tokenizer_file),
+                "out_dir": out_dir,
+                "epochs": 1,
+                "batches_per_epoch": batches,
+                "eval_interval": 0,
+                "threads": threads,
+                "adaptive_cutoffs": cut,
+            })
+            rows.append((name, train(cfg)))
+
+    print(f"\n{'Kopf':<20} {'Tokens/s':>10} {'train_loss':>11} {'val_ppl':>9}")
+    for name, m in rows:
+        print(f"{name:<20} {m['tokens_per_sec']:>10.0f} {m['train_loss']:>11.4f} "
+              f"{m['val_ppl'] or float('nan'):>9.3f}")
+
+
+def main():
+    from evaluate import load_model_for_eval
+    from tokenizer import BPETokenizer
+
+    parser = argparse.ArgumentParser(description="Shortlist / Adaptive Softmax messen")
+    parser.add_argument("--model", default="minigpt_grundwissen.pt")
+    parser.add_argument("--tokenizer", default="tokenizer.json")
+    parser.add_argument("--text", default="grundwissen.txt")
+    parser.add_argument("--shortlist", type=int, nargs="+", default=[16, 32, 48])
+    parser.add_argument("--steps", type=int, default=64)
+    parser.add_argument("--n", type=int, default=5)
+    parser.add_argument("--top-k", type=int, default=30)
+    parser.add_argument("--train-batches", type=int, default=0,
+                        help="> 0: zusätzlich fc gegen Adaptive Softmax trainieren")
+    parser.add_argument("--cutoffs", default="16,40")
+    parser.add_argument("--threads", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    tok = BPETokenizer.load(args.tokenizer)
+    with open(args.text, "r", encoding="utf8") as f:
+        text = f.read()
+    encoded = tok.encode(text)
+
+    model = load_model_for_eval(args.model)
+    prompts = ["Die Sonne ist", "Wasser besteht aus", "Warum ist der Himmel blau?"]
+    benchmark_inference(model, tok, encoded, args.shortlist, prompts, steps=args.steps, n=args.n,
+                        top_k=args.top_k)
+
+    if args.train_batches > 0:
+        benchmark_training(args.text, args.tokenizer, args.cutoffs, args.train_batches,
+                           threads=args.threads)
+
+
+if __name__ == "__main__":
+    main()
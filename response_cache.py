@@ -0,0 +1,167 @@
+# response_cache.py
+"""
+Antwort-Cache für wiederholte Prompts.
+
+Gespeichert werden die Kandidaten einer Generierung (Text + Modell-Score),
+nicht nur die beste Antwort – das Reranking (Stil-Gewicht usw.) läuft bei
+einem Treffer einfach noch einmal über die gespeicherten Kandidaten.
+
+Der Schlüssel enthält alles, was die Kandidaten beeinflusst:
+normalisierter Prompt, verwendeter Kontext, Temperatur, Kandidatenzahl,
+übrige Sampling-Einstellungen (Top-k/Top-p, Strafen, Schritte ...),
+Modell-Hash und Seed-Politik. Bei zufälligem Sampling ("random") wird nur
+bis CACHE_MAX_TEMPERATURE gecacht – darüber soll jede Anfrage neu würfeln.
+
+- LRU: höchstens max_entries Einträge, der am längsten unbenutzte fliegt raus
+- TTL: Einträge verfallen nach ttl_seconds
+- bleibt als kleine JSON-Datei über Neustarts erhalten
+"""
+import hashlib
+import json
+import os
+import time
+import unicodedata
+from collections import OrderedDict
+
+CACHE_FILE = "response_cache.json"
+CACHE_VERSION = 2
+CACHE_MAX_TEMPERATURE = 0.5
+SEED_POLICIES = ("random", "fixed")
+
+
+def normalize_prompt(prompt):
+    """Unicode-NFC + Leerraum zusammenfassen (Groß/Klein bleibt – das Modell sieht es)."""
+    return " ".join(unicodedata.normalize("NFC", prompt).split())
+
+
+def model_fingerprint(path):
+    """SHA-256 der Modelldatei (ändert sich das Modell, ist der Cache ungültig)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_key(prompt, context, temperature, n_cand, model_hash, seed_policy="random",
+              sampling=None):
+    """
+    Schlüssel aus allem, was die erzeugten Kandidaten beeinflusst.
+    sampling: weitere Einstellungen für generate()/best_of_n() als Dict.
+    """
+    if seed_policy not in SEED_POLICIES:
+        raise ValueError(f"Unbekannte Seed-Politik '{seed_policy}' ({', '.join(SEED_POLICIES)})")
+    parts = [
+        normalize_prompt(prompt),
+        normalize_prompt(context or ""),
+        round(float(temperature), 3),
+        int(n_cand),
+        model_hash,
+        seed_policy,
+        sorted((sampling or {}).items()),
+    ]
+    raw = json.dumps(parts, ensure_ascii=False).encode("utf8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+def seed_from_key(key):
+    """Fester Seed pro Schlüssel (für seed_policy="fixed")."""
+    return int(key[:16], 16) % (2 ** 63)
+
+
+class ResponseCache:
+    def __init__(self, path=CACHE_FILE, max_entries=500, ttl_seconds=7 * 24 * 3600,
+                 max_temperature=CACHE_MAX_TEMPERATURE, clock=time.time):
+        self.path = path
+        self.clock = clock  # austauschbar (Tests)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_temperature = max_temperature
+        self.entries = OrderedDict()  # key -> {"created": ts, "candidates": [...]}
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        if path and os.path.exists(path):
+            self._load()
+
+    def cacheable(self, temperature, seed_policy="random"):
+        """Fester Seed: immer. Zufall: nur bei niedriger Temperatur."""
+        return seed_policy == "fixed" or temperature <= self.max_temperature
+
+    # ---------------------------------------------------------
+    # Zugriff
+    # ---------------------------------------------------------
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None and self._is_expired(entry):
+            del self.entries[key]
+            self.expired += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry["candidates"]
+
+    def put(self, key, candidates):
+        """candidates: Liste von Dicts mit mindestens "text" (z.B. aus best_of_n)."""
+        self.entries[key] = {
+            "created": self.clock(),
+            "candidates": [{"text": c["text"], "score": c.get("score")} for c in candidates],
+        }
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
+
+    # ---------------------------------------------------------
+    # Speichern / Laden
+    # ---------------------------------------------------------
+    def save(self):
+        if not self.path:
+            return
+        self._prune()
+        data = {"version": CACHE_VERSION, "entries": list(self.entries.items())}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            print("Warnung: Antwort-Cache unlesbar, starte leer.")
+            return
+        if data.get("version") != CACHE_VERSION:
+            return
+        # Reihenfolge in der Datei = LRU-Reihenfolge
+        self.entries = OrderedDict((key, entry) for key, entry in data.get("entries", []))
+        self._prune()
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _is_expired(self, entry):
+        return self.ttl_seconds is not None and self.clock() - entry["created"] > self.ttl_seconds
+
+    def _prune(self):
+        for key in [k for k, e in self.entries.items() if self._is_expired(e)]:
+            del self.entries[key]
+            self.expired += 1
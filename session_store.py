@@ -0,0 +1,233 @@
+# session_store.py
+"""
+Viele Gesprächs-Sitzungen gleichzeitig (z.B. für einen Server).
+
+- jede Sitzung ist ein ContextManager mit Ringpuffer (deque) aus Turns
+- Turns benutzen __slots__ und merken sich ihre Token-Ids
+- Speicher pro Sitzung wird gemessen; über alle Sitzungen gilt max_bytes
+- wird das Limit überschritten oder ist eine Sitzung zu lange ungenutzt,
+  fliegt die am längsten unbenutzte Sitzung raus – mit spill_dir wird sie
+  vorher als kleine JSON-Datei ausgelagert und beim nächsten Zugriff
+  wieder geladen
+
+    store = SessionStore(max_bytes=64 * 1024 * 1024, spill_dir="sessions", tok=tok)
+    ctx = store.get(user_id)
+    ids = ctx.encode(prompt, tok)
+    ...
+    store.add_turn(user_id, prompt, answer)
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+
+from context_manager import ContextManager, Turn
+
+
+class Session(ContextManager):
+    """ContextManager mit Id, letzter Nutzung und gemessenem Speicher."""
+
+    __slots__ = ("session_id", "last_used", "nbytes")
+
+    def __init__(self, session_id, max_history=10):
+        super().__init__(max_history=max_history)
+        self.session_id = session_id
+        self.last_used = time.time()
+        self.nbytes = self.measure()
+
+    def measure(self) -> int:
+        """Speicher der Sitzung: Objekt + Ringpuffer + alle Turns."""
+        total = sys.getsizeof(self) + sys.getsizeof(self.history) + sys.getsizeof(self.session_id)
+        return total + sum(turn.nbytes() for turn in self.history)
+
+    def to_dict(self):
+        return {
+            "session_id": self.session_id,
+            "last_used": self.last_used,
+            "turns": [[t.prompt, t.answer, t.created] for t in self.history],
+        }
+
+    @classmethod
+    def from_dict(cls, data, max_history=10):
+        session = cls(data["session_id"], max_history=max_history)
+        session.last_used = data.get("last_used", time.time())
+        for prompt, answer, created in data["turns"]:
+            session.history.append(Turn(prompt, answer, created))
+        return session
+
+
+class SessionStore:
+    def __init__(self, max_history=10, max_bytes=64 * 1024 * 1024, idle_seconds=30 * 60,
+                 spill_dir=None, tok=None):
+        self.max_history = max_history
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.spill_dir = spill_dir
+        self.tok = tok  # wenn gesetzt: Token-Ids gleich beim Speichern berechnen
+        self.sessions = OrderedDict()  # session_id -> Session, am längsten unbenutzt zuerst
+        self.total_bytes = 0
+        self.evicted = 0
+        self.spilled = 0
+        self.restored = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    # ---------------------------------------------------------
+    # Öffentliche API
+    # ---------------------------------------------------------
+    def get(self, session_id) -> Session:
+        """Sitzung holen (aus dem Speicher, von der Platte oder neu)."""
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self._restore(session_id) or Session(session_id, self.max_history)
+            self.sessions[session_id] = session
+            self.total_bytes += session.nbytes
+        else:
+            self.sessions.move_to_end(session_id)
+        session.last_used = time.time()
+        self._enforce_limits(keep=session_id)
+        return session
+
+    def add_turn(self, session_id, prompt, answer):
+        """Prompt/Antwort an die Sitzung anhängen (älteste fallen aus dem Ringpuffer)."""
+        session = self.get(session_id)
+        session.update(prompt, answer)
+        if self.tok is not None:
+            turn = session.history[-1]
+            turn.prompt_ids(self.tok)
+            turn.answer_ids(self.tok)
+        self._remeasure(session)
+        self._enforce_limits(keep=session_id)
+        return session
+
+    def drop(self, session_id):
+        """Sitzung ganz vergessen (auch auf der Platte)."""
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            self.total_bytes -= session.nbytes
+        path = self._spill_path(session_id)
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    def evict_idle(self, now=None):
+        """Alle Sitzungen auslagern/entfernen, die länger als idle_seconds ruhen."""
+        now = time.time() if now is None else now
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if now - session.last_used <= self.idle_seconds:
+                break
+            self._evict_oldest()
+
+    def flush(self):
+        """Alle Sitzungen auf die Platte schreiben (z.B. beim Beenden)."""
+        if self.spill_dir:
+            for session in self.sessions.values():
+                self._spill(session)
+
+    def stats(self):
+        n = len(self.sessions)
+        return {
+            "sessions": n,
+            "bytes": self.total_bytes,
+            "bytes_per_session": self.total_bytes / n if n else 0.0,
+            "max_session_bytes": max((s.nbytes for s in self.sessions.values()), default=0),
+            "evicted": self.evicted,
+            "spilled": self.spilled,
+            "restored": self.restored,
+        }
+
+    # ---------------------------------------------------------
+    # Intern
+    # ---------------------------------------------------------
+    def _remeasure(self, session):
+        before = session.nbytes
+        session.nbytes = session.measure()
+        self.total_bytes += session.nbytes - before
+
+    def _enforce_limits(self, keep=None):
+        self.evict_idle()
+        while self.total_bytes > self.max_bytes and self.sessions:
+            if next(iter(self.sessions)) == keep:
+                break  # nur noch die aktive Sitzung übrig
+            self._evict_oldest()
+
+    def _evict_oldest(self):
+        session_id, session = self.sessions.popitem(last=False)
+        self.total_bytes -= session.nbytes
+        self.evicted += 1
+        if self.spill_dir:
+            self._spill(session)
+
+    def _spill_path(self, session_id):
+        if not self.spill_dir:
+            return None
+        name = hashlib.sha1(str(session_id).encode("utf8")).hexdigest()
+        return os.path.join(self.spill_dir, name + ".json")
+
+    def _spill(self, session):
+        path = self._spill_path(session.session_id)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf8") as f:
+            json.dump(session.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self.spilled += 1
+
+    def _restore(self, session_id):
+        path = self._spill_path(session_id)
+        if not path or not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf8") as f:
+            session = Session.from_dict(json.load(f), max_history=self.max_history)
+        os.remove(path)
+        if self.tok is not None:
+            for turn in session.history:
+                turn.prompt_ids(self.tok)
+                turn.answer_ids(self.tok)
+        session.nbytes = session.measure()
+        self.restored += 1
+        return session
+
+
+def main():
+    """Simuliert viele Sitzungen und zeigt Speicher pro Sitzung + Limit."""
+    import random
+    import tempfile
+    import tracemalloc
+
+    parser = argparse.ArgumentParser(description="Sitzungsspeicher messen")
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--turns", type=int, default=12)
+    parser.add_argument("--max-mb", type=float, default=16.0)
+    args = parser.parse_args()
+
+    words = "Sonne Energie Wasser Atome bestehen aus Protonen und Neutronen warum wie".split()
+
+    def text(n):
+        return " ".join(random.choice(words) for _ in range(n))
+
+    with tempfile.TemporaryDirectory() as spill:
+        tracemalloc.start()
+        store = SessionStore(max_bytes=int(args.max_mb * 1024 * 1024), spill_dir=spill)
+        t0 = time.time()
+        for _ in range(args.turns):
+            for sid in range(args.sessions):
+                store.add_turn(sid, text(8), text(30))
+        seconds = time.time() - t0
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        st = store.stats()
+        n_turns = args.sessions * args.turns
+        print(f"{n_turns} Turns in {seconds:.2f} s ({n_turns / seconds:.0f}/s)")
+        print(f"Im Speicher: {st['sessions']} Sitzungen | gemessen {st['bytes'] / 2**20:.1f} MB "
+              f"(Limit {args.max_mb:.1f} MB) | {st['bytes_per_session']:.0f} B/Sitzung")
+        print(f"Ausgelagert: {st['spilled']} | zurückgeholt: {st['restored']} | "
+              f"tracemalloc aktuell {current / 2**20:.1f} MB, Spitze {peak / 2**20:.1f} MB")
+        assert st["bytes"] <= store.max_bytes
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# shared_weights.py
+"""
+Modellgewichte per Memory-Mapping laden, damit mehrere Prozesse auf einem
+Rechner dieselben physischen Speicherseiten benutzen.
+
+Zwei Wege:
+- Flache Gewichtsdatei (*.weights, siehe export_weights): alle Tensoren
+  hintereinander, 64-Byte-ausgerichtet, wird mit torch.from_file gemappt
+- normale .pt-Datei: torch.load(..., mmap=True)
+
+In beiden Fällen liegen die Gewichte im Page-Cache des Betriebssystems;
+ein weiterer Prozess kostet nur noch seine Aktivierungen.
+
+Format der .weights-Datei (little-endian):
+    b"SLMW" | Version u32 | Kopf-Länge u64 | JSON-Kopf | Tensoren (je 64-Byte-ausgerichtet)
+Der JSON-Kopf enthält pro Tensor Name, dtype, Form und Byte-Offset.
+"""
+import argparse
+import json
+import os
+import struct
+import subprocess
+import sys
+import time
+
+import torch
+
+from model import MiniGPT, config_from_state_dict
+
+WEIGHTS_MAGIC = b"SLMW"
+WEIGHTS_VERSION = 1
+ALIGN = 64
+_PREFIX = struct.Struct("<4sIQ")
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def export_weights(state_dict, path):
+    """state_dict als flache, mmap-fähige Datei speichern (atomar)."""
+    entries = []
+    offset = 0
+    for name, tensor in state_dict.items():
+        tensor = tensor.detach().cpu().contiguous()
+        nbytes = tensor.numel() * tensor.element_size()
+        entries.append({
+            "name": name,
+            "dtype": str(tensor.dtype).replace("torch.", ""),
+            "shape": list(tensor.shape),
+            "offset": offset,
+            "nbytes": nbytes,
+        })
+        offset = _align(offset + nbytes)
+
+    header = json.dumps({"byteorder": sys.byteorder, "tensors": entries}).encode("utf8")
+    data_start = _align(_PREFIX.size + len(header))
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_PREFIX.pack(WEIGHTS_MAGIC, WEIGHTS_VERSION, len(header)))
+        f.write(header)
+        for entry, tensor in zip(entries, state_dict.values()):
+            f.seek(data_start + entry["offset"])
+            f.write(tensor.detach().cpu().contiguous().reshape(-1).view(torch.uint8).numpy().tobytes())
+        f.truncate(data_start + offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def is_weights_file(path):
+    with open(path, "rb") as f:
+        return f.read(len(WEIGHTS_MAGIC)) == WEIGHTS_MAGIC
+
+
+def map_weights(path):
+    """
+    Mappt eine .weights-Datei und gibt ein state_dict aus Views darauf zurück.
+    Copy-on-write: Schreibzugriffe landen nie in der Datei.
+    """
+    with open(path, "rb") as f:
+        magic, version, header_len = _PREFIX.unpack(f.read(_PREFIX.size))
+        if magic != WEIGHTS_MAGIC:
+            raise ValueError(f"{path} ist keine Gewichtsdatei.")
+        if version != WEIGHTS_VERSION:
+            raise ValueError(f"Unbekannte Gewichts-Version {version} (erwartet {WEIGHTS_VERSION}).")
+        header = json.loads(f.read(header_len).decode("utf8"))
+    if header["byteorder"] != sys.byteorder:
+        raise ValueError("Gewichtsdatei hat eine andere Byte-Reihenfolge.")
+
+    size = os.path.getsize(path)
+    data_start = _align(_PREFIX.size + header_len)
+    buf = torch.from_file(path, shared=False, size=size, dtype=torch.uint8)
+
+    state_dict = {}
+    for entry in header["tensors"]:
+        dtype = getattr(torch, entry["dtype"])
+        start = data_start + entry["offset"]
+        raw = buf[start:start + entry["nbytes"]]
+        state_dict[entry["name"]] = raw.view(dtype).view(entry["shape"])
+    return state_dict
+
+
+def load_state_dict_shared(path):
+    """state_dict gemappt laden (.weights-Datei oder normale .pt-Datei)."""
+    if is_weights_file(path):
+        return map_weights(path)
+    obj = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    return obj["model"] if "model" in obj else obj
+
+
+def load_model_shared(path, heads=4, device="cpu"):
+    """
+    MiniGPT, dessen Gewichte direkt auf die gemappte Datei zeigen
+    (auf der GPU natürlich als eigene Kopie).
+    """
+    state_dict = load_state_dict_shared(path)
+    with torch.device("meta"):
+        model = MiniGPT(**config_from_state_dict(state_dict, heads=heads))
+    model.load_state_dict(state_dict, assign=True)
+    model.to(device)
+    model.eval()
+    return model
+
+
+# ---------------------------
+# Prüfen: teilen sich Prozesse wirklich die Seiten?
+# ---------------------------
+def _mapping_kb(path):
+    """(RSS, PSS) der Mappings von `path` im aktuellen Prozess in kB (nur Linux)."""
+    path = os.path.realpath(path)
+    rss = pss = 0
+    inside = False
+    with open("/proc/self/smaps", "r") as f:
+        for line in f:
+            parts = line.split()
+            if "-" in parts[0] and len(parts) >= 5:  # Kopfzeile eines Mappings
+                inside = len(parts) >= 6 and parts[5] == path
+            elif inside and parts[0] == "Rss:":
+                rss += int(parts[1])
+            elif inside and parts[0] == "Pss:":
+                pss += int(parts[1])
+    return rss, pss
+
+
+def _child(path, seconds):
+    model = load_model_shared(path)
+    with torch.no_grad():  # alle Gewichte einmal anfassen
+        model(torch.zeros(1, 8, dtype=torch.long))
+        for p in model.parameters():
+            p.sum()
+    rss, pss = _mapping_kb(path)
+    print(json.dumps({"rss_kb": rss, "pss_kb": pss}), flush=True)
+    time.sleep(seconds)
+
+
+def check_sharing(path, processes=3):
+    """Startet mehrere Prozesse mit demselben Modell und zeigt RSS/PSS."""
+    if not os.path.exists("/proc/self/smaps"):
+        print("Speicher-Check braucht Linux (/proc/self/smaps).")
+        return
+    weights_mb = os.path.getsize(path) / 1e6
+    procs = [
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--child", path],
+            stdout=subprocess.PIPE, text=True,
+        )
+        for _ in range(processes)
+    ]
+    # alle leben gleichzeitig, während gemessen wird
+    reports = [json.loads(p.stdout.readline()) for p in procs]
+    for p in procs:
+        p.wait()
+    print(f"Gewichte: {weights_mb:.1f} MB | {processes} Prozesse")
+    for i, r in enumerate(reports):
+        print(f"  Prozess {i}: Gewichte RSS {r['rss_kb'] / 1024:.1f} MB | "
+              f"PSS {r['pss_kb'] / 1024:.1f} MB")
+    print("(PSS teilt geteilte Seiten durch die Anzahl der Nutzer -> ~ Größe / Prozesse)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flache, mmap-fähige Gewichtsdatei erzeugen")
+    parser.add_argument("src", help="state_dict / Checkpoint (.pt)")
+    parser.add_argument("dst", nargs="?", help="Ziel (.weights)")
+    parser.add_argument("--check", type=int, default=0, metavar="N",
+                        help="danach N Prozesse starten und Speicher messen")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.src, seconds=2.0)
+        return
+
+    obj = torch.load(args.src, map_location="cpu", weights_only=True)
+    state_dict = obj["model"] if "model" in obj else obj
+    dst = args.dst or os.path.splitext(args.src)[0] + ".weights"
+    export_weights(state_dict, dst)
+
+    mapped = map_weights(dst)
+    for name, tensor in state_dict.items():
+        assert torch.equal(mapped[name], tensor), f"{name} weicht ab"
+    print(f"✅ {args.src} -> {dst} ({os.path.getsize(dst) / 1e6:.1f} MB)")
+
+    if args.check:
+        check_sharing(dst, processes=args.check)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,13 @@
 print("KI wird geladen...")
 
 import torch
-import torch.nn.functional as F
 import tkinter as tk
 from tkinter import ttk
 
-from model import MiniGPT
+from shared_weights import load_model_shared
 from tokenizer import BPETokenizer
+from generation import best_of_n
+from worker_pool import apply_thread_settings
 from memory import (
     load_memory,
     save_memory,
@@ -17,17 +18,29 @@ from memory import (
     style_similarity,
 )
 from context_manager import ContextManager  # NEU
+from response_cache import ResponseCache, cache_key, model_fingerprint, seed_from_key
 
 MODEL_FILE = "minigpt_grundwissen.pt"
 CHECKPOINT_FILE = "checkpoint.pt"
 TOKENIZER_FILE = "tokenizer.json"
 
+# Sampling-Regeln für generation.py (Tokens = Zeichen beim Char-Tokenizer,
+# daher nur milde Strafen und eine lange n-Gramm-Sperre)
+SAMPLING = {"top_p": 0.95, "repetition_penalty": 1.05, "no_repeat_ngram": 12}
+
+USE_RESPONSE_CACHE = True   # gleiche Prompts -> gespeicherte Kandidaten statt neu erzeugen
+SEED_POLICY = "random"      # "fixed" = Seed aus dem Prompt -> immer reproduzierbar
+
 # ---------------------------
 # Device
 # ---------------------------
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 print("Verwendetes Device:", device)
 
+# Threads aus SLM_THREADS / SLM_INTEROP_THREADS (mehrere Instanzen nebeneinander)
+threads, interop = apply_thread_settings()
+print("Threads:", threads, "| Inter-Op:", interop)
+
 # ---------------------------
 # Tokenizer laden
 # ---------------------------
@@ -37,9 +50,11 @@ tok = BPETokenizer.load(TOKENIZER_FILE)
 # block_size aus Checkpoint holen
 # ---------------------------
 block_size = 64  # Fallback
+heads = 4        # Fallback (steht nicht in den Gewichten)
 try:
     ckpt = torch.load(CHECKPOINT_FILE, map_location=device)
     block_size = int(ckpt.get("block_size", block_size))
+    heads = int(ckpt.get("model_config", {}).get("heads", heads))
 except Exception as e:
     print("Warnung: Konnte block_size nicht aus checkpoint lesen:", e)
 
@@ -48,11 +63,8 @@ print("Verwendete block_size/max_len:", block_size)
 # ---------------------------
 # Modell laden
 # ---------------------------
-model = MiniGPT(vocab_size=len(tok.vocab), max_len=block_size)
-state_dict = torch.load(MODEL_FILE, map_location=device)
-model.load_state_dict(state_dict)
-model.to(device)
-model.eval()
+# Gewichte gemappt: weitere Instanzen auf demselben Rechner teilen sich den Speicher
+model = load_model_shared(MODEL_FILE, heads=heads, device=device)
 
 # ---------------------------
 # Memory + Stilprofil
@@ -66,41 +78,13 @@ print(f"Anzahl gespeicherter Prompts: {len(memory)}")
 # ---------------------------
 context_mgr = ContextManager(max_history=10)
 
-
 # ---------------------------
-# Sampling
+# Antwort-Cache (über Neustarts hinweg)
 # ---------------------------
-def sample_next_id(logits, temperature=0.4, top_k=30):
-    logits = logits / max(temperature, 1e-6)
-
-    if top_k is not None and 0 < top_k < logits.size(-1):
-        values, indices = torch.topk(logits, k=top_k, dim=-1)
-        probs = F.softmax(values, dim=-1)
-        next_local = torch.multinomial(probs, num_samples=1)
-        next_id = indices.gather(-1, next_local)
-    else:
-        probs = F.softmax(logits, dim=-1)
-        next_id = torch.multinomial(probs, num_samples=1)
-
-    return next_id  # (1, 1)
-
-
-def generate_one(prompt, steps=80, temperature=0.4):
-    tokens = tok.encode(prompt)
-    idx = torch.tensor([tokens], dtype=torch.long).to(device)
-
-    if idx.size(1) > block_size:
-        idx = idx[:, -block_size:]
-
-    with torch.no_grad():
-        for _ in range(steps):
-            if idx.size(1) > block_size:
-                idx = idx[:, -block_size:]
-            logits = model(idx)[:, -1, :]
-            next_id = sample_next_id(logits, temperature=temperature, top_k=30)
-            idx = torch.cat([idx, next_id], dim=1)
-
-    return tok.decode(idx[0].tolist())
+response_cache = ResponseCache() if USE_RESPONSE_CACHE else None
+model_hash = model_fingerprint(MODEL_FILE) if USE_RESPONSE_CACHE else ""
+if response_cache is not None:
+    print(f"Antwort-Cache: {len(response_cache.entries)} Einträge")
 
 
 # ---------------------------
@@ -112,8 +96,12 @@ GERMAN_COMMON_WORDS = [
     "mathematik", "wissenschaft", "natur", "computer", "energie",
 ]
 
+# Gewicht der (längen-normierten) Log-Wahrscheinlichkeit des Modells
+LOGPROB_WEIGHT = 0.5
 
-def score_candidate(prompt, text, style_weight, style_profile_local):
+
+def score_candidate(prompt, text, style_weight, style_profile_local,
+                    logprob=None, logprob_weight=LOGPROB_WEIGHT):
     score = 0.0
     t = text.strip()
 
@@ -148,6 +136,10 @@ def score_candidate(prompt, text, style_weight, style_profile_local):
         sim = style_similarity(t, style_profile_local)  # 0..1
         score += style_weight * 3.0 * sim
 
+    # 6. Wie wahrscheinlich findet das Modell selbst den Text?
+    if logprob is not None and logprob_weight > 0:
+        score += logprob_weight * logprob
+
     return score
 
 
@@ -237,22 +229,42 @@ def on_generate():
 
     use_context = bool(context_var.get())
 
-    # Prompt ggf. mit Kontext anreichern (nur intern)
-    effective_prompt = context_mgr.apply(prompt, enabled=use_context)
-
-    scored = []
-    for _ in range(n_cand):
-        text = generate_one(effective_prompt, steps=80, temperature=temperature)
-        s = score_candidate(prompt, text, style_w, style_profile)
-        scored.append((s, text))
+    # Prompt ggf. mit Kontext anreichern (nur intern); die Token-Ids des
+    # letzten Turns kommen dabei aus dessen Cache
+    context_prefix = context_mgr.context_prefix(prompt, enabled=use_context)
+    prompt_ids = context_mgr.encode(prompt, tok, enabled=use_context)
+
+    # erst im Cache nachsehen
+    gen_settings = {"steps": 80, **SAMPLING}
+    key = cache_key(prompt, context_prefix, temperature, n_cand, model_hash, SEED_POLICY,
+                    sampling=gen_settings)
+    use_cache = response_cache is not None and response_cache.cacheable(temperature, SEED_POLICY)
+    candidates = response_cache.get(key) if use_cache else None
+    from_cache = candidates is not None
+
+    if not from_cache:
+        if SEED_POLICY == "fixed":
+            torch.manual_seed(seed_from_key(key))
+        # alle Kandidaten in einem Batch erzeugen (inkl. Log-Wahrscheinlichkeiten)
+        candidates = best_of_n(
+            model, tok, prompt_ids, n=n_cand, temperature=temperature,
+            block_size=block_size, device=device, **gen_settings,
+        )
+        if use_cache:
+            response_cache.put(key, candidates)
+    scored = [
+        (score_candidate(prompt, c["text"], style_w, style_profile, logprob=c["score"]), c["text"])
+        for c in candidates
+    ]
 
     scored.sort(key=lambda x: x[0], reverse=True)
     best_score, best_text = scored[0]
 
     output_text.delete("1.0", "end")
+    cache_note = " – aus dem Cache" if from_cache else ""
     output_text.insert(
         "1.0",
-        f"Beste Antwort (Score {best_score:.2f}):\n\n{best_text}\n",
+        f"Beste Antwort (Score {best_score:.2f}{cache_note}):\n\n{best_text}\n",
     )
 
     # Prompt in Memory aufnehmen und Stilprofil aktualisieren
@@ -282,6 +294,11 @@ for c in range(4):
 
 def on_close():
     save_memory(memory)
+    if response_cache is not None:
+        response_cache.save()
+        st = response_cache.stats()
+        print(f"Antwort-Cache: {st['hits']} Treffer / {st['misses']} Fehlversuche "
+              f"({st['hit_rate']:.0%}), {st['entries']} Einträge gespeichert")
     root.destroy()
 
 
@@ -0,0 +1,205 @@
+# sweep.py
+"""
+Mehrere Trainingsläufe parallel starten und die Ergebnisse vergleichen.
+
+Sweep-Datei (TOML/YAML/JSON):
+
+    cores = 8              # CPU-Kerne, die insgesamt benutzt werden dürfen
+    out_dir = "runs"
+
+    [base]                 # gilt für alle Läufe
+    epochs = 1
+    batches_per_epoch = 100
+
+    [[runs]]
+    name = "t2_fp32"
+    threads = 2
+
+    [[runs]]
+    name = "t4_bf16"
+    threads = 4
+    precision = "bf16"
+
+Jeder Lauf bekommt so viele Kerne wie `threads` (mind. 1). Es laufen nur so
+viele Prozesse gleichzeitig, wie in das Kern-Budget passen; unter Linux
+werden die Prozesse zusätzlich auf disjunkte Kerne gepinnt.
+"""
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import time
+
+from train import load_config_file, merge_config
+from tokenizer import BPETokenizer
+from worker_pool import available_cores
+
+TRAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "train.py")
+
+TABLE_COLUMNS = [
+    ("name", "Lauf"),
+    ("threads", "Threads"),
+    ("precision", "Präzision"),
+    ("batch", "Batch"),
+    ("tokens_per_sec", "Tokens/s"),
+    ("train_loss", "train_loss"),
+    ("val_ppl", "val_ppl"),
+    ("seconds", "Zeit (s)"),
+    ("peak_rss_mb", "Peak-RSS (MB)"),
+    ("status", "Status"),
+]
+
+
+def prepare_tokenizers(configs):
+    """Tokenizer vorab bauen, damit parallele Läufe sich nicht in die Quere kommen."""
+    done = set()
+    for cfg in configs:
+        key = (cfg["text_file"], cfg["tokenizer_file"])
+        if key in done or os.path.exists(cfg["tokenizer_file"]):
+            continue
+        with open(cfg["text_file"], "r", encoding="utf8") as f:
+            text = f.read()
+        tok = BPETokenizer(vocab_size=4096)
+        tok.train(text)
+        tok.save(cfg["tokenizer_file"])
+        done.add(key)
+
+
+def launch(cfg, cores):
+    """Startet train.py für eine Config als eigenen Prozess."""
+    os.makedirs(cfg["out_dir"], exist_ok=True)
+    config_path = os.path.join(cfg["out_dir"], "config.json")
+    with open(config_path, "w", encoding="utf8") as f:
+        json.dump(cfg, f, ensure_ascii=False, indent=2)
+
+    env = dict(os.environ)
+    env["OMP_NUM_THREADS"] = str(len(cores))
+    env["MKL_NUM_THREADS"] = str(len(cores))
+
+    preexec = None
+    if hasattr(os, "sched_setaffinity"):
+        preexec = lambda: os.sched_setaffinity(0, cores)
+
+    log = open(os.path.join(cfg["out_dir"], "train.log"), "w", encoding="utf8")
+    proc = subprocess.Popen(
+        [sys.executable, TRAIN_SCRIPT, "--config", config_path],
+        stdin=subprocess.DEVNULL,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+        env=env,
+        preexec_fn=preexec,
+    )
+    return proc, log
+
+
+def collect(name, cfg, returncode):
+    """Liest die metrics.json eines Laufs in eine Tabellenzeile."""
+    row = {
+        "name": name,
+        "threads": cfg["threads"],
+        "precision": cfg["precision"],
+        "batch": f"{cfg['batch_size']}x{cfg['grad_accum']}",
+        "status": "ok" if returncode == 0 else f"Fehler ({returncode})",
+    }
+    metrics_path = os.path.join(cfg["out_dir"], cfg["metrics_file"])
+    if returncode == 0 and os.path.exists(metrics_path):
+        with open(metrics_path, "r", encoding="utf8") as f:
+            metrics = json.load(f)
+        for key in ("tokens_per_sec", "train_loss", "val_ppl", "seconds", "peak_rss_mb"):
+            row[key] = metrics.get(key)
+    return row
+
+
+def format_table(rows):
+    def fmt(v):
+        if isinstance(v, float):
+            return f"{v:.4g}" if abs(v) < 1000 else f"{v:.0f}"
+        return "-" if v is None else str(v)
+
+    cells = [[title for _, title in TABLE_COLUMNS]]
+    cells += [[fmt(row.get(key)) for key, _ in TABLE_COLUMNS] for row in rows]
+    widths = [max(len(r[i]) for r in cells) for i in range(len(TABLE_COLUMNS))]
+    lines = [" | ".join(c.ljust(w) for c, w in zip(r, widths)) for r in cells]
+    lines.insert(1, "-+-".join("-" * w for w in widths))
+    return "\n".join(lines)
+
+
+def run_sweep(sweep, cores_budget=None):
+    out_dir = sweep.get("out_dir", "runs")
+    base = dict(sweep.get("base", {}))
+    runs = sweep.get("runs", [])
+    if not runs:
+        raise ValueError("Sweep-Datei enthält keine [[runs]].")
+
+    # Configs vorbereiten
+    jobs = []
+    for i, run in enumerate(runs):
+        run = dict(run)
+        name = run.pop("name", f"run{i}")
+        overrides = {**base, **run}
+        overrides["out_dir"] = os.path.join(out_dir, name)
+        overrides.setdefault("metrics_file", "metrics.json")
+        overrides["threads"] = max(1, int(overrides.get("threads", 1)))
+        jobs.append((name, merge_config(overrides)))
+
+    free = available_cores()
+    budget = min(cores_budget or sweep.get("cores") or len(free), len(free))
+    free = free[:budget]
+    print(f"Sweep: {len(jobs)} Läufe, Kern-Budget {budget}", flush=True)
+    for name, cfg in jobs:
+        if cfg["threads"] > budget:
+            raise ValueError(f"Lauf '{name}' braucht {cfg['threads']} Kerne, Budget ist {budget}.")
+
+    prepare_tokenizers([cfg for _, cfg in jobs])
+
+    pending = list(jobs)
+    running = []   # (name, cfg, proc, log, cores)
+    rows = {}
+    while pending or running:
+        # starten, was ins Budget passt (Reihenfolge bleibt erhalten)
+        while pending and pending[0][1]["threads"] <= len(free):
+            name, cfg = pending.pop(0)
+            cores, free = free[:cfg["threads"]], free[cfg["threads"]:]
+            proc, log = launch(cfg, cores)
+            running.append((name, cfg, proc, log, cores))
+            print(f"▶ {name} gestartet (Kerne {cores})", flush=True)
+
+        time.sleep(0.5)
+        for item in list(running):
+            name, cfg, proc, log, cores = item
+            if proc.poll() is None:
+                continue
+            log.close()
+            running.remove(item)
+            free = sorted(free + cores)
+            rows[name] = collect(name, cfg, proc.returncode)
+            print(f"■ {name} beendet ({rows[name]['status']})", flush=True)
+
+    ordered = [rows[name] for name, _ in jobs]
+    table = format_table(ordered)
+    print("\n" + table, flush=True)
+
+    os.makedirs(out_dir, exist_ok=True)
+    csv_path = os.path.join(out_dir, "sweep_results.csv")
+    with open(csv_path, "w", newline="", encoding="utf8") as f:
+        writer = csv.DictWriter(f, fieldnames=[key for key, _ in TABLE_COLUMNS])
+        writer.writeheader()
+        for row in ordered:
+            writer.writerow({key: row.get(key) for key, _ in TABLE_COLUMNS})
+    print("Ergebnisse gespeichert als", csv_path, flush=True)
+    return ordered
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trainings-Sweep parallel ausführen")
+    parser.add_argument("sweep_file", help="Sweep-Datei (.toml / .yaml / .json)")
+    parser.add_argument("--cores", type=int, default=None,
+                        help="Kern-Budget (überschreibt 'cores' aus der Datei)")
+    args = parser.parse_args()
+    run_sweep(load_config_file(args.sweep_file), cores_budget=args.cores)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+# tests/conftest.py
+# Module liegen flach im Projektordner -> für die Tests importierbar machen
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,43 @@
+# tests/test_checkpoint.py
+"""best.pt darf nur nach einem Loss gewählt werden, der auf denselben Gewichten gemessen wurde."""
+import json
+
+import torch
+
+from evaluate import evaluate_perplexity
+from model import MiniGPT
+from tokenizer import BPETokenizer
+from train import merge_config, train
+
+
+def test_best_checkpoint_uses_matching_val_loss(tmp_path):
+    text = "".join(f"Satz {i}: Die Sonne ist ein Stern und Wasser ist nass.\n" for i in range(80))
+    (tmp_path / "text.txt").write_text(text, encoding="utf8")
+    tok = BPETokenizer()
+    tok.train(text)
+    tok.save(str(tmp_path / "tokenizer.json"))
+
+    cfg = merge_config({
+        "text_file": str(tmp_path / "text.txt"),
+        "tokenizer_file": str(tmp_path / "tokenizer.json"),
+        "out_dir": str(tmp_path / "run"),
+        "epochs": 1, "batches_per_epoch": 12, "batch_size": 4, "block_size": 16,
+        "embed_dim": 32, "heads": 2, "layers": 1, "ff_dim": 64, "lr": 1e-3,
+        # Eval alle 4, Speichern alle 3 Schritte: nur Schritt 12 hat beides
+        "eval_interval": 4, "save_every_steps": 3, "keep_last_checkpoints": 10,
+        "val_fraction": 0.2, "eval_batch_size": 4, "threads": 1,
+    })
+    train(cfg)
+
+    ckpt_dir = tmp_path / "run" / "checkpoints"
+    info = json.loads((ckpt_dir / "best.json").read_text(encoding="utf8"))
+    assert info["step"] == 12
+
+    best = torch.load(ckpt_dir / "best.pt")
+    assert best["val_loss_step"] == best["step"] == 12
+    model = MiniGPT(**best["model_config"])
+    model.load_state_dict(best["model"])
+    encoded = tok.encode(text)
+    val = encoded[-int(len(encoded) * cfg["val_fraction"]):]
+    result = evaluate_perplexity(model, val, 16, batch_size=4)
+    assert abs(result["loss"] - info["metric"]) < 1e-5
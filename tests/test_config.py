@@ -0,0 +1,33 @@
+# tests/test_config.py
+"""Config-Werte aus YAML/TOML/JSON landen mit dem Typ des Standardwerts im Training."""
+import pytest
+
+from train import load_config_file, merge_config
+
+
+def test_quoted_values_are_cast_to_default_type():
+    cfg = merge_config({"val_fraction": "0.05", "keep_last_checkpoints": "3",
+                        "lr": 1, "causal": True})
+    assert cfg["val_fraction"] == 0.05 and isinstance(cfg["val_fraction"], float)
+    assert cfg["keep_last_checkpoints"] == 3 and isinstance(cfg["keep_last_checkpoints"], int)
+    assert isinstance(cfg["lr"], float)
+    assert cfg["causal"] == 1 and type(cfg["causal"]) is int
+
+
+def test_toml_file_values(tmp_path):
+    path = tmp_path / "train.toml"
+    path.write_text('eval_interval = "50"\nadaptive_cutoffs = [16, 40]\n', encoding="utf-8")
+    cfg = merge_config(load_config_file(str(path)))
+    assert cfg["eval_interval"] == 50
+    assert cfg["adaptive_cutoffs"] == "16,40"
+
+
+def test_unknown_key_is_rejected():
+    with pytest.raises(ValueError, match="Unbekannte"):
+        merge_config({"val_fracton": 0.1})
+
+
+@pytest.mark.parametrize("key, value", [("epochs", "viele"), ("epochs", 2.5), ("lr", None)])
+def test_invalid_value_is_rejected(key, value):
+    with pytest.raises(ValueError, match=key):
+        merge_config({key: value})
@@ -0,0 +1,51 @@
+# tests/test_context_manager.py
+"""Kontext-Präfix und gecachte Token-Ids der Turns."""
+from context_manager import ContextManager, FollowUpDetector
+from tokenizer import BPETokenizer
+
+TEXT = "Vorheriger Kontext:\nBenutzer: KI: Neue Frage:\nWas ist die Sonne? Ein Stern. Und warum leuchtet sie?"
+
+
+def make_tok():
+    tok = BPETokenizer()
+    tok.train(TEXT)
+    return tok
+
+
+def test_encode_matches_apply():
+    tok = make_tok()
+    ctx = ContextManager(detector=FollowUpDetector())
+    ctx.update("Was ist die Sonne?", "Ein Stern.")
+    for prompt in ("Und warum leuchtet sie?", "Was ist ein Stern und warum ist die Sonne einer?"):
+        assert ctx.encode(prompt, tok) == tok.encode(ctx.apply(prompt))
+        assert ctx.encode(prompt, tok, enabled=False) == tok.encode(prompt)
+
+
+def test_encode_reuses_turn_cache():
+    tok = make_tok()
+    ctx = ContextManager(detector=FollowUpDetector())
+    ctx.update("Was ist die Sonne?", "Ein Stern.")
+    ctx.encode("Und warum?", tok)
+    last = ctx.history[-1]
+    cached = last.prompt_ids(tok)
+    ctx.encode("Und warum leuchtet sie?", tok)
+    assert last.prompt_ids(tok) is cached
+
+
+def test_overlap_score_is_off_by_default():
+    ctx = ContextManager(detector=FollowUpDetector())
+    ctx.update("Wie funktioniert die Photosynthese in Pflanzen?", "Pflanzen nutzen Licht.")
+    prompt = "Welche Pflanzen brauchen für die Photosynthese besonders viel Licht?"
+    assert ctx.context_prefix(prompt) == ""
+
+    ctx.detector = FollowUpDetector(threshold=0.4)  # 4 von 9 Wörtern kamen schon vor
+    assert ctx.context_prefix(prompt) != ""
+
+
+def test_config_enables_overlap(tmp_path):
+    path = tmp_path / "follow_up.json"
+    path.write_text('{"triggers": ["was noch"]}', encoding="utf8")
+    assert FollowUpDetector.from_config(str(path)).threshold is None
+    path.write_text('{"threshold": 0.4}', encoding="utf8")
+    detector = FollowUpDetector.from_config(str(path))
+    assert detector.threshold == 0.4 and detector.has_trigger("und warum?")
@@ -0,0 +1,18 @@
+# tests/test_data.py
+"""Dokumentgrenzen für gepackte Batches."""
+import pytest
+
+from data import document_starts
+
+
+def test_document_starts():
+    #          0  1  2  3  4  5  6  7  8
+    encoded = [5, 6, 9, 9, 7, 9, 9, 8, 8]
+    assert document_starts(encoded, [9, 9]).tolist() == [0, 4, 7]
+    # Stückgrenzen dürfen keinen Trenner zerschneiden
+    assert document_starts(encoded, [9, 9], chunk=3).tolist() == [0, 4, 7]
+
+
+def test_document_starts_rejects_empty_separator():
+    with pytest.raises(ValueError, match="sep_ids"):
+        document_starts(list(range(10)), [])
@@ -0,0 +1,32 @@
+# tests/test_distill.py
+"""Distillation auch mit einem Adaptive-Softmax-Teacher (dort ist fc None)."""
+import pytest
+import torch
+
+from distill import build_teacher_cache, init_student_from_teacher
+from model import MiniGPT
+
+VOCAB = 40
+
+
+@pytest.mark.parametrize("cutoffs", [None, [8, 20]])
+@torch.no_grad()
+def test_student_starts_with_teacher_head(cutoffs):
+    torch.manual_seed(0)
+    config = dict(vocab_size=VOCAB, max_len=16, embed_dim=32, heads=2, ff_dim=64,
+                  adaptive_cutoffs=cutoffs, causal=True)
+    teacher = MiniGPT(layers=2, **config).eval()
+    if cutoffs:
+        teacher.set_vocab_order(torch.randperm(VOCAB))
+    student = MiniGPT(layers=1, **config).eval()
+    init_student_from_teacher(student, teacher)
+
+    h = torch.randn(3, 32)
+    assert torch.allclose(student.head(h), teacher.head(h))
+
+    x = torch.randint(0, VOCAB, (5, 16))
+    top_ids, top_vals = build_teacher_cache(teacher, x, top_k=4, device="cpu", batch_size=2)
+    assert top_ids.shape == top_vals.shape == (5, 16, 4)
+    vals, ids = torch.topk(teacher(x), k=4, dim=-1)
+    assert torch.equal(top_ids.long(), ids)
+    assert torch.allclose(top_vals.float(), vals, atol=1e-2)
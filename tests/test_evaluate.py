@@ -0,0 +1,28 @@
+# tests/test_evaluate.py
+"""Perplexity nur mit kausaler Maske aussagekräftig."""
+import pytest
+import torch
+
+from evaluate import evaluate_perplexity
+from model import MiniGPT
+
+VOCAB = 50
+
+
+def random_data(n=400):
+    g = torch.Generator().manual_seed(0)
+    return torch.randint(0, VOCAB, (n,), generator=g).tolist()
+
+
+def test_causal_ppl_on_random_data_is_high():
+    torch.manual_seed(0)
+    model = MiniGPT(VOCAB, max_len=16, embed_dim=32, heads=2, layers=1, ff_dim=64, causal=True)
+    result = evaluate_perplexity(model, random_data(), block_size=16)
+    # zufällige Tokens: nichts vorherzusagen -> ppl in der Größenordnung des Vokabulars
+    assert result["ppl"] > VOCAB / 4
+
+
+def test_non_causal_model_warns():
+    model = MiniGPT(VOCAB, max_len=16, embed_dim=32, heads=2, layers=1, ff_dim=64)
+    with pytest.warns(UserWarning, match="nicht causal"):
+        evaluate_perplexity(model, random_data(), block_size=16)
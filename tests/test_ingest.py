@@ -0,0 +1,65 @@
+# tests/test_ingest.py
+"""ingest.py: Shards = tok.encode der Absätze, Duplikate raus, zweiter Lauf ohne Arbeit."""
+import os
+
+import numpy as np
+
+from ingest import MANIFEST_NAME, PARAGRAPH_SEP, ingest
+from tokenizer import BPETokenizer
+
+FILES = {
+    "a.txt": ["Die Sonne ist ein Stern.", "Der Mond kreist um die Erde."],
+    "b.txt": ["Wasser kocht bei 100 Grad.", "Die Sonne ist ein Stern."],  # Duplikat aus a.txt
+    "c.txt": ["Äpfel wachsen an Bäumen."],
+    "d.txt": ["Eis schmilzt in der Wärme.", "Der Mond kreist um die Erde.", "Salz löst sich."],
+}
+
+
+def make_inputs(tmp_path):
+    src = tmp_path / "texte"
+    src.mkdir()
+    for name, paragraphs in FILES.items():
+        (src / name).write_text(PARAGRAPH_SEP.join(paragraphs) + "\n", encoding="utf8")
+    tok = BPETokenizer(vocab_size=500)
+    tok.train("".join(p for ps in FILES.values() for p in ps))
+    tok_path = str(tmp_path / "tokenizer.json")
+    tok.save(tok_path)
+    return src, tok, tok_path
+
+
+def read_shards(out_dir, manifest):
+    parts = [np.fromfile(os.path.join(out_dir, s["file"]), dtype=manifest["dtype"])
+             for s in manifest["shards"]]
+    return np.concatenate(parts).tolist()
+
+
+def test_ingest_matches_encode_and_skips_on_rerun(tmp_path, capsys):
+    src, tok, tok_path = make_inputs(tmp_path)
+    out_dir = str(tmp_path / "shards")
+    # kleine Stücke + kleine Shards: viele Stücke über Dateigrenzen hinweg unterwegs
+    kwargs = dict(tokenizer_file=tok_path, workers=2, chunk_chars=16, shard_tokens=40)
+    manifest = ingest([str(src)], out_dir, **kwargs)
+
+    expected = []
+    seen = set()
+    for name in sorted(FILES):
+        for para in FILES[name]:
+            if para not in seen:
+                seen.add(para)
+                expected.extend(tok.encode(para + PARAGRAPH_SEP))
+    assert read_shards(out_dir, manifest) == expected
+    assert manifest["duplicate_paragraphs"] == 2
+    assert len(manifest["shards"]) > 1
+    assert capsys.readouterr().out.count("encodiert:") == len(FILES)
+
+    # zweiter Lauf: nichts neu encodiert, Manifest unverändert
+    again = ingest([str(src)], out_dir, **kwargs)
+    out = capsys.readouterr().out
+    assert "encodiert:" not in out and "Keine Änderungen" in out
+    assert again == manifest
+
+    # eine Datei geändert -> nur diese wird neu encodiert
+    (src / "c.txt").write_text("Äpfel wachsen an Bäumen.\n\nBirnen auch.\n", encoding="utf8")
+    ingest([str(src)], out_dir, **kwargs)
+    out = capsys.readouterr().out
+    assert out.count("encodiert:") == 1 and "c.txt" in out
@@ -0,0 +1,21 @@
+# tests/test_model.py
+"""Architektur muss sich vollständig aus dem state_dict zurücklesen lassen."""
+import pytest
+import torch
+
+from model import MiniGPT, config_from_state_dict
+
+
+@pytest.mark.parametrize("cutoffs, div", [([10, 30], 3.0), ([16, 40], 4.0), ([5, 20, 40], 2.5)])
+def test_adaptive_head_round_trip(cutoffs, div):
+    model = MiniGPT(60, max_len=16, embed_dim=32, heads=2, layers=1, ff_dim=32,
+                    adaptive_cutoffs=cutoffs, adaptive_div=div, causal=True).eval()
+    config = config_from_state_dict(model.state_dict(), heads=2)
+    assert config["adaptive_cutoffs"] == cutoffs
+    assert config["adaptive_div"] == div
+    assert config["causal"] is True
+
+    loaded = MiniGPT(**config).eval()
+    loaded.load_state_dict(model.state_dict())
+    x = torch.randint(0, 60, (2, 8))
+    assert torch.allclose(model(x), loaded(x))
@@ -0,0 +1,60 @@
+# tests/test_onnx_export.py
+"""ONNX-Graphen (Fenster + KV-Cache) müssen dieselben Logits liefern wie PyTorch."""
+import warnings
+
+import pytest
+import torch
+
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+from model import MiniGPT  # noqa: E402
+from onnx_export import check_parity, export_all  # noqa: E402
+
+VOCAB = 40
+TOLERANCE = 1e-4
+
+
+@pytest.mark.parametrize("causal, cutoffs", [(False, None), (True, None), (True, [8, 24])])
+def test_parity(tmp_path, causal, cutoffs):
+    torch.manual_seed(0)
+    model = MiniGPT(VOCAB, max_len=16, embed_dim=32, heads=4, layers=2, ff_dim=64,
+                    adaptive_cutoffs=cutoffs, causal=causal).eval()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # Deprecation-Hinweis des TorchScript-Exporters
+        paths = export_all(model, str(tmp_path / "mini"))
+    assert len(paths) == (2 if causal else 1)
+
+    report = check_parity(model, paths[0], VOCAB, batch=2)
+    assert set(report) == ({"window", "kv_cache"} if causal else {"window"})
+    for name, diff in report.items():
+        assert diff < TOLERANCE, f"{name}: {diff:.2e}"
+
+
+def test_kv_generation_past_the_window(tmp_path):
+    from ort_backend import OrtLM, generate
+    from tokenizer import BPETokenizer
+
+    tok = BPETokenizer()
+    tok.train("abcdefghijklmnopqrstuvwxyz .,!?ABCDEFGHIJKLMN")
+    torch.manual_seed(0)
+    model = MiniGPT(len(tok.vocab), max_len=16, embed_dim=32, heads=4, layers=2, ff_dim=64,
+                    causal=True).eval()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        path = export_all(model, str(tmp_path / "mini"))[0]
+    lm = OrtLM(path)
+    opts = dict(prompt="abc def", n=2, steps=40, block_size=16, seed=3)
+
+    # refill_keep=block_size: exakt wie der Fenster-Graph, auch über das Fenster hinaus
+    window = generate(lm, tok, use_kv_cache=False, **opts)
+    assert generate(lm, tok, refill_keep=16, **opts) == window
+
+    # Standard: halbes Fenster behalten -> nur alle 8 Tokens neu vorfüllen
+    starts = []
+    start = lm.start
+    lm.start = lambda ids: starts.append(ids.shape[1]) or start(ids)
+    generate(lm, tok, **opts)
+    assert starts[0] == 7 and set(starts[1:]) == {8}
+    # Prompt 7 + 40 Tokens: Fenster nach 9 Tokens voll, dann alle 8 Tokens neu
+    assert len(starts) == 1 + 4
@@ -0,0 +1,66 @@
+# tests/test_response_cache.py
+"""Antwort-Cache: LRU-Reihenfolge, TTL mit falscher Uhr, Schlüssel je Sampling."""
+from response_cache import ResponseCache, cache_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def candidates(text):
+    return [{"text": text, "score": -1.0}]
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ResponseCache(path=None, max_entries=2)
+    cache.put("a", candidates("A"))
+    cache.put("b", candidates("B"))
+    assert cache.get("a") is not None  # a ist jetzt neuer als b
+    cache.put("c", candidates("C"))
+
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.get("b") is None
+    assert cache.get("a")[0]["text"] == "A"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = ResponseCache(path=None, ttl_seconds=60, clock=clock)
+    cache.put("a", candidates("A"))
+    clock.now += 60
+    assert cache.get("a") is not None  # genau an der Grenze noch gültig
+    clock.now += 1
+    assert cache.get("a") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_expired_entries_are_not_saved(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "cache.json")
+    cache = ResponseCache(path=path, ttl_seconds=60, clock=clock)
+    cache.put("alt", candidates("A"))
+    clock.now += 30
+    cache.put("neu", candidates("N"))
+    clock.now += 45
+    cache.save()
+    assert list(ResponseCache(path=path, ttl_seconds=60, clock=clock).entries) == ["neu"]
+
+
+def test_key_differs_only_by_sampling_settings():
+    base = ("Was ist die Sonne?", "", 0.3, 3, "modellhash", "random")
+    keys = {
+        cache_key(*base),
+        cache_key(*base, sampling={"top_p": 0.95}),
+        cache_key(*base, sampling={"top_p": 0.9}),
+        cache_key(*base, sampling={"top_p": 0.95, "repetition_penalty": 1.05}),
+        cache_key(*base, sampling={"top_p": 0.95, "steps": 40}),
+    }
+    assert len(keys) == 5
+    # Reihenfolge der Einstellungen spielt keine Rolle
+    assert cache_key(*base, sampling={"top_k": 30, "top_p": 0.9}) == \
+        cache_key(*base, sampling={"top_p": 0.9, "top_k": 30})
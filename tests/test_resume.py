@@ -0,0 +1,82 @@
+# tests/test_resume.py
+"""
+Fortsetzen muss bitgenau sein: N Schritte am Stück == K Schritte,
+Checkpoint, neuer Prozess, restliche N-K Schritte.
+"""
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+import torch
+
+from conftest import ROOT
+from tokenizer import BPETokenizer
+
+# 2 Epochen x 7 Batches, grad_accum 2 -> 4 Schritte pro Epoche (der letzte
+# schließt die angefangene Akkumulation am Epochenende ab), 8 insgesamt
+CONFIG = {
+    "epochs": 2,
+    "batches_per_epoch": 7,
+    "batch_size": 4,
+    "grad_accum": 2,
+    "warmup_steps": 5,
+    "block_size": 16,
+    "embed_dim": 32,
+    "heads": 2,
+    "layers": 1,
+    "ff_dim": 64,
+    "eval_interval": 0,
+    "save_every_steps": 1,
+    "keep_last_checkpoints": 20,
+    "threads": 1,
+    "seed": 7,
+}
+
+
+def run_train(text_file, tokenizer_file, out_dir):
+    """train.py in einem eigenen Prozess (wie ein neu gestarteter Job)."""
+    args = [sys.executable, os.path.join(ROOT, "train.py"),
+            "--text-file", text_file, "--tokenizer-file", tokenizer_file, "--out-dir", out_dir]
+    for key, value in CONFIG.items():
+        args += ["--" + key.replace("_", "-"), str(value)]
+    subprocess.run(args, check=True, capture_output=True)
+
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    root = tmp_path_factory.mktemp("resume")
+    text = "".join(
+        f"Satz {i}: Die Sonne ist ein Stern, Wasser besteht aus Wasserstoff und Sauerstoff.\n"
+        for i in range(60)
+    )
+    text_file = root / "text.txt"
+    text_file.write_text(text, encoding="utf8")
+    tok = BPETokenizer()
+    tok.train(text)
+    tok.save(str(root / "tokenizer.json"))
+
+    straight = root / "straight"
+    run_train(str(text_file), str(root / "tokenizer.json"), str(straight))
+    return root, straight
+
+
+@pytest.mark.parametrize("stop_step", [2, 5])  # mitten in Epoche 0 bzw. Epoche 1
+def test_resume_matches_straight_run(corpus, stop_step):
+    root, straight = corpus
+    resumed = root / f"resumed_{stop_step}"
+    resumed.mkdir()
+    # "Abbruch" nach stop_step: nur dessen Checkpoint überlebt
+    shutil.copy(straight / "checkpoints" / f"step_{stop_step:08d}.pt", resumed / "checkpoint.pt")
+    run_train(str(root / "text.txt"), str(root / "tokenizer.json"), str(resumed))
+
+    a = torch.load(straight / "checkpoint.pt")
+    b = torch.load(resumed / "checkpoint.pt")
+    assert a["step"] == b["step"] == 8
+    for name, value in a["model"].items():
+        assert torch.equal(value, b["model"][name]), name
+    assert a["sched"] == b["sched"]
+    for sa, sb in zip(a["opt"]["state"].values(), b["opt"]["state"].values()):
+        assert torch.equal(sa["exp_avg"], sb["exp_avg"])
+        assert torch.equal(sa["exp_avg_sq"], sb["exp_avg_sq"])
@@ -0,0 +1,76 @@
+# tests/test_session_store.py
+"""Sitzungen auslagern, wieder laden und den Ringpuffer begrenzen."""
+import os
+import time
+
+from session_store import SessionStore
+from tokenizer import BPETokenizer
+
+TURNS = [
+    ("Was ist die Sonne?", "Die Sonne ist ein Stern."),
+    ("Und der Mond?", "Der Mond kreist um die Erde."),
+    ("Warum ist Wasser nass?", "Wasser benetzt Oberflächen."),
+    ("Was sind Atome?", "Atome bestehen aus Protonen und Neutronen."),
+    ("Wie warm ist die Sonne?", "Sehr warm."),
+]
+
+
+def turns_of(session):
+    return [(t.prompt, t.answer, t.created) for t in session.history]
+
+
+def test_idle_session_is_spilled_and_restored(tmp_path):
+    spill = str(tmp_path / "sessions")
+    store = SessionStore(max_history=10, idle_seconds=60, spill_dir=spill)
+    for prompt, answer in TURNS[:3]:
+        store.add_turn("alice", prompt, answer)
+    store.add_turn("bob", *TURNS[3])
+    before = turns_of(store.get("alice"))
+
+    store.evict_idle(now=time.time() + 61)
+    assert not store.sessions and store.total_bytes == 0
+    assert len(os.listdir(spill)) == 2
+    assert store.stats()["spilled"] == 2
+
+    session = store.get("alice")
+    assert turns_of(session) == before
+    assert store.stats()["restored"] == 1
+    assert store.total_bytes == session.nbytes
+    assert len(os.listdir(spill)) == 1  # nur noch bob liegt auf der Platte
+
+
+def test_restored_session_recomputes_token_ids(tmp_path):
+    tok = BPETokenizer(vocab_size=500)
+    tok.train("".join(p + a for p, a in TURNS))
+    store = SessionStore(idle_seconds=60, spill_dir=str(tmp_path), tok=tok)
+    store.add_turn("alice", *TURNS[0])
+    store.evict_idle(now=time.time() + 61)
+
+    turn = store.get("alice").history[0]
+    assert list(turn.prompt_ids(tok)) == tok.encode(TURNS[0][0])
+    assert turn._prompt_ids is not None and turn._answer_ids is not None
+
+
+def test_history_is_limited_before_and_after_spill(tmp_path):
+    store = SessionStore(max_history=3, idle_seconds=60, spill_dir=str(tmp_path))
+    for prompt, answer in TURNS:
+        store.add_turn("alice", prompt, answer)
+    session = store.get("alice")
+    assert [t.prompt for t in session.history] == [p for p, _ in TURNS[-3:]]
+
+    store.evict_idle(now=time.time() + 61)
+    session = store.get("alice")
+    assert session.history.maxlen == 3
+    assert [t.prompt for t in session.history] == [p for p, _ in TURNS[-3:]]
+    store.add_turn("alice", "Noch eine Frage?", "Gern.")
+    assert [t.prompt for t in session.history] == [p for p, _ in TURNS[-2:]] + ["Noch eine Frage?"]
+
+
+def test_byte_limit_evicts_least_recently_used(tmp_path):
+    store = SessionStore(max_bytes=1, spill_dir=str(tmp_path))
+    store.add_turn("alice", *TURNS[0])
+    store.add_turn("bob", *TURNS[1])
+    # nur die aktive Sitzung bleibt im Speicher, alice liegt auf der Platte
+    assert list(store.sessions) == ["bob"]
+    assert turns_of(store.get("alice"))[0][:2] == TURNS[0]
+    assert list(store.sessions) == ["alice"]
@@ -0,0 +1,107 @@
+# tests/test_tokenizer.py
+"""Binärformat gegen JSON: gleiches Vokabular, gleiche Merges, gleiches Encode/Decode."""
+import json
+
+import pytest
+
+from tokenizer import BPETokenizer, convert
+
+TEXT = "Die Sonne ist ein Stern. Äpfel, Öl & Übung – 2025! Schöne Grüße\n"
+
+
+def char_tokenizer():
+    tok = BPETokenizer(vocab_size=500)
+    tok.train(TEXT)
+    return tok
+
+
+def merge_tokenizer():
+    tok = BPETokenizer(vocab_size=500)
+    tok.vocab = sorted(set(TEXT)) + ["ch", "sch", "ne", "Die ", "Sonne"]
+    tok.merges = {"c h": 0, "s ch": 1, "n e": 2, "Die  ": 3, "Son ne": 4}
+    tok._build_lookup()
+    return tok
+
+
+@pytest.mark.parametrize("make", [char_tokenizer, merge_tokenizer])
+def test_json_binary_round_trip(tmp_path, make):
+    original = make()
+    json_path = str(tmp_path / "tokenizer.json")
+    bin_path = str(tmp_path / "tokenizer.bin")
+    original.save(json_path)
+    convert(json_path, bin_path)
+
+    from_json = BPETokenizer.load(json_path)
+    from_bin = BPETokenizer.load(bin_path)
+    for tok in (from_json, from_bin):
+        assert tok.vocab == original.vocab
+        assert tok.stoi == original.stoi
+        assert tok.itos == original.itos
+        assert tok.vocab_size == original.vocab_size
+        assert sorted(tok.merges, key=tok.merges.get) == \
+            sorted(original.merges, key=original.merges.get)
+
+    sample = TEXT * 3 + "unbekannt: ß€"
+    ids = original.encode(sample)
+    assert from_json.encode(sample) == ids
+    assert from_bin.encode(sample) == ids
+    assert from_bin.decode(ids) == from_json.decode(ids) == original.decode(ids)
+
+
+def test_multi_char_pieces_use_longest_match(tmp_path):
+    tok = merge_tokenizer()
+    path = str(tmp_path / "tokenizer.bin")
+    tok.save(path)
+    loaded = BPETokenizer.load(path)
+    ids = loaded.encode("Die Sonne")
+    assert [loaded.itos[i] for i in ids] == ["Die ", "Sonne"]
+
+
+def test_multi_char_detection():
+    tok = BPETokenizer()
+    # ein leeres Piece glich früher ein 2-Zeichen-Piece in der Längensumme aus
+    tok.vocab = ["", "ab", "c"]
+    tok._build_lookup()
+    assert tok.encode("abc") == [1, 2]
+
+
+def test_legacy_json_without_vocab(tmp_path):
+    path = tmp_path / "old.json"
+    itos = {"0": "a", "1": "ab", "2": "b"}
+    path.write_text(json.dumps({"itos": itos, "stoi": {v: int(k) for k, v in itos.items()}}),
+                    encoding="utf8")
+    tok = BPETokenizer.load(str(path))
+    assert tok.vocab == ["a", "ab", "b"]
+    assert tok.encode("abb") == [1, 2]
+
+
+def test_convert_raises_on_mismatch(tmp_path, monkeypatch):
+    json_path = str(tmp_path / "tokenizer.json")
+    bin_path = str(tmp_path / "tokenizer.bin")
+    char_tokenizer().save(json_path)
+
+    load = BPETokenizer.load.__func__
+
+    def broken_load(cls, path):
+        tok = load(cls, path)
+        if path == bin_path:
+            tok.merges = {"x y": 0}  # Ziel weicht ab
+        return tok
+
+    monkeypatch.setattr(BPETokenizer, "load", classmethod(broken_load))
+    with pytest.raises(ValueError, match="merges"):
+        convert(json_path, bin_path)
+
+
+@pytest.mark.parametrize("make", [char_tokenizer, merge_tokenizer])
+def test_decode_batch_matches_decode(make):
+    tok = make()
+    texts = ["Die Sonne", "Schöne Grüße – 2025!", "", "Öl & Übung\n"]
+    rows = [tok.encode(t) for t in texts]
+    rows[1].append(len(tok.vocab) + 5)  # ungültige Id -> leerer Text wie bei decode
+    width = max(len(r) for r in rows)
+    pad = -1
+    batch = [r + [pad] * (width - len(r)) for r in rows]
+
+    assert tok.decode_batch(batch, pad_id=pad) == [tok.decode(r) for r in rows]
+    assert tok.decode_batch(rows[0]) == [tok.decode(rows[0])]
@@ -0,0 +1,59 @@
+# tests/test_worker_pool.py
+"""InferencePool: Ergebnisse kommen an, Fehler landen beim richtigen Future."""
+import pytest
+import torch
+
+from model import MiniGPT
+from tokenizer import BPETokenizer
+from worker_pool import InferencePool
+
+TEXT = "Die Sonne ist ein Stern. Wasser ist nass.\n"
+
+
+class BrokenOnLoad:
+    """Lässt sich picklen, aber im Worker nicht wieder entpicklen."""
+
+    def __reduce__(self):
+        return int, ("kein int",)
+
+
+@pytest.fixture(scope="module")
+def pool(tmp_path_factory):
+    root = tmp_path_factory.mktemp("pool")
+    tok = BPETokenizer()
+    tok.train(TEXT)
+    tok.save(str(root / "tokenizer.json"))
+    torch.manual_seed(0)
+    model = MiniGPT(len(tok.vocab), max_len=16, embed_dim=16, heads=2, layers=1, ff_dim=32)
+    torch.save(model.state_dict(), root / "model.pt")
+
+    with InferencePool(str(root / "model.pt"), str(root / "tokenizer.json"),
+                       threads_per_worker=1, workers=1, heads=2) as p:
+        yield p
+
+
+def test_run_returns_candidates(pool):
+    texts = pool.run("Die Sonne", method="generate", n=2, steps=4)
+    assert len(texts) == 2 and all(t.startswith("Die Sonne") for t in texts)
+
+
+def test_unpicklable_job_fails_at_submit(pool):
+    with pytest.raises(Exception):
+        pool.submit("Die Sonne", method="generate", top_k=lambda: 1)
+
+
+def test_job_that_fails_to_unpickle_in_worker(pool):
+    future = pool.submit("Die Sonne", method="generate", top_k=BrokenOnLoad())
+    with pytest.raises(RuntimeError, match="ValueError"):
+        future.result(timeout=60)
+    # der Worker lebt weiter
+    assert len(pool.run("Die Sonne", method="generate", n=1, steps=2)) == 1
+
+
+def test_dead_worker_fails_pending_futures(pool):  # zuletzt: danach hat der Pool keine Worker mehr
+    future = pool.submit("Die Sonne", method="generate", n=1, steps=100000)
+    pool._procs[0].kill()
+    with pytest.raises(RuntimeError, match="abgestürzt"):
+        future.result(timeout=60)
+    with pytest.raises(RuntimeError, match="Alle Worker"):
+        pool.submit("Die Sonne", method="generate")
@@ -1,15 +1,66 @@
 # tokenizer.py
+import codecs
 import json
+import os
 import re
+import struct
+import sys
+import time
+from array import array
 from collections import Counter
 
+try:
+    import numpy as np
+except ImportError:  # nur für decode_batch() nötig
+    np = None
+
+# Binärformat (little-endian):
+#   Kopf:    b"SLMTOK" | Version u16 | vocab_size u32 | n_pieces u32 | n_merges u32
+#   Vokabular: n_pieces x u32 (Länge in Zeichen) + UTF-8-Block aller Pieces
+#   Merges:    n_merges x u32 (Länge in Zeichen) + UTF-8-Block, sortiert nach Rang
+BINARY_MAGIC = b"SLMTOK"
+BINARY_VERSION = 1
+_HEADER = struct.Struct("<6sHIII")
+
+
+def _pack_strings(strings):
+    lengths = array("I", (len(s) for s in strings))
+    if sys.byteorder != "little":
+        lengths.byteswap()
+    blob = "".join(strings).encode("utf8")
+    return lengths.tobytes() + struct.pack("<I", len(blob)) + blob
+
+
+def _unpack_strings(buf, offset, count):
+    lengths = array("I")
+    lengths.frombytes(buf[offset:offset + 4 * count])
+    if sys.byteorder != "little":
+        lengths.byteswap()
+    offset += 4 * count
+    (blob_len,) = struct.unpack_from("<I", buf, offset)
+    offset += 4
+    text = buf[offset:offset + blob_len].decode("utf8")
+    offset += blob_len
+
+    strings = []
+    pos = 0
+    for n in lengths:
+        strings.append(text[pos:pos + n])
+        pos += n
+    return strings, offset
+
+
 class BPETokenizer:
     def __init__(self, vocab_size=4096):
         self.vocab_size = vocab_size
         self.vocab = []
         self.stoi = {}
         self.itos = {}
-        self.merges = {}  # optional, falls du echtes BPE nutzt
+        self.merges = {}  # optional, falls du echtes BPE nutzt ({"a b": rang})
+        self._trie = None        # Encode-Trie, wird erst beim ersten encode() gebaut
+        self._multi_char = False  # gibt es Pieces mit mehr als 1 Zeichen?
+        self._piece_bytes = None  # id -> UTF-8-Bytes (für das Streaming-Decode)
+        self._piece_array = None  # NumPy-Tabelle id -> Piece (für decode_batch)
 
     # ---------------------------------------------------------
     # TRAIN (falls du schon eine train-Methode hast -> behalten)
@@ -19,23 +70,91 @@ class BPETokenizer:
         # Wenn dein alter Code echtes BPE hat, nutze den!
         chars = sorted(list(set(text)))
         self.vocab = chars[: self.vocab_size]
-        self.stoi = {ch: i for i, ch in enumerate(self.vocab)}
-        self.itos = {i: ch for ch, i in self.stoi.items()}
+        self._build_lookup()
+
+    def _build_lookup(self):
+        """stoi/itos aus dem Vokabular ableiten (der Trie folgt erst bei Bedarf)."""
+        self.stoi = {piece: i for i, piece in enumerate(self.vocab)}
+        self.itos = dict(enumerate(self.vocab))
+        self._trie = None
+        self._multi_char = any(len(p) > 1 for p in self.vocab)
+        self._piece_bytes = None
+        self._piece_array = None
+
+    def _build_trie(self):
+        trie = {}
+        for piece, i in self.stoi.items():
+            node = trie
+            for ch in piece:
+                node = node.setdefault(ch, {})
+            node[None] = i  # Ende eines Pieces
+        self._trie = trie
 
     # ---------------------------------------------------------
     # ENCODE / DECODE (falls vorhanden -> behalten)
     # ---------------------------------------------------------
     def encode(self, text: str):
-        # Simple char fallback
-        return [self.stoi.get(ch, 0) for ch in text]
+        if not self._multi_char:
+            # Simple char fallback
+            return [self.stoi.get(ch, 0) for ch in text]
+        if self._trie is None:
+            self._build_trie()
+
+        # längstes passendes Piece per Trie
+        ids = []
+        i = 0
+        n = len(text)
+        while i < n:
+            node = self._trie
+            best_id, best_len = 0, 1
+            j = i
+            while j < n and text[j] in node:
+                node = node[text[j]]
+                j += 1
+                if None in node:
+                    best_id, best_len = node[None], j - i
+            ids.append(best_id)
+            i += best_len
+        return ids
 
     def decode(self, ids):
         return "".join(self.itos.get(i, "") for i in ids)
 
+    def piece_bytes(self):
+        """Liste id -> Bytes des Pieces (einmal gebaut, dann wiederverwendet)."""
+        if self._piece_bytes is None:
+            self._piece_bytes = [
+                p if isinstance(p, bytes) else p.encode("utf8") for p in self.vocab
+            ]
+        return self._piece_bytes
+
+    def decode_batch(self, ids, pad_id=-1):
+        """
+        Decodiert eine ganze Id-Matrix (Zeilen = Sequenzen) auf einmal.
+        Ungültige Ids und pad_id ergeben leeren Text.
+        """
+        if np is None:
+            raise ImportError("decode_batch() braucht NumPy ('pip install numpy').")
+        if self._piece_array is None:
+            table = np.empty(len(self.vocab) + 1, dtype=object)
+            table[:-1] = self.vocab
+            table[-1] = ""  # Platzhalter für ungültige Ids
+            self._piece_array = table
+
+        ids = np.asarray(ids)
+        if ids.ndim == 1:
+            ids = ids[None, :]
+        n = len(self.vocab)
+        valid = (ids >= 0) & (ids < n) & (ids != pad_id)
+        pieces = self._piece_array[np.where(valid, ids, n)]
+        return ["".join(row) for row in pieces]
+
     # ---------------------------------------------------------
     # ✅ NEU: SAVE / LOAD  (DAS ist der Fix)
     # ---------------------------------------------------------
     def save(self, path="tokenizer.json"):
+        if path.endswith(".bin"):
+            return self.save_binary(path)
         data = {
             "vocab_size": self.vocab_size,
             "vocab": self.vocab,
@@ -46,14 +165,143 @@ class BPETokenizer:
         with open(path, "w", encoding="utf8") as f:
             json.dump(data, f, ensure_ascii=False)
 
+    def save_binary(self, path="tokenizer.bin"):
+        """Kompaktes Format: nur Vokabular (in Reihenfolge) + Merges nach Rang."""
+        merges = sorted(self.merges.items(), key=lambda kv: kv[1])
+        if any(not isinstance(rank, int) for _, rank in merges):
+            raise ValueError("Binärformat erwartet merges als {paar: rang (int)}.")
+
+        data = _HEADER.pack(
+            BINARY_MAGIC, BINARY_VERSION, self.vocab_size, len(self.vocab), len(merges)
+        )
+        data += _pack_strings(self.vocab)
+        data += _pack_strings([pair for pair, _ in merges])
+
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
     @classmethod
     def load(cls, path="tokenizer.json"):
-        with open(path, "r", encoding="utf8") as f:
-            data = json.load(f)
+        with open(path, "rb") as f:
+            raw = f.read()
+        if raw.startswith(BINARY_MAGIC):
+            return cls._from_binary(raw)
 
+        data = json.loads(raw.decode("utf8"))
         tok = cls(vocab_size=data.get("vocab_size", 4096))
-        tok.vocab = data.get("vocab", [])
-        tok.stoi = data.get("stoi", {})
-        tok.itos = {int(k): v for k, v in data.get("itos", {}).items()} if isinstance(list(data.get("itos", {}).keys())[0], str) else data.get("itos", {})
         tok.merges = data.get("merges", {})
+        if data.get("vocab"):
+            tok.vocab = data["vocab"]
+            tok._build_lookup()
+        else:
+            # sehr alte Dateien ohne "vocab": Tabellen direkt übernehmen
+            tok.stoi = data.get("stoi", {})
+            tok.itos = {int(k): v for k, v in data.get("itos", {}).items()}
+            tok.vocab = [tok.itos[i] for i in sorted(tok.itos)]
+            tok._multi_char = any(len(p) > 1 for p in tok.vocab)
+        return tok
+
+    @classmethod
+    def _from_binary(cls, raw):
+        magic, version, vocab_size, n_pieces, n_merges = _HEADER.unpack_from(raw, 0)
+        if version != BINARY_VERSION:
+            raise ValueError(f"Unbekannte Tokenizer-Version {version} (erwartet {BINARY_VERSION}).")
+
+        offset = _HEADER.size
+        vocab, offset = _unpack_strings(raw, offset, n_pieces)
+        merge_keys, offset = _unpack_strings(raw, offset, n_merges)
+
+        tok = cls(vocab_size=vocab_size)
+        tok.vocab = vocab
+        tok.merges = {pair: rank for rank, pair in enumerate(merge_keys)}
+        tok._build_lookup()
         return tok
+
+
+class IncrementalDetokenizer:
+    """
+    Decodiert Token für Token und liefert jeweils nur den NEUEN Text.
+
+    Arbeitet auf den Bytes der Pieces mit einem inkrementellen UTF-8-Decoder:
+    Ein Zeichen, dessen Bytes auf mehrere Tokens verteilt sind, wird erst
+    ausgegeben, wenn es vollständig ist. Kosten pro Token: O(1) statt eines
+    kompletten decode() der ganzen Sequenz.
+    """
+
+    def __init__(self, tokenizer):
+        self._pieces = tokenizer.piece_bytes()
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._parts = []
+
+    def push(self, token_id):
+        """Ein Token anhängen, gibt den neu entstandenen Text zurück (evtl. "")."""
+        if 0 <= token_id < len(self._pieces):
+            delta = self._decoder.decode(self._pieces[token_id])
+        else:
+            delta = ""
+        if delta:
+            self._parts.append(delta)
+        return delta
+
+    def push_many(self, token_ids):
+        return "".join(self.push(i) for i in token_ids)
+
+    def flush(self):
+        """Rest ausgeben (unvollständige Bytes werden zu U+FFFD)."""
+        delta = self._decoder.decode(b"", final=True)
+        if delta:
+            self._parts.append(delta)
+        return delta
+
+    @property
+    def text(self):
+        """Bisher ausgegebener Gesamttext."""
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+
+def convert(src, dst):
+    """
+    Tokenizer in ein anderes Format umwandeln und prüfen, dass beide
+    Dateien exakt dasselbe Verhalten haben (Round-Trip).
+    """
+    t0 = time.perf_counter()
+    original = BPETokenizer.load(src)
+    t_src = time.perf_counter() - t0
+
+    original.save(dst)
+
+    t0 = time.perf_counter()
+    loaded = BPETokenizer.load(dst)
+    t_dst = time.perf_counter() - t0
+
+    sample = "".join(original.vocab) + " Grundwissen: Äpfel, Öl & Übung – 2025!"
+    ids = original.encode(sample)
+    checks = [
+        ("Vokabular", loaded.vocab == original.vocab),
+        ("stoi", loaded.stoi == original.stoi),
+        ("itos", loaded.itos == original.itos),
+        ("vocab_size", loaded.vocab_size == original.vocab_size),
+        # Ränge werden beim Binärformat auf 0..n-1 normalisiert -> Reihenfolge vergleichen
+        ("merges", sorted(loaded.merges, key=loaded.merges.get)
+            == sorted(original.merges, key=original.merges.get)),
+        ("encode", loaded.encode(sample) == ids),
+        ("decode", loaded.decode(ids) == original.decode(ids)),
+    ]
+    # kein assert: mit python -O würde die Prüfung still entfallen
+    for name, ok in checks:
+        if not ok:
+            raise ValueError(f"{src} -> {dst}: {name} weicht nach dem Umwandeln ab")
+
+    print(f"✅ {src} -> {dst} | Laden: {t_src * 1000:.2f} ms -> {t_dst * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    # python tokenizer.py tokenizer.json tokenizer.bin
+    if len(sys.argv) != 3:
+        print("Benutzung: python tokenizer.py <quelle> <ziel(.bin|.json)>")
+        sys.exit(1)
+    convert(sys.argv[1], sys.argv[2])
@@ -1,15 +1,106 @@
 # train.py
+import argparse
+import json
 import os
+import random
+import sys
 import time
+
+try:
+    import resource
+except ImportError:  # Windows: kein Peak-RSS
+    resource = None
+
 import torch
 from torch.utils.data import DataLoader
 from tokenizer import BPETokenizer
-from data import TextDataset
+from data import TextDataset, PackedDataset, ResumableSampler, ShardedTokens, document_starts
 from model import MiniGPT
+from evaluate import evaluate_perplexity
+from checkpoint import CheckpointWriter, capture_rng_state, restore_rng_state
+from worker_pool import apply_thread_settings
+from output_head import token_counts
 
 # ---------------------------
 # EINSTELLUNGEN (Speed!)
 # ---------------------------
+# Alle Werte lassen sich per Config-Datei (TOML/YAML/JSON) und/oder
+# Kommandozeile überschreiben:  python train.py --config lauf.toml --epochs 5
+DEFAULT_CONFIG = {
+    # Daten
+    "text_file": "grundwissen.txt",    # oder manifest.json aus ingest.py
+    "tokenizer_file": "tokenizer.json",
+
+    # Ausgabe (relativ zu out_dir)
+    "out_dir": ".",
+    "checkpoint_file": "checkpoint.pt",
+    "model_file": "minigpt_grundwissen.pt",
+    "checkpoint_dir": "checkpoints",   # rotierende Checkpoints + best.pt
+    "keep_last_checkpoints": 3,
+    "save_every_steps": 0,             # 0 = nach jeder Mini-Epoche speichern
+    "metrics_file": "",                # JSON mit Durchsatz + Loss (leer = aus)
+
+    # Training
+    "epochs": 40,
+    "batches_per_epoch": 250,
+    "batch_size": 32,
+    "grad_accum": 1,                   # Batches pro Optimizer-Schritt
+    "block_size": 64,
+    "length_curriculum": "",           # z.B. "32,64,128,256": Blocklänge steigt stufenweise (leer = aus)
+    "pack_documents": 0,               # 1 = Absätze packen + Block-Diagonal-Maske
+    "lr": 3e-4,
+    "warmup_steps": 0,                 # lineares LR-Warmup (0 = aus)
+    "seed": 1234,
+
+    # Modell-Architektur
+    "embed_dim": 128,
+    "heads": 4,
+    "layers": 4,
+    "ff_dim": 512,
+    "causal": 1,                       # 1 = kausale Maske (ehrliche Perplexity, KV-Cache); 0 = altes Modell
+    "adaptive_cutoffs": "",            # z.B. "16,40": Adaptive-Softmax-Kopf (leer = normaler fc)
+    "adaptive_div": 4.0,               # Cluster werden pro Stufe um diesen Faktor schmaler
+
+    # Speicher sparen bei langen Blöcken (block_size 512-1024)
+    "checkpoint_layers": 0,            # so viele Layer im Backward neu berechnen (0 = aus)
+    "loss_chunk_tokens": 0,            # Loss in Stücken über die Logits (0 = alles auf einmal)
+
+    # Hardware
+    "device": "auto",                  # auto / cpu / cuda
+    "threads": 0,                      # 0 = PyTorch-Standard
+    "interop_threads": 0,              # Inter-Op-Threads (0 = PyTorch-Standard)
+    "precision": "fp32",               # fp32 / bf16 / fp16
+
+    # Evaluation
+    "val_fraction": 0.05,              # letzter Teil des Textes = Held-out (0 = aus)
+    "eval_interval": 200,              # alle N Schritte Perplexity messen (0 = aus)
+    "eval_stride": 0,                  # 0 = Fenster ohne Überlappung
+    "eval_batch_size": 0,              # 0 = wie batch_size
+}
+
+PRECISIONS = {"fp32": None, "bf16": torch.bfloat16, "fp16": torch.float16}
+
+
+def peak_rss_mb():
+    """Höchster Speicherverbrauch (RSS) dieses Prozesses in MB, None unter Windows."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux: Kilobyte, macOS: Byte
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def parse_int_list(value):
+    """'32,64,128' oder [32, 64, 128] -> [32, 64, 128] (leer = [])."""
+    if isinstance(value, str):
+        return [int(v) for v in value.split(",") if v.strip()]
+    return [int(v) for v in value or []]
+
+
+def curriculum_length(stages, epoch, total_epochs):
+    """Blocklänge einer Epoche: die Stufen teilen die Epochen gleichmäßig auf."""
+    return stages[min(len(stages) - 1, epoch * len(stages) // max(1, total_epochs))]
+
 
 def ask_int(prompt, default):
     """Hilfsfunktion: fragt Zahl ab, nutzt default bei leer/Fehler."""
@@ -23,159 +114,511 @@ def ask_int(prompt, default):
         print(f"Ungültige Eingabe, nehme default={default}.")
         return default
 
-TOTAL_EPOCHS = ask_int("Gib die Gesamtanzahl der Epochen an", 40)
-BATCH_SIZE = 32
-DEFAULT_BLOCK_SIZE = 64
-LR = 3e-4
-
-MAX_BATCHES_PER_EPOCH = ask_int("Gib die Batches pro Epoche an", 250)
-
-CHECKPOINT_FILE = "checkpoint.pt"
-MODEL_FILE = "minigpt_grundwissen.pt"
-TOKENIZER_FILE = "tokenizer.json"
 
 # ---------------------------
-# DEVICE
+# CONFIG LADEN
 # ---------------------------
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print("Verwendetes Device:", device, flush=True)
-
-# ---------------------------
-# TEXT LADEN
-# ---------------------------
-with open("grundwissen.txt", "r", encoding="utf8") as f:
-    text = f.read()
+def load_config_file(path):
+    """Liest eine Config-Datei (.toml, .yaml/.yml oder .json) als Dict."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".toml":
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            import tomli as tomllib
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    if ext in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError as e:
+            raise ImportError("Für YAML-Configs bitte 'pip install pyyaml' ausführen.") from e
+        with open(path, "r", encoding="utf8") as f:
+            return yaml.safe_load(f) or {}
+    with open(path, "r", encoding="utf8") as f:
+        return json.load(f)
+
+
+def coerce_value(key, value):
+    """
+    Bringt einen Wert auf den Typ des Standardwerts ("0.05" -> 0.05,
+    "3" -> 3, [16, 40] -> "16,40"). YAML/TOML liefern sonst z.B. Strings,
+    die erst tief im Training auffallen würden.
+    """
+    kind = type(DEFAULT_CONFIG[key])
+    try:
+        if kind is str:
+            if isinstance(value, str):
+                return value
+            if isinstance(value, (list, tuple)):  # z.B. adaptive_cutoffs = [16, 40]
+                return ",".join(str(int(v)) for v in value)
+            if isinstance(value, int) and not isinstance(value, bool):
+                return str(value)
+        elif kind is int:
+            if isinstance(value, str):
+                return int(value.strip())
+            if isinstance(value, float) and value.is_integer():
+                return int(value)
+            if isinstance(value, int):  # auch true/false -> 1/0
+                return int(value)
+        elif kind is float:
+            if isinstance(value, str):
+                return float(value.strip())
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return float(value)
+    except ValueError:
+        pass
+    raise ValueError(f"Einstellung {key}: {value!r} ist kein gültiger Wert "
+                     f"(erwartet {kind.__name__}).")
+
+
+def merge_config(overrides):
+    """DEFAULT_CONFIG + Overrides, unbekannte Schlüssel sind ein Fehler."""
+    cfg = dict(DEFAULT_CONFIG)
+    unknown = set(overrides) - set(cfg)
+    if unknown:
+        raise ValueError(f"Unbekannte Einstellungen: {', '.join(sorted(unknown))}")
+    cfg.update({key: coerce_value(key, value) for key, value in overrides.items()})
+    if cfg["precision"] not in PRECISIONS:
+        raise ValueError(f"precision muss eins von {list(PRECISIONS)} sein.")
+    return cfg
+
+
+def parse_args(argv=None):
+    """Kommandozeile: --config <datei> + je Einstellung ein --flag."""
+    parser = argparse.ArgumentParser(description="MiniGPT trainieren")
+    parser.add_argument("--config", help="Config-Datei (.toml / .yaml / .json)")
+    for key, default in DEFAULT_CONFIG.items():
+        parser.add_argument(
+            "--" + key.replace("_", "-"),
+            dest=key,
+            type=type(default),
+            default=argparse.SUPPRESS,
+            help=f"(default: {default})",
+        )
+    args = vars(parser.parse_args(argv))
 
-print("Textlänge in Zeichen:", len(text), flush=True)
+    overrides = {}
+    config_path = args.pop("config", None)
+    if config_path:
+        overrides.update(load_config_file(config_path))
+    overrides.update(args)  # Kommandozeile schlägt Config-Datei
+    return merge_config(overrides)
 
-# ---------------------------
-# ✅ TOKENIZER NUR EINMAL TRAINIEREN
-# ---------------------------
-if os.path.exists(TOKENIZER_FILE):
-    tok = BPETokenizer.load(TOKENIZER_FILE)
-    print("Tokenizer geladen.", flush=True)
-else:
-    tok = BPETokenizer(vocab_size=4096)
-    tok.train(text)
-    tok.save(TOKENIZER_FILE)
-    print("Tokenizer neu trainiert und gespeichert.", flush=True)
-
-encoded = tok.encode(text)
-print("Anzahl Tokens:", len(encoded), flush=True)
 
 # ---------------------------
-# DATASET
+# TRAINING
 # ---------------------------
-block_size = DEFAULT_BLOCK_SIZE
-dataset = TextDataset(encoded, block_size=block_size)
-
-if len(dataset) <= 0:
-    print("WARNUNG: Dataset zu klein – block_size wird reduziert.", flush=True)
-    block_size = max(8, len(encoded) // 4)
+def train(cfg):
+    """Trainiert nach `cfg` und gibt Kennzahlen (Durchsatz, Loss) zurück."""
+    def out(name):
+        return os.path.join(cfg["out_dir"], name)
+
+    os.makedirs(cfg["out_dir"], exist_ok=True)
+    checkpoint_file = out(cfg["checkpoint_file"])
+    model_file = out(cfg["model_file"])
+
+    total_epochs = cfg["epochs"]
+    max_batches = cfg["batches_per_epoch"]
+    batch_size = cfg["batch_size"]
+    grad_accum = max(1, cfg["grad_accum"])
+
+    # ---------------------------
+    # DEVICE + THREADS
+    # ---------------------------
+    if cfg["device"] == "auto":
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    else:
+        device = torch.device(cfg["device"])
+    print("Verwendetes Device:", device, flush=True)
+
+    threads, interop = apply_thread_settings(cfg["threads"], cfg["interop_threads"])
+    print("Threads:", threads, "| Inter-Op:", interop, "| Präzision:", cfg["precision"], flush=True)
+
+    if cfg["text_file"].endswith(".json"):
+        # ---------------------------
+        # VORBEREITETE TOKEN-SHARDS (ingest.py)
+        # ---------------------------
+        encoded = ShardedTokens(cfg["text_file"])
+        tok = BPETokenizer.load(cfg["tokenizer_file"])
+        if len(tok.vocab) != encoded.manifest["vocab_size"]:
+            raise ValueError(
+                f"Tokenizer {cfg['tokenizer_file']} passt nicht zu den Shards "
+                f"(erwartet: {encoded.manifest['tokenizer']})."
+            )
+        print("Token-Shards geladen:", len(encoded.manifest["shards"]), flush=True)
+    else:
+        # ---------------------------
+        # TEXT LADEN
+        # ---------------------------
+        with open(cfg["text_file"], "r", encoding="utf8") as f:
+            text = f.read()
+
+        print("Textlänge in Zeichen:", len(text), flush=True)
+
+        # ---------------------------
+        # ✅ TOKENIZER NUR EINMAL TRAINIEREN
+        # ---------------------------
+        if os.path.exists(cfg["tokenizer_file"]):
+            tok = BPETokenizer.load(cfg["tokenizer_file"])
+            print("Tokenizer geladen.", flush=True)
+        else:
+            tok = BPETokenizer(vocab_size=4096)
+            tok.train(text)
+            tok.save(cfg["tokenizer_file"])
+            print("Tokenizer neu trainiert und gespeichert.", flush=True)
+
+        encoded = tok.encode(text)
+    print("Anzahl Tokens:", len(encoded), flush=True)
+
+    # Held-out-Teil abtrennen (wird nie trainiert)
+    val_encoded = []
+    if cfg["val_fraction"] > 0:
+        n_val = int(len(encoded) * cfg["val_fraction"])
+        if n_val > cfg["block_size"] + 1:
+            if isinstance(encoded, ShardedTokens):
+                val_encoded = encoded[len(encoded) - n_val:]
+                encoded = encoded.subrange(0, len(encoded) - n_val)
+            else:
+                val_encoded = encoded[-n_val:]
+                encoded = encoded[:-n_val]
+    print("Held-out-Tokens:", len(val_encoded), flush=True)
+
+    # ---------------------------
+    # DATASET
+    # ---------------------------
+    block_size = cfg["block_size"]
     dataset = TextDataset(encoded, block_size=block_size)
 
-print("Dataset-Länge:", len(dataset), flush=True)
-
-loader = DataLoader(
-    dataset,
-    batch_size=BATCH_SIZE,
-    shuffle=True,
-    num_workers=0  # Windows-safe
-)
-
-# ---------------------------
-# MODELL + OPTIMIZER
-# ---------------------------
-model = MiniGPT(vocab_size=len(tok.vocab), max_len=block_size)
-model.to(device)
-opt = torch.optim.AdamW(model.parameters(), lr=LR)
-
-# ---------------------------
-# CHECKPOINT LADEN (RESUME)
-# ---------------------------
-start_epoch = 0
-if os.path.exists(CHECKPOINT_FILE):
-    ckpt = torch.load(CHECKPOINT_FILE, map_location=device)
-    model.load_state_dict(ckpt["model"])
-    opt.load_state_dict(ckpt["opt"])
-    start_epoch = ckpt["epoch"] + 1
-    print(f"Checkpoint geladen – Weitertraining ab Epoche {start_epoch}", flush=True)
-else:
-    print("Kein Checkpoint gefunden – starte neues Training.", flush=True)
-
-# ---------------------------
-# TRAINING (MINI-EPOCHEN)
-# ---------------------------
-model.train()
-print("Training startet jetzt (Mini-Epochen)...", flush=True)
-
-global_start = time.time()
-
-for epoch in range(start_epoch, TOTAL_EPOCHS):
-    epoch_start = time.time()
-    total_loss = 0.0
-    last_print = time.time()
-
-    for i, (x, y) in enumerate(loader):
-        if i >= MAX_BATCHES_PER_EPOCH:
-            break
-
-        x = x.to(device)
-        y = y.to(device)
+    if len(dataset) <= 0:
+        print("WARNUNG: Dataset zu klein – block_size wird reduziert.", flush=True)
+        block_size = max(8, len(encoded) // 4)
+        dataset = TextDataset(encoded, block_size=block_size)
+
+    print("Dataset-Länge:", len(dataset), flush=True)
+
+    # Sequenzlängen-Curriculum: erst kurze Blöcke (billige Attention), dann
+    # länger. Tokens pro Schritt bleiben gleich (batch_size * block_size).
+    stages = parse_int_list(cfg["length_curriculum"]) or [block_size]
+    if max(stages) > block_size:
+        raise ValueError(f"length_curriculum darf block_size ({block_size}) nicht überschreiten.")
+    tokens_per_batch = batch_size * block_size
+    if len(stages) > 1:
+        print("Längen-Curriculum:", " -> ".join(map(str, stages)), flush=True)
+
+    doc_starts = None
+    if cfg["pack_documents"]:
+        doc_starts = document_starts(encoded, tok.encode("\n\n"))
+        print("Dokumente (Absätze):", len(doc_starts), flush=True)
+
+    # Eigener Sampler: Reihenfolge hängt nur von (seed, Epoche) ab,
+    # damit ein Abbruch mitten in der Epoche exakt fortgesetzt werden kann.
+    sampler = ResumableSampler(len(dataset), seed=cfg["seed"])
+
+    def make_loader(seq_len):
+        """Dataset + Loader für eine Blocklänge (Batchgröße passend skaliert)."""
+        if doc_starts is not None:
+            ds = PackedDataset(encoded, doc_starts, block_size=seq_len)
+        else:
+            ds = TextDataset(encoded, block_size=seq_len)
+        sampler.data_len = len(ds)
+        bs = max(1, tokens_per_batch // seq_len)
+        return bs, DataLoader(
+            ds,
+            batch_size=bs,
+            sampler=sampler,
+            num_workers=0,  # Windows-safe
+            # eigener Generator -> der Loader zieht nichts aus dem globalen RNG
+            generator=torch.Generator(),
+        )
 
-        logits = model(x)
-        loss = torch.nn.functional.cross_entropy(
-            logits.view(-1, logits.size(-1)),
-            y.view(-1)
+    # ---------------------------
+    # MODELL + OPTIMIZER
+    # ---------------------------
+    random.seed(cfg["seed"])
+    torch.manual_seed(cfg["seed"])
+
+    model_config = {
+        "vocab_size": len(tok.vocab),
+        "max_len": block_size,
+        "embed_dim": cfg["embed_dim"],
+        "heads": cfg["heads"],
+        "layers": cfg["layers"],
+        "ff_dim": cfg["ff_dim"],
+    }
+    cutoffs = parse_int_list(cfg["adaptive_cutoffs"])
+    if cutoffs:
+        model_config["adaptive_cutoffs"] = cutoffs
+        model_config["adaptive_div"] = cfg["adaptive_div"]
+    # Fortsetzen: die Maske muss zum Checkpoint passen (alte Läufe sind nicht causal)
+    ckpt = None
+    if os.path.exists(checkpoint_file):
+        ckpt = torch.load(checkpoint_file, map_location=device)
+    causal = bool(cfg["causal"])
+    if ckpt is not None and causal != ("causal_marker" in ckpt["model"]):
+        causal = not causal
+        print(f"Hinweis: Checkpoint ist {'' if causal else 'nicht '}causal -> "
+              f"causal = {int(causal)} wird übernommen.", flush=True)
+    if causal:
+        model_config["causal"] = True
+    model = MiniGPT(**model_config, checkpoint_layers=cfg["checkpoint_layers"])
+    if cutoffs:
+        # Adaptive Softmax braucht die Ids nach Häufigkeit sortiert
+        model.set_vocab_order(token_counts(encoded, len(tok.vocab)))
+    model.to(device)
+    opt = torch.optim.AdamW(model.parameters(), lr=cfg["lr"])
+
+    scheduler = None
+    if cfg["warmup_steps"] > 0:
+        warmup = cfg["warmup_steps"]
+        scheduler = torch.optim.lr_scheduler.LambdaLR(
+            opt, lambda step: min(1.0, (step + 1) / warmup)
         )
 
-        opt.zero_grad()
-        loss.backward()
-        opt.step()
-
-        total_loss += loss.item()
-
-        # jede Sekunde Status
-        now = time.time()
-        if now - last_print >= 1.0:
-            batches_done = i + 1
-            avg_loss_so_far = total_loss / batches_done
-
-            elapsed_epoch = now - epoch_start
-            speed = batches_done / max(elapsed_epoch, 1e-6)
-            remaining = MAX_BATCHES_PER_EPOCH - batches_done
-            eta_sec = remaining / max(speed, 1e-6)
-
-            print(
-                f"Epoch {epoch}/{TOTAL_EPOCHS-1} | "
-                f"Batch {batches_done}/{MAX_BATCHES_PER_EPOCH} | "
-                f"loss={loss.item():.4f} | avg_loss={avg_loss_so_far:.4f} | "
-                f"ETA ~{eta_sec:.0f}s",
-                flush=True
-            )
-            last_print = now
+    amp_dtype = PRECISIONS[cfg["precision"]]
+    scaler = torch.amp.GradScaler(device.type, enabled=cfg["precision"] == "fp16")
+
+    # ---------------------------
+    # CHECKPOINT LADEN (RESUME)
+    # ---------------------------
+    start_epoch = 0
+    start_batch = 0      # bereits trainierte Batches der offenen Epoche
+    global_step = 0
+    last_val_loss = None
+    val_loss_step = None  # Schritt, an dem last_val_loss gemessen wurde
+    if ckpt is not None:
+        model.load_state_dict(ckpt["model"])
+        opt.load_state_dict(ckpt["opt"])
+        start_epoch = ckpt["epoch"] + 1
+        start_batch = ckpt.get("batch_in_epoch", 0)
+        global_step = ckpt.get("step", 0)
+        last_val_loss = ckpt.get("val_loss")
+        val_loss_step = ckpt.get("val_loss_step")
+        if scheduler is not None and ckpt.get("sched") is not None:
+            scheduler.load_state_dict(ckpt["sched"])
+        if ckpt.get("scaler") is not None:
+            scaler.load_state_dict(ckpt["scaler"])
+        if ckpt.get("sampler") is not None:
+            sampler.load_state_dict(ckpt["sampler"])
+        # zuletzt: Zufallszustand exakt wie beim Speichern
+        if ckpt.get("rng") is not None:
+            restore_rng_state(ckpt["rng"])
+        print(
+            f"Checkpoint geladen – Weitertraining ab Epoche {start_epoch}, "
+            f"Batch {start_batch} (Schritt {global_step})",
+            flush=True,
+        )
+    else:
+        print("Kein Checkpoint gefunden – starte neues Training.", flush=True)
+
+    # ---------------------------
+    # TRAINING (MINI-EPOCHEN)
+    # ---------------------------
+    model.train()
+    print("Training startet jetzt (Mini-Epochen)...", flush=True)
+
+    global_start = time.time()
+    eval_seconds = 0.0
+    tokens_trained = 0
+    avg_loss = None
+    val_ppl = None
+
+    ckpt_writer = CheckpointWriter(
+        out(cfg["checkpoint_dir"]),
+        keep_last=cfg["keep_last_checkpoints"],
+        latest_file=checkpoint_file,
+        model_file=model_file,
+    )
 
-    avg_loss = total_loss / max(1, (i + 1))
-    epoch_time = time.time() - epoch_start
+    def run_eval():
+        """Perplexity auf dem Held-out-Teil (ein Batch gleichzeitig im Speicher)."""
+        result = evaluate_perplexity(
+            model, val_encoded, block_size,
+            stride=cfg["eval_stride"] or None,
+            batch_size=cfg["eval_batch_size"] or batch_size,
+            device=device,
+        )
+        print(
+            f"📊 Eval @ Schritt {global_step} | val_loss={result['loss']:.4f} | "
+            f"val_ppl={result['ppl']:.3f} | {result['tokens_per_sec']:.0f} Tokens/s",
+            flush=True,
+        )
+        return result
+
+    def save_checkpoint(completed_epoch, batch_in_epoch=0):
+        """
+        Checkpoint an den Hintergrund-Writer übergeben (blockiert kaum).
+        Enthält alles, um exakt an diesem Schritt weiterzumachen.
+        """
+        return ckpt_writer.save(
+            global_step,
+            {
+                "model": model.state_dict(),
+                "opt": opt.state_dict(),
+                "sched": scheduler.state_dict() if scheduler is not None else None,
+                "scaler": scaler.state_dict() if scaler.is_enabled() else None,
+                "epoch": completed_epoch,
+                "batch_in_epoch": batch_in_epoch,
+                "step": global_step,
+                "sampler": sampler.state_dict(),
+                "rng": capture_rng_state(),
+                "val_loss": last_val_loss,
+                "val_loss_step": val_loss_step,
+                "block_size": block_size,
+                "vocab_size": len(tok.vocab),
+                "model_config": model_config,
+            },
+            # für best.pt nur ein Loss, der mit genau diesen Gewichten gemessen wurde
+            metric=last_val_loss if val_loss_step == global_step else None,
+        )
 
-    print(
-        f"✅ Epoch {epoch} fertig (Mini) | avg_loss={avg_loss:.4f} | "
-        f"Zeit: {epoch_time:.1f}s",
-        flush=True
-    )
+    def optimizer_step():
+        scaler.step(opt)
+        scaler.update()
+        opt.zero_grad(set_to_none=True)
+        if scheduler is not None:
+            scheduler.step()
+
+    seq_len = None
+    for epoch in range(start_epoch, total_epochs):
+        epoch_start = time.time()
+        total_loss = 0.0
+        n_batches = 0
+        last_print = time.time()
+        pending_grads = False
+
+        if curriculum_length(stages, epoch, total_epochs) != seq_len:
+            seq_len = curriculum_length(stages, epoch, total_epochs)
+            epoch_batch_size, loader = make_loader(seq_len)
+            if len(stages) > 1:
+                print(f"Blocklänge {seq_len} | Batch {epoch_batch_size}", flush=True)
+
+        # beim Fortsetzen die schon trainierten Batches überspringen
+        sampler.set_epoch(epoch, start_index=start_batch * epoch_batch_size)
+
+        for i, batch in enumerate(loader, start=start_batch):
+            if i >= max_batches:
+                break
+
+            x = batch[0].to(device)
+            y = batch[1].to(device)
+            segment_ids = batch[2].to(device) if len(batch) > 2 else None
+
+            with torch.autocast(device.type, dtype=amp_dtype, enabled=amp_dtype is not None):
+                loss = model.loss(x, y, chunk_tokens=cfg["loss_chunk_tokens"],
+                                  segment_ids=segment_ids)
+
+            scaler.scale(loss / grad_accum).backward()
+            pending_grads = True
+
+            total_loss += loss.item()
+            n_batches += 1
+            tokens_trained += y.numel()
+
+            # erst nach grad_accum Batches ein Optimizer-Schritt
+            if (i + 1) % grad_accum != 0:
+                continue
+            optimizer_step()
+            pending_grads = False
+            global_step += 1
+
+            if cfg["eval_interval"] > 0 and len(val_encoded) and global_step % cfg["eval_interval"] == 0:
+                t_eval = time.time()
+                result = run_eval()
+                eval_seconds += time.time() - t_eval
+                last_val_loss, val_ppl = result["loss"], result["ppl"]
+                val_loss_step = global_step
+
+            # Checkpoint alle K Schritte (mitten in der Epoche -> Epoche gilt
+            # beim Fortsetzen noch als offen)
+            if cfg["save_every_steps"] > 0 and global_step % cfg["save_every_steps"] == 0:
+                save_checkpoint(epoch - 1, batch_in_epoch=i + 1)
+
+            # jede Sekunde Status
+            now = time.time()
+            if now - last_print >= 1.0:
+                batches_done = i + 1
+                avg_loss_so_far = total_loss / n_batches
+
+                elapsed_epoch = now - epoch_start
+                speed = n_batches / max(elapsed_epoch, 1e-6)
+                remaining = max_batches - batches_done
+                eta_sec = remaining / max(speed, 1e-6)
+
+                print(
+                    f"Epoch {epoch}/{total_epochs-1} | "
+                    f"Batch {batches_done}/{max_batches} | "
+                    f"loss={loss.item():.4f} | avg_loss={avg_loss_so_far:.4f} | "
+                    f"ETA ~{eta_sec:.0f}s",
+                    flush=True
+                )
+                last_print = now
+
+        # angefangene Gradienten-Akkumulation am Epochenende abschließen
+        if pending_grads:
+            optimizer_step()
+            global_step += 1
+
+        avg_loss = total_loss / max(1, n_batches)
+        start_batch = 0
+        epoch_time = time.time() - epoch_start
+
+        print(
+            f"✅ Epoch {epoch} fertig (Mini) | avg_loss={avg_loss:.4f} | "
+            f"Zeit: {epoch_time:.1f}s | ckpt_stall={ckpt_writer.stall_seconds:.3f}s",
+            flush=True
+        )
 
-    # Autosave nach jeder Mini-Epoche
-    torch.save({
-        "model": model.state_dict(),
-        "opt": opt.state_dict(),
-        "epoch": epoch,
-        "block_size": block_size,
-        "vocab_size": len(tok.vocab)
-    }, CHECKPOINT_FILE)
-
-    torch.save(model.state_dict(), MODEL_FILE)
-    print("💾 Checkpoint gespeichert.\n", flush=True)
-
-total_time = time.time() - global_start
-print(f"🏁 Training komplett! Gesamtzeit: {total_time/60:.1f} min", flush=True)
-print("Modell gespeichert als", MODEL_FILE, flush=True)
+        # Autosave nach jeder Mini-Epoche (im Hintergrund); die letzte
+        # Epoche speichert der Abschluss unten
+        if cfg["save_every_steps"] <= 0 and epoch < total_epochs - 1:
+            stall = save_checkpoint(epoch)
+            print(f"💾 Checkpoint übergeben (Stall {stall * 1000:.1f} ms).\n", flush=True)
+
+    # Endstand immer sichern – auch den Rest nach dem letzten save_every_steps
+    save_checkpoint(total_epochs - 1)
+    ckpt_writer.close()
+    total_time = time.time() - global_start
+    peak_rss = peak_rss_mb()
+    print(f"🏁 Training komplett! Gesamtzeit: {total_time/60:.1f} min", flush=True)
+    if peak_rss is not None:
+        print(f"Peak-RSS: {peak_rss:.0f} MB", flush=True)
+    print("Modell gespeichert als", model_file, flush=True)
+
+    # Abschluss-Evaluation für die Kennzahlen
+    if len(val_encoded):
+        result = run_eval()
+        last_val_loss, val_ppl = result["loss"], result["ppl"]
+
+    train_seconds = max(total_time - eval_seconds, 1e-9)
+    metrics = {
+        "steps": global_step,
+        "tokens": tokens_trained,
+        "seconds": total_time,
+        "tokens_per_sec": tokens_trained / train_seconds,
+        "train_loss": avg_loss,
+        "val_loss": last_val_loss,
+        "val_ppl": val_ppl,
+        "ckpt_stall": ckpt_writer.stall_seconds,
+        "peak_rss_mb": peak_rss,
+    }
+    if cfg["metrics_file"]:
+        with open(out(cfg["metrics_file"]), "w", encoding="utf8") as f:
+            json.dump({"config": cfg, **metrics}, f, ensure_ascii=False, indent=2)
+    return metrics
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    cfg = parse_args(argv)
+
+    # Ohne Argumente im Terminal: wie früher nachfragen
+    if not argv and sys.stdin.isatty():
+        cfg["epochs"] = ask_int("Gib die Gesamtanzahl der Epochen an", cfg["epochs"])
+        cfg["batches_per_epoch"] = ask_int("Gib die Batches pro Epoche an", cfg["batches_per_epoch"])
+
+    train(cfg)
+
+
+if __name__ == "__main__":
+    main()
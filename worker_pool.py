@@ -0,0 +1,361 @@
+# worker_pool.py
+"""
+Inferenz-Pool für Mehrkern-Rechner.
+
+- N Worker-Prozesse, jeder auf eigene (disjunkte) Kerne gepinnt
+- Kerne werden pro NUMA-Knoten verteilt (ein Worker nie über zwei Knoten)
+- jeder Worker mit eigenem torch.set_num_threads()
+- Modellgewichte per mmap (shared_weights.py), alle Worker benutzen dieselben Seiten
+- Anfragen gehen an den Worker mit den wenigsten offenen Aufträgen
+- Auto-Tuner: misst beim Start den Durchsatz für verschiedene Threads pro Worker
+
+Für einzelne GUI-Instanzen reicht meist apply_thread_settings()
+(Umgebungsvariablen SLM_THREADS / SLM_INTEROP_THREADS), damit mehrere
+Instanzen sich nicht gegenseitig die Kerne wegnehmen.
+"""
+import argparse
+import glob
+import itertools
+import os
+import pickle
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+import torch.multiprocessing as mp
+
+from model import config_from_state_dict
+from shared_weights import load_model_shared, load_state_dict_shared
+
+# Methoden aus generation.py, die ein Worker ausführen darf
+METHODS = ("generate", "best_of_n", "beam_search")
+
+# so oft prüft der Pool, ob noch alle Worker leben (Sekunden)
+POLL_SECONDS = 0.5
+
+
+# ---------------------------
+# Thread-Einstellungen
+# ---------------------------
+def apply_thread_settings(threads=None, interop_threads=None):
+    """
+    Setzt Intra-/Inter-Op-Threads. None = aus SLM_THREADS bzw.
+    SLM_INTEROP_THREADS lesen; 0 oder nicht gesetzt = PyTorch-Standard.
+    """
+    if threads is None:
+        threads = int(os.environ.get("SLM_THREADS", "0") or 0)
+    if interop_threads is None:
+        interop_threads = int(os.environ.get("SLM_INTEROP_THREADS", "0") or 0)
+
+    if threads > 0:
+        torch.set_num_threads(threads)
+    if interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # geht nur, bevor PyTorch den Inter-Op-Pool gestartet hat
+            print("Warnung: Inter-Op-Threads konnten nicht mehr gesetzt werden.")
+    return torch.get_num_threads(), torch.get_num_interop_threads()
+
+
+# ---------------------------
+# CPU-Topologie
+# ---------------------------
+def available_cores():
+    """Liste der Kerne, die dieser Prozess benutzen darf."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cpulist(text):
+    """'0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11]"""
+    cores = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            lo, hi = part.split("-")
+            cores.extend(range(int(lo), int(hi) + 1))
+        else:
+            cores.append(int(part))
+    return cores
+
+
+def numa_nodes():
+    """Erlaubte Kerne gruppiert nach NUMA-Knoten (ohne NUMA-Info: ein Knoten)."""
+    allowed = set(available_cores())
+    paths = glob.glob("/sys/devices/system/node/node[0-9]*/cpulist")
+    paths.sort(key=lambda p: int(re.search(r"node(\d+)", p).group(1)))
+
+    nodes = []
+    for path in paths:
+        with open(path, "r") as f:
+            cores = [c for c in parse_cpulist(f.read()) if c in allowed]
+        if cores:
+            nodes.append(cores)
+    return nodes or [sorted(allowed)]
+
+
+def plan_workers(threads_per_worker, workers=None, nodes=None):
+    """
+    Teilt die Kerne in Gruppen zu je threads_per_worker auf, Knoten für
+    Knoten. Reste, die keine volle Gruppe ergeben, bleiben frei.
+    """
+    nodes = nodes or numa_nodes()
+    groups = []
+    for cores in nodes:
+        for i in range(0, len(cores) - threads_per_worker + 1, threads_per_worker):
+            groups.append(cores[i:i + threads_per_worker])
+    if not groups:
+        # weniger Kerne als gewünscht -> ein Worker auf allem, was da ist
+        groups = [[c for cores in nodes for c in cores]]
+    if workers:
+        groups = groups[:workers]
+    return groups
+
+
+# ---------------------------
+# Worker-Prozess
+# ---------------------------
+def _worker_main(worker_id, cores, model_file, heads, tokenizer_file,
+                 block_size, in_queue, out_queue):
+    import generation
+    from tokenizer import BPETokenizer
+
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    apply_thread_settings(threads=len(cores), interop_threads=1)
+    torch.seed()  # sonst ziehen alle Worker dieselben Zufallszahlen
+
+    # jeder Worker mappt dieselbe Datei -> keine eigene Kopie der Gewichte
+    model = load_model_shared(model_file, heads=heads)
+    tok = BPETokenizer.load(tokenizer_file)
+    out_queue.put(("ready", worker_id, None))
+
+    while True:
+        job = in_queue.get()
+        if job is None:
+            return
+        # Auftrag und Ergebnis selbst (un)picklen: Fehler dabei landen so beim
+        # richtigen Future statt im Feeder-Thread der Queue zu verschwinden
+        job_id, payload = job
+        try:
+            method, prompt, kwargs = pickle.loads(payload)
+            fn = getattr(generation, method)
+            result = fn(model, tok, prompt, block_size=block_size, device="cpu", **kwargs)
+            out_queue.put((job_id, True, pickle.dumps(result)))
+        except Exception as e:
+            out_queue.put((job_id, False, f"{type(e).__name__}: {e}"))
+
+
+# ---------------------------
+# Pool
+# ---------------------------
+class InferencePool:
+    """
+    pool = InferencePool("minigpt_grundwissen.pt", "tokenizer.json", threads_per_worker=2)
+    candidates = pool.run("Die Sonne ist", method="best_of_n", n=5)
+    pool.close()
+    """
+
+    def __init__(self, model_file="minigpt_grundwissen.pt", tokenizer_file="tokenizer.json",
+                 threads_per_worker=1, workers=None, heads=4):
+        self.model_config = config_from_state_dict(load_state_dict_shared(model_file), heads=heads)
+        self.block_size = self.model_config["max_len"]
+        self.groups = plan_workers(threads_per_worker, workers)
+
+        ctx = mp.get_context("spawn")
+        self._out_queue = ctx.Queue()
+        self._in_queues = []
+        self._procs = []
+        for worker_id, cores in enumerate(self.groups):
+            in_queue = ctx.Queue()
+            proc = ctx.Process(
+                target=_worker_main,
+                args=(worker_id, cores, model_file, heads, tokenizer_file,
+                      self.block_size, in_queue, self._out_queue),
+                daemon=True,
+            )
+            proc.start()
+            self._in_queues.append(in_queue)
+            self._procs.append(proc)
+
+        # warten, bis alle Worker ihr Modell eingehängt haben
+        ready = 0
+        while ready < len(self._procs):
+            try:
+                kind, _, _ = self._out_queue.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                dead = [i for i, proc in enumerate(self._procs) if not proc.is_alive()]
+                if dead:
+                    for proc in self._procs:
+                        proc.kill()
+                    raise RuntimeError(f"Worker {dead[0]} ist beim Start abgestürzt "
+                                       f"(Exitcode {self._procs[dead[0]].exitcode}).")
+                continue
+            assert kind == "ready"
+            ready += 1
+
+        self._lock = threading.Lock()
+        self._closing = False
+        self._futures = {}                       # job_id -> (Future, worker_id)
+        self._pending = [0] * len(self._procs)   # offene Aufträge pro Worker
+        self._alive = [True] * len(self._procs)
+        self._job_ids = itertools.count()
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    @property
+    def workers(self):
+        return len(self._procs)
+
+    def submit(self, prompt, method="best_of_n", **kwargs):
+        """Auftrag an den am wenigsten belasteten Worker, gibt ein Future zurück."""
+        if method not in METHODS:
+            raise ValueError(f"Unbekannte Methode '{method}' (erlaubt: {', '.join(METHODS)})")
+        payload = pickle.dumps((method, prompt, kwargs))  # Fehler hier gleich beim Aufrufer
+        future = Future()
+        with self._lock:
+            alive = [i for i in range(len(self._procs)) if self._alive[i]]
+            if not alive:
+                raise RuntimeError("Alle Worker sind beendet.")
+            worker_id = min(alive, key=self._pending.__getitem__)
+            job_id = next(self._job_ids)
+            self._pending[worker_id] += 1
+            self._futures[job_id] = (future, worker_id)
+        self._in_queues[worker_id].put((job_id, payload))
+        return future
+
+    def run(self, prompt, method="best_of_n", **kwargs):
+        """Wie submit(), wartet aber auf das Ergebnis."""
+        return self.submit(prompt, method, **kwargs).result()
+
+    def close(self):
+        self._closing = True
+        for q in self._in_queues:
+            q.put(None)
+        for proc in self._procs:
+            proc.join()
+        self._out_queue.put(None)
+        self._collector.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _collect(self):
+        while True:
+            try:
+                item = self._out_queue.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                self._fail_dead_workers()
+                continue
+            if item is None:
+                return
+            job_id, ok, result = item
+            with self._lock:
+                entry = self._futures.pop(job_id, None)
+                if entry is None:  # Worker wurde schon als tot gemeldet
+                    continue
+                future, worker_id = entry
+                self._pending[worker_id] -= 1
+            if not ok:
+                future.set_exception(RuntimeError(result))
+                continue
+            try:
+                future.set_result(pickle.loads(result))
+            except Exception as e:
+                future.set_exception(RuntimeError(f"{type(e).__name__}: {e}"))
+
+    def _fail_dead_workers(self):
+        """Offene Futures abgestürzter Worker mit einem Fehler beenden."""
+        if self._closing:
+            return
+        for worker_id, proc in enumerate(self._procs):
+            if not self._alive[worker_id] or proc.is_alive():
+                continue
+            with self._lock:
+                self._alive[worker_id] = False
+                lost = [job_id for job_id, (_, w) in self._futures.items() if w == worker_id]
+                futures = [self._futures.pop(job_id)[0] for job_id in lost]
+                self._pending[worker_id] = 0
+            error = RuntimeError(f"Worker {worker_id} ist abgestürzt (Exitcode {proc.exitcode}).")
+            for future in futures:
+                future.set_exception(error)
+
+
+# ---------------------------
+# Auto-Tuner
+# ---------------------------
+def measure_throughput(pool, prompt, requests, steps, n):
+    """Erzeugte Tokens pro Sekunde bei `requests` gleichzeitigen Anfragen."""
+    pool.run(prompt, method="generate", n=1, steps=2)  # Aufwärmen
+    t0 = time.time()
+    futures = [pool.submit(prompt, method="generate", n=n, steps=steps)
+               for _ in range(requests)]
+    for f in futures:
+        f.result()
+    return requests * n * steps / max(time.time() - t0, 1e-9)
+
+
+def autotune(model_file="minigpt_grundwissen.pt", tokenizer_file="tokenizer.json",
+             candidates=None, prompt="Die Sonne ist", steps=32, n=4, heads=4):
+    """
+    Probiert verschiedene Threads pro Worker (Kerne pro Knoten werden voll
+    genutzt) und gibt (beste Threadzahl, {threads: tokens/s}) zurück.
+    """
+    total = len(available_cores())
+    if candidates is None:
+        candidates = [t for t in (1, 2, 4, 8, 16, 32) if t <= total] or [1]
+
+    results = {}
+    for threads in candidates:
+        with InferencePool(model_file, tokenizer_file, threads_per_worker=threads,
+                           heads=heads) as pool:
+            tps = measure_throughput(pool, prompt, requests=2 * pool.workers,
+                                     steps=steps, n=n)
+        results[threads] = tps
+        print(f"  {threads} Threads/Worker x {pool.workers} Worker: {tps:.0f} Tokens/s",
+              flush=True)
+    best = max(results, key=results.get)
+    return best, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inferenz-Pool starten und Durchsatz messen")
+    parser.add_argument("--model", default="minigpt_grundwissen.pt")
+    parser.add_argument("--tokenizer", default="tokenizer.json")
+    parser.add_argument("--threads", default="auto",
+                        help="Threads pro Worker oder 'auto' (Auto-Tuner)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Standard: so viele, wie Kerne da sind")
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--steps", type=int, default=64)
+    parser.add_argument("--prompt", default="Die Sonne ist")
+    args = parser.parse_args()
+
+    nodes = numa_nodes()
+    print(f"NUMA-Knoten: {len(nodes)} | Kerne: {[len(c) for c in nodes]}", flush=True)
+
+    if args.threads == "auto":
+        print("Auto-Tuner:", flush=True)
+        threads, _ = autotune(args.model, args.tokenizer, prompt=args.prompt)
+        print(f"-> {threads} Threads pro Worker", flush=True)
+    else:
+        threads = int(args.threads)
+
+    with InferencePool(args.model, args.tokenizer, threads_per_worker=threads,
+                       workers=args.workers) as pool:
+        print(f"Pool: {pool.workers} Worker auf Kernen {pool.groups}", flush=True)
+        tps = measure_throughput(pool, args.prompt, args.requests, args.steps, n=1)
+        print(f"Durchsatz: {tps:.0f} Tokens/s bei {args.requests} Anfragen", flush=True)
+
+
+if __name__ == "__main__":
+    main()